@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Run the benchmark suite and write the results as JSON
+
+    python -m cronus.benchmarks --objects 10000 --output results.json
+    python -m cronus.benchmarks --baseline previous.json
+"""
+import argparse
+import json
+import logging
+import sys
+
+from cronus.benchmarks.suite import CASES, compare, run
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m cronus.benchmarks", description=__doc__
+    )
+    parser.add_argument("--objects", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--storetype", default="hfs")
+    parser.add_argument("--case", action="append", choices=list(CASES))
+    parser.add_argument("--output", help="JSON file, defaults to stdout")
+    parser.add_argument("--baseline", help="JSON results of a previous run")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run(args.objects, args.repeat, args.case, args.storetype)
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        for name, old, new, ratio in regressions:
+            print(f"{name}: {old:.6f}s -> {new:.6f}s ({ratio:.2f}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compression ratio and throughput of the store codecs per object type
+
+    python -m cronus.benchmarks.bench_codecs --repeat 5
+"""
+import argparse
+import time
+
+import numpy as np
+import pyarrow as pa
+
+from cronus.core.book import ArtemisBook, TDigestBook
+from cronus.core.codecs import CODECS, compress, decompress, recompress_ipc
+
+
+def make_objects(num_hists=200, num_rows=1000000):
+    """
+    Serialized objects representative of each object type
+    """
+    np.random.seed(0)
+    hbook = ArtemisBook()
+    tbook = TDigestBook()
+    for i in range(num_hists):
+        hbook.book("bench", f"h{i}", range(0, 100))
+        hbook.fill("bench", f"h{i}", np.random.normal(50, 10, 1000))
+    for i in range(num_hists // 10):
+        tbook.book("bench", f"t{i}")
+        tbook[f"bench.t{i}"].batch_update(np.random.normal(0, 1, 1000))
+    log = "".join(
+        f"2019-01-01 00:00:{i % 60:02d} INFO Processed batch {i} of job 0\n"
+        for i in range(20000)
+    )
+
+    data = [
+        pa.array(np.random.rand(num_rows)),
+        pa.array(np.random.randint(0, 10, num_rows)),
+        pa.array(np.repeat(np.arange(num_rows // 1000), 1000)),
+    ]
+    batch = pa.RecordBatch.from_arrays(data, ["random", "categories", "sorted"])
+    sink = pa.BufferOutputStream()
+    writer = pa.RecordBatchFileWriter(sink, batch.schema)
+    writer.write_batch(batch)
+    writer.close()
+
+    return {
+        "hists": hbook._to_message().SerializeToString(),
+        "tdigests": tbook._to_message().SerializeToString(),
+        "log": log.encode(),
+        "file": sink.getvalue(),
+    }
+
+
+def _read_ipc(buf):
+    reader = pa.ipc.open_file(buf)
+    for i in range(reader.num_record_batches):
+        reader.get_batch(i).validate(full=True)
+
+
+def _best(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(repeat=3, **kwargs):
+    """
+    Returns
+    -------
+    list of dict of type, codec, size, ratio, compress and decompress MB/s
+    """
+    results = []
+    for kind, buf in make_objects(**kwargs).items():
+        size = len(buf)
+        for codec in CODECS:
+            if kind == "file":
+                t_c, out = _best(lambda: recompress_ipc(buf, codec), repeat)
+                t_d, _ = _best(lambda: _read_ipc(out), repeat)
+            else:
+                t_c, out = _best(lambda: compress(buf, codec), repeat)
+                t_d, _ = _best(lambda: decompress(out, codec), repeat)
+            results.append(
+                {
+                    "type": kind,
+                    "codec": codec,
+                    "size": size,
+                    "ratio": size / len(out),
+                    "compress_mbps": size / t_c / 1e6,
+                    "decompress_mbps": size / t_d / 1e6,
+                }
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--hists", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    results = run(args.repeat, num_hists=args.hists, num_rows=args.rows)
+    print(
+        f"{'type':<10}{'codec':<6}{'size (KiB)':>12}{'ratio':>8}"
+        f"{'comp MB/s':>12}{'decomp MB/s':>13}"
+    )
+    for r in results:
+        print(
+            f"{r['type']:<10}{r['codec']:<6}{r['size'] / 1024:>12.1f}"
+            f"{r['ratio']:>8.2f}{r['compress_mbps']:>12.1f}"
+            f"{r['decompress_mbps']:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of the store listing, linear scan versus secondary indexes
+
+    python -m cronus.benchmarks.bench_list --objects 1000000
+"""
+import argparse
+import tempfile
+import time
+
+from cronus.core.cronus import MetaObject
+from cronus.benchmarks.generators import make_store
+
+
+def list_scan(store, prefix="", suffix=""):
+    """
+    Listing by linear scan over the store keys
+    """
+    objs = []
+    for id_ in store.keys():
+        if store[id_].name.startswith(prefix) and store[id_].name.endswith(suffix):
+            objs.append(
+                MetaObject(
+                    store[id_].name,
+                    store[id_].uuid,
+                    store[id_].parent_uuid,
+                    store[id_].address,
+                )
+            )
+    return objs
+
+
+def _timeit(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(result)
+
+
+def run(num_objects, repeat=3):
+    """
+    Time the listing queries with and without the secondary indexes
+
+    Returns
+    -------
+    dict of query name to (scan seconds, index seconds, number of results)
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as dirpath:
+        store = make_store(dirpath, num_objects)
+        dataset = store.list(suffix="dataset")[0].uuid
+        part_job = f"{dataset}.job_7.part_key3."
+        queries = {
+            "datasets": (
+                lambda: list_scan(store, suffix="dataset"),
+                lambda: store.list(suffix="dataset"),
+            ),
+            "dataset_files": (
+                lambda: list_scan(store, prefix=dataset),
+                lambda: store.list(prefix=dataset),
+            ),
+            "partition_job_prefix": (
+                lambda: list_scan(store, prefix=part_job),
+                lambda: store.list(prefix=part_job),
+            ),
+            "partition_job_children": (
+                lambda: list_scan(store, prefix=part_job),
+                lambda: store.list_children(dataset, partition_key="key3", job_id=7),
+            ),
+        }
+        for name, (scan, indexed) in queries.items():
+            t_scan, n_scan = _timeit(scan, repeat)
+            t_index, n_index = _timeit(indexed, repeat)
+            if n_scan != n_index:
+                raise RuntimeError(f"{name}: scan {n_scan} != index {n_index}")
+            results[name] = (t_scan, t_index, n_index)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--objects", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'query':<24}{'results':>10}{'scan (s)':>12}{'index (s)':>12}")
+    for name, (t_scan, t_index, n) in run(args.objects, args.repeat).items():
+        print(f"{name:<24}{n:>10}{t_scan:>12.4f}{t_index:>12.6f}")
+
+
+if __name__ == "__main__":
+    main()
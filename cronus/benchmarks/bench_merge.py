@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of the merge of job deltas, one at a time versus batched
+
+    python -m cronus.benchmarks.bench_merge --jobs 10000
+"""
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from artemis_format.pymodels.cronus_pb2 import DatasetObjectInfo
+from cronus.core.cronus import BaseObjectStore
+from cronus.core.merge import DatasetMerger
+from cronus.benchmarks.generators import make_dataset, make_deltas
+
+
+def make_store(root, num_partitions=10):
+    store = BaseObjectStore(root, "bench")
+    return store, make_dataset(store, num_partitions)
+
+
+def update_serial(store, dataset_id, bufs):
+    """
+    Merge by parsing and copying each delta, object per object
+    """
+    for buf in bufs:
+        _update = DatasetObjectInfo()
+        _update.ParseFromString(buf)
+        for field in ("jobs", "hists", "files"):
+            for obj in getattr(_update, field):
+                _new = getattr(store[dataset_id].dataset, field).add()
+                _new.CopyFrom(obj)
+                store[_new.uuid] = _new
+
+
+def update_merger(store, dataset_id, bufs, batch_size=None, submitters=8):
+    """
+    Merge deltas submitted concurrently through a DatasetMerger
+    """
+    with DatasetMerger(store, batch_size=batch_size) as merger:
+        with ThreadPoolExecutor(max_workers=submitters) as pool:
+            list(pool.map(lambda buf: merger.submit(dataset_id, buf), bufs))
+    return merger.stats
+
+
+def run(num_jobs, batch_size=None, submitters=8):
+    """
+    Time the merge of the job deltas
+
+    Returns
+    -------
+    dict of method name to (seconds, number of objects in the dataset)
+    """
+    methods = {
+        "serial": update_serial,
+        "merger": lambda s, d, b: update_merger(s, d, b, batch_size, submitters),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as dirpath:
+        for name, method in methods.items():
+            store, dataset_id = make_store(f"{dirpath}/{name}")
+            bufs = make_deltas(dataset_id, num_jobs)
+            start = time.perf_counter()
+            method(store, dataset_id, bufs)
+            elapsed = time.perf_counter() - start
+            dataset = store[dataset_id].dataset
+            num = len(dataset.jobs) + len(dataset.hists) + len(dataset.files)
+            results[name] = (elapsed, num)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--submitters", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'method':<12}{'objects':>10}{'time (s)':>12}")
+    for name, (elapsed, n) in run(args.jobs, args.batch_size, args.submitters).items():
+        print(f"{name:<12}{n:>10}{elapsed:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Memory profile of putting an Arrow buffer in the store,
+copy to Python bytes versus the zero-copy write path
+
+    python -m cronus.benchmarks.bench_put --size 268435456
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+from artemis_format.pymodels.cronus_pb2 import FileObjectInfo
+from cronus.core.cronus import BaseObjectStore
+from cronus.benchmarks.generators import make_buffer
+
+
+def _profile(func):
+    """
+    Wall time and peak Python heap allocation of func
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run(size):
+    """
+    Returns
+    -------
+    dict of write path to (seconds, peak bytes allocated)
+    """
+    buf = make_buffer(size)
+    fileinfo = FileObjectInfo()
+    fileinfo.type = 5
+    results = {"buffer_size": buf.size}
+    with tempfile.TemporaryDirectory() as dirpath:
+        store = BaseObjectStore(dirpath, "bench")
+        dataset = store.register_dataset()
+        store.new_partition(dataset.uuid, "key")
+        ids_ = [
+            store.register_content(
+                buf, fileinfo, dataset_id=dataset.uuid, job_id=0, partition_key="key"
+            ).uuid
+            for _ in range(2)
+        ]
+        results["to_pybytes"] = _profile(
+            lambda: store._dstore.put(store[ids_[0]].name, buf.to_pybytes())
+        )
+        results["zero_copy"] = _profile(lambda: store.put(ids_[1], buf))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=256 * 1024 * 1024)
+    args = parser.parse_args()
+
+    results = run(args.size)
+    print(f"buffer size {results.pop('buffer_size') / 2**20:.1f} MiB")
+    print(f"{'path':<12}{'time (s)':>10}{'peak (MiB)':>12}")
+    for name, (elapsed, peak) in results.items():
+        print(f"{name:<12}{elapsed:>10.3f}{peak / 2**20:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
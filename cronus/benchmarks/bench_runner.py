@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of the scaling of the JobRunner with the number of workers
+
+    python -m cronus.benchmarks.bench_runner --jobs 64 --max-workers 64
+"""
+import argparse
+import tempfile
+import time
+import uuid
+
+from artemis_format.pymodels.cronus_pb2 import MenuObjectInfo, ConfigObjectInfo
+from artemis_format.pymodels.menu_pb2 import Menu as Menu_pb
+from artemis_format.pymodels.configuration_pb2 import Configuration
+from cronus.core.cronus import BaseObjectStore
+from cronus.core.runner import JobRunner
+
+
+def make_store(root, num_partitions):
+    """
+    Store with a menu, a configuration and a dataset
+    """
+    store = BaseObjectStore(root, "bench")
+    menu = Menu_pb()
+    menu.uuid = str(uuid.uuid4())
+    menu.name = f"{menu.uuid}.menu.dat"
+    config = Configuration()
+    config.uuid = str(uuid.uuid4())
+    config.name = f"{config.uuid}.config.dat"
+    menu_id = store.register_content(menu, MenuObjectInfo()).uuid
+    config_id = store.register_content(config, ConfigObjectInfo()).uuid
+    dataset = store.register_dataset(menu_id, config_id)
+    for i in range(num_partitions):
+        store.new_partition(dataset.uuid, f"key{i}")
+    return store, dataset.uuid, menu_id, config_id
+
+
+def run(num_jobs, workers, num_partitions=2):
+    """
+    Run the jobs once per number of workers
+
+    Returns
+    -------
+    dict of number of workers to the summary of the run
+    """
+    results = {}
+    for num_workers in workers:
+        with tempfile.TemporaryDirectory() as dirpath:
+            store, dataset_id, menu_id, config_id = make_store(dirpath, num_partitions)
+            runner = JobRunner(
+                store, dirpath, dataset_id, menu_id, config_id, workers=num_workers
+            )
+            start = time.perf_counter()
+            metrics = runner.run(num_jobs)
+            results[num_workers] = runner.summary(metrics, time.perf_counter() - start)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=64)
+    parser.add_argument("--max-workers", type=int, default=64)
+    parser.add_argument("--partitions", type=int, default=2)
+    args = parser.parse_args()
+
+    workers = [1]
+    while workers[-1] * 2 <= args.max_workers:
+        workers.append(workers[-1] * 2)
+
+    print(
+        f"{'workers':>8}{'time (s)':>12}{'jobs/s':>10}{'MB/s':>10}"
+        f"{'register (ms)':>15}{'merge p50 (ms)':>16}"
+    )
+    for n, summary in run(args.jobs, workers, args.partitions).items():
+        print(
+            f"{n:>8}{summary['elapsed']:>12.3f}{summary['jobs_per_second']:>10.2f}"
+            f"{summary['throughput'] / 1e6:>10.1f}"
+            f"{summary['mean_register_time'] * 1e3:>15.3f}"
+            f"{summary['median_merge_latency'] * 1e3:>16.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
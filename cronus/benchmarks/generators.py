@@ -0,0 +1,164 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Synthetic content and stores for the benchmarks.
+
+Generators are seeded so repeated runs produce the same content,
+object uuids are random and do not change the size of the content.
+"""
+import uuid
+
+import numpy as np
+import pyarrow as pa
+
+from artemis_format.pymodels.cronus_pb2 import (
+    DatasetObjectInfo,
+    FileObjectInfo,
+    FileType,
+)
+from artemis_format.pymodels.menu_pb2 import Menu as Menu_pb
+from artemis_format.pymodels.configuration_pb2 import Configuration
+from cronus.core.book import ArtemisBook, TDigestBook
+from cronus.core.cronus import BaseObjectStore
+
+SEED = 42
+
+
+def seed(value=SEED):
+    np.random.seed(value)
+
+
+def make_menu():
+    menu = Menu_pb()
+    menu.uuid = str(uuid.uuid4())
+    menu.name = f"{menu.uuid}.menu.dat"
+    return menu
+
+
+def make_config():
+    config = Configuration()
+    config.uuid = str(uuid.uuid4())
+    config.name = f"{config.uuid}.config.dat"
+    return config
+
+
+def make_batch(num_rows, num_columns=4):
+    """
+    RecordBatch of random doubles
+    """
+    data = [pa.array(np.random.rand(num_rows)) for _ in range(num_columns)]
+    return pa.RecordBatch.from_arrays(data, [f"f{i}" for i in range(num_columns)])
+
+
+def make_buffer(size):
+    """
+    Arrow RecordBatchFile of about size bytes of random doubles
+    """
+    batch = make_batch(max(size // (8 * 4 * 10), 1))
+    sink = pa.BufferOutputStream()
+    writer = pa.RecordBatchFileWriter(sink, batch.schema)
+    for _ in range(10):
+        writer.write_batch(batch)
+    writer.close()
+    return sink.getvalue()
+
+
+def make_hbook(num_hists, num_fills=1000, compact=False):
+    """
+    ArtemisBook of filled histograms
+    """
+    hbook = ArtemisBook(compact=compact)
+    for i in range(num_hists):
+        hbook.book("bench", f"h{i}", range(0, 100))
+        hbook.fill("bench", f"h{i}", np.random.normal(50, 10, num_fills))
+    return hbook
+
+
+def make_tbook(num_digests, num_fills=1000):
+    """
+    TDigestBook of filled digests
+    """
+    tbook = TDigestBook()
+    for i in range(num_digests):
+        tbook.book("bench", f"t{i}")
+        tbook[f"bench.t{i}"].batch_update(np.random.normal(0, 1, num_fills))
+    return tbook
+
+
+def make_dataset(store, num_partitions=10, menu_id=None, config_id=None):
+    """
+    Register a dataset with partitions key0, key1, ...
+    """
+    dataset = store.register_dataset(menu_id, config_id)
+    for i in range(num_partitions):
+        store.new_partition(dataset.uuid, f"key{i}")
+    return dataset.uuid
+
+
+def make_store(
+    root, num_objects, num_datasets=10, num_partitions=10, num_jobs=100, **kwargs
+):
+    """
+    Synthetic store of partition files spread over datasets, partitions and jobs
+
+    Parameters
+    ----------
+    kwargs : options of the BaseObjectStore, e.g. storetype
+    """
+    store = BaseObjectStore(root, "bench", **kwargs)
+    fileinfo = FileObjectInfo()
+    fileinfo.type = 5
+    key = str(FileType.Name(fileinfo.type)).lower()
+    partitions = [f"key{i}" for i in range(num_partitions)]
+    for _ in range(num_datasets):
+        dataset_id = make_dataset(store, num_partitions)
+        delta = DatasetObjectInfo()
+        delta.partitions.extend(partitions)
+        for i in range(num_objects // num_datasets):
+            job = i % num_jobs
+            partition = partitions[(i // num_jobs) % num_partitions]
+            obj = delta.files.add()
+            obj.uuid = str(uuid.uuid4())
+            obj.name = f"{dataset_id}.job_{job}.part_{partition}.{obj.uuid}.{key}"
+            obj.parent_uuid = dataset_id
+            obj.file.CopyFrom(fileinfo)
+        store.update_dataset(dataset_id, delta.SerializeToString())
+    return store
+
+
+def make_deltas(dataset_id, num_jobs, num_partitions=10):
+    """
+    Serialized deltas of jobs writing a file per partition,
+    a histogram collection and a job summary
+    """
+    partitions = [f"key{i}" for i in range(num_partitions)]
+    deltas = []
+    for job in range(num_jobs):
+        delta = DatasetObjectInfo()
+        delta.partitions.extend(partitions)
+        children = [("jobs", "job", ""), ("hists", "hists", "")]
+        children += [("files", "arrow", f"part_{p}.") for p in partitions]
+        for field, suffix, part in children:
+            obj = getattr(delta, field).add()
+            obj.uuid = str(uuid.uuid4())
+            obj.name = f"{dataset_id}.job_{job}.{part}{obj.uuid}.{suffix}"
+            obj.parent_uuid = dataset_id
+        deltas.append(delta.SerializeToString())
+    return deltas
@@ -0,0 +1,402 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark suite of the metastore hot paths.
+
+Each case returns a setup callable, the timed callable taking the result
+of setup, and the number of operations of a call. Cases are scaled by a
+number of objects and timed over repeated calls, results are reported
+as a JSON document to track regressions across releases.
+"""
+import collections
+import datetime
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+
+from artemis_format.pymodels.cronus_pb2 import (
+    MenuObjectInfo,
+    ConfigObjectInfo,
+    FileObjectInfo,
+    HistsObjectInfo,
+    TDigestObjectInfo,
+    JobObjectInfo,
+    TableObjectInfo,
+)
+from cronus.core.book import merge_all
+from cronus.core.cronus import BaseObjectStore
+from cronus.core.merge import DatasetMerger
+from cronus.benchmarks import generators
+
+CASES = collections.OrderedDict()
+
+
+def case(name):
+    """
+    Register a benchmark case, a function of the working directory,
+    the number of objects and the store options
+    """
+
+    def register(func):
+        CASES[name] = func
+        return func
+
+    return register
+
+
+def _new_store(root, options, num_partitions=1):
+    store = BaseObjectStore(tempfile.mkdtemp(dir=root), "bench", **options)
+    dataset_id = generators.make_dataset(store, num_partitions)
+    return store, dataset_id
+
+
+def _register_case(make_content, make_info, **kwargs):
+    """
+    Case registering num_objects / 10 objects of one info type
+    """
+
+    def bench(root, num_objects, options):
+        num = max(num_objects // 10, 1)
+
+        def setup():
+            store, dataset_id = _new_store(root, options)
+            contents = [make_content() for _ in range(num)]
+            return store, dataset_id, contents
+
+        def func(state):
+            store, dataset_id, contents = state
+            info = make_info()
+            for i, content in enumerate(contents):
+                store.register_content(
+                    content, info, dataset_id=dataset_id, job_id=i, **kwargs
+                )
+
+        return setup, func, num
+
+    return bench
+
+
+def _fileinfo():
+    info = FileObjectInfo()
+    info.type = 5
+    return info
+
+
+def _hists():
+    return generators.make_hbook(10, 100)._to_message()
+
+
+def _tdigests():
+    return generators.make_tbook(2, 100)._to_message()
+
+
+def _file():
+    return generators.make_buffer(64 * 1024)
+
+
+_PARTITION = {"partition_key": "key0"}
+case("register_menu")(_register_case(generators.make_menu, MenuObjectInfo))
+case("register_config")(_register_case(generators.make_config, ConfigObjectInfo))
+case("register_hists")(_register_case(_hists, HistsObjectInfo))
+case("register_tdigests")(_register_case(_tdigests, TDigestObjectInfo))
+case("register_job")(_register_case(generators.make_menu, JobObjectInfo))
+case("register_table")(
+    _register_case(generators.make_menu, TableObjectInfo, **_PARTITION)
+)
+case("register_file")(_register_case(_file, _fileinfo, **_PARTITION))
+
+
+@case("register_log")
+def _register_log(root, num_objects, options):
+    def func(state):
+        store, dataset_id = state
+        for i in range(num_objects):
+            store.register_log(dataset_id, i)
+
+    return lambda: _new_store(root, options), func, num_objects
+
+
+@case("save_store")
+def _save_store(root, num_objects, options):
+    # A new store per repeat, a saved journaled store only flushes new records
+    stores = [
+        generators.make_store(tempfile.mkdtemp(dir=root), num_objects, **options)
+    ]
+    num = len(stores[0])
+
+    def setup():
+        if stores:
+            return stores.pop()
+        return generators.make_store(tempfile.mkdtemp(dir=root), num_objects, **options)
+
+    return setup, lambda s: s.save_store(), num
+
+
+def _load_case(lazy):
+    def bench(root, num_objects, options):
+        path = tempfile.mkdtemp(dir=root)
+        store = generators.make_store(path, num_objects, **options)
+        store.save_store()
+
+        def func(_):
+            newstore = BaseObjectStore(
+                path,
+                store.store_name,
+                store_uuid=store.store_uuid,
+                lazy=lazy,
+                **options,
+            )
+            if lazy is False:
+                assert len(newstore) == len(store)
+
+        return lambda: None, func, len(store)
+
+    return bench
+
+
+case("load_store")(_load_case(False))
+case("load_store_lazy")(_load_case(True))
+
+
+@case("list")
+def _list(root, num_objects, options):
+    store = generators.make_store(tempfile.mkdtemp(dir=root), num_objects, **options)
+    dataset_id = store.list(suffix="dataset")[0].uuid
+
+    def func(store):
+        store.list(suffix="dataset")
+        store.list(prefix=dataset_id)
+        store.list_children(dataset_id, partition_key="key3", job_id=7)
+
+    return lambda: store, func, 3
+
+
+def _merge_case(batched):
+    def bench(root, num_objects, options):
+        num_jobs = max(num_objects // 12, 1)
+
+        def setup():
+            store, dataset_id = _new_store(root, options, num_partitions=10)
+            return store, dataset_id, generators.make_deltas(dataset_id, num_jobs)
+
+        def func(state):
+            store, dataset_id, deltas = state
+            if batched is True:
+                with DatasetMerger(store) as merger:
+                    for buf in deltas:
+                        merger.submit(dataset_id, buf)
+            else:
+                for buf in deltas:
+                    store.update_dataset(dataset_id, buf)
+
+        return setup, func, num_jobs
+
+    return bench
+
+
+case("update_dataset")(_merge_case(False))
+case("merge_datasets")(_merge_case(True))
+
+
+def _arrow_case(get):
+    def bench(root, num_objects, options):
+        num = max(num_objects // 100, 1)
+        buf = generators.make_buffer(1024 * 1024)
+        store, dataset_id = _new_store(root, options)
+        ids_ = [
+            store.register_content(
+                None,
+                _fileinfo(),
+                dataset_id=dataset_id,
+                job_id=0,
+                partition_key="key0",
+            ).uuid
+            for _ in range(num)
+        ]
+        for id_ in ids_:
+            store.put(id_, buf)
+
+        def func(store):
+            for id_ in ids_:
+                if get is True:
+                    pa.ipc.open_file(pa.py_buffer(store.get(id_))).read_all()
+                else:
+                    store.put(id_, buf)
+
+        return lambda: store, func, num
+
+    return bench
+
+
+case("put_arrow")(_arrow_case(False))
+case("get_arrow")(_arrow_case(True))
+
+
+@case("book_fill")
+def _book_fill(root, num_objects, options):
+    data = np.random.normal(50, 10, num_objects)
+
+    def func(hbook):
+        for i in range(100):
+            hbook.fill("bench", f"h{i}", data)
+
+    return lambda: generators.make_hbook(100, 0), func, 100
+
+
+@case("book_fill_many")
+def _book_fill_many(root, num_objects, options):
+    data = {f"bench.h{i}": np.random.normal(50, 10, num_objects) for i in range(100)}
+    return (
+        lambda: generators.make_hbook(100, 0, compact=True),
+        lambda b: b.fill_many(data),
+        100,
+    )
+
+
+@case("book_merge")
+def _book_merge(root, num_objects, options):
+    books = [generators.make_hbook(num_objects // 10 or 1, 100) for _ in range(2)]
+    return lambda: books, lambda b: b[0] + b[1], len(books[0])
+
+
+@case("book_merge_all")
+def _book_merge_all(root, num_objects, options):
+    books = [generators.make_hbook(100, 100) for _ in range(num_objects // 10 or 1)]
+    return lambda: books, merge_all, len(books)
+
+
+@case("book_serialize")
+def _book_serialize(root, num_objects, options):
+    hbook = generators.make_hbook(num_objects // 10 or 1, 100)
+
+    def func(hbook):
+        buf = hbook._to_message().SerializeToString()
+        msg = hbook._to_message().__class__()
+        msg.ParseFromString(buf)
+        hbook._from_message(msg)
+
+    return lambda: hbook, func, len(hbook)
+
+
+def _time(setup, func, repeat):
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        func(state)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def environment():
+    """
+    Versions and platform of a run
+    """
+    try:
+        from importlib.metadata import version
+
+        cronus_version = version("cronus")
+    except Exception:
+        cronus_version = "unknown"
+    return {
+        "cronus": cronus_version,
+        "python": platform.python_version(),
+        "pyarrow": pa.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def run(num_objects=10000, repeat=3, cases=None, storetype="hfs"):
+    """
+    Run the benchmark cases
+
+    Parameters
+    ----------
+    num_objects : scale of the synthetic stores
+    repeat : number of timed calls of each case
+    cases : names of the cases to run, None for all
+    storetype : kv store backend of the stores
+
+    Returns
+    -------
+    dict of the environment, the parameters and the results of each case
+    """
+    options = {"storetype": storetype}
+    results = []
+    for name in cases or CASES:
+        generators.seed()
+        root = tempfile.mkdtemp()
+        try:
+            setup, func, ops = CASES[name](root, num_objects, options)
+            times = _time(setup, func, repeat)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+        best = min(times)
+        results.append(
+            {
+                "name": name,
+                "ops": ops,
+                "best": best,
+                "mean": statistics.mean(times),
+                "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+                "ops_per_second": ops / best if best > 0 else None,
+            }
+        )
+    return {
+        "environment": environment(),
+        "parameters": {
+            "objects": num_objects,
+            "repeat": repeat,
+            "storetype": storetype,
+            "seed": generators.SEED,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Cases slower than a baseline run by more than threshold
+    Cases with a zero baseline time are skipped, their ratio is undefined
+
+    Returns
+    -------
+    list of (name, baseline best, current best, ratio)
+    """
+    old = {r["name"]: r["best"] for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        if not old.get(result["name"], 0):
+            continue
+        ratio = result["best"] / old[result["name"]]
+        if ratio > 1 + threshold:
+            regressions.append(
+                (result["name"], old[result["name"]], result["best"], ratio)
+            )
+    return regressions
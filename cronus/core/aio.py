@@ -0,0 +1,205 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+asyncio facade over a BaseObjectStore.
+
+Backend reads and writes run on a bounded thread pool. Metadata lookups,
+protobuf serialization and parsing stay on the event loop thread.
+Puts linking content-addressed blobs update the metadata on the pool,
+one at a time.
+"""
+import asyncio
+import collections
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+
+from artemis_base.utils.logger import Logger
+
+from artemis_format.pymodels.cronus_pb2 import CronusObject
+from cronus.core.cronus import _BUFFER_TYPES, _to_bytes
+
+
+@Logger.logged
+class AsyncObjectStore:
+    """
+    Concurrent get and put of store objects
+
+    Parameters
+    ----------
+    store : BaseObjectStore
+    concurrency : maximum number of backend requests in flight
+    """
+
+    def __init__(self, store, concurrency=16):
+        self._store = store
+        self._concurrency = concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="cronus-io"
+        )
+        self._semaphore = None
+        self._linking = None
+
+    @property
+    def store(self):
+        return self._store
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _bounded(self, coro):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        async with self._semaphore:
+            return await coro
+
+    async def put(self, id_, content):
+        """
+        Writes data to kv store, see BaseObjectStore.put
+        """
+        obj = self._store[id_]
+        if isinstance(content, _BUFFER_TYPES):
+            if self._store._relinks(obj):
+                # Linking a blob updates the metadata, hashing runs on the pool
+                if self._linking is None:
+                    self._linking = asyncio.Lock()
+                async with self._linking:
+                    await self._run(self._store._put_object, id_, content)
+                return
+            # Compression runs on the pool with a copy of the metadata
+            snapshot = CronusObject()
+            snapshot.CopyFrom(obj)
+            data = await self._run(self._store._encode, snapshot, content)
+            try:
+                await self._run(self._store._write_object, obj.name, obj.address, data)
+            finally:
+                _close(data, content)
+        elif self._store._locate(id_)[2] is not None:
+            # Appending to a pack segment updates the metadata
+            self._store._put_message(id_, content)
+        else:
+            buf = content.SerializeToString()
+            data = self._store._encode(obj, buf)
+            try:
+                await self._run(self._store._dstore.put, obj.name, _to_bytes(data))
+            finally:
+                _close(data, buf)
+
+    async def get(self, id_, msg=None):
+        """
+        Retrieves data from kv store, see BaseObjectStore.get
+
+        Returns
+        -------
+        In-memory buffer of data, or msg parsed from the object
+        """
+        key, path, span, codec = self._store._locate(id_)
+        if msg is None:
+            return await self._run(self._store._read_object, key, path, span, codec)
+        try:
+            buf = await self._run(self._store._read_message, key, span, codec)
+        except KeyError:
+            self.__logger.error("Message not found in store %s", key)
+            raise
+        msg.ParseFromString(buf)
+        return msg
+
+    async def get_many(
+        self, ids_, msg_cls=None, workers=8, ordered=True, prefetch=None
+    ):
+        """
+        Retrieve many objects, streaming the results as they are read,
+        see BaseObjectStore.get_many
+
+        Parameters
+        ----------
+        ids_ : iterable of uuids
+        msg_cls : protobuf message class to parse the objects into,
+            None to retrieve the buffers
+        workers : number of concurrent reads
+        ordered : yield in the order of the uuids, otherwise as completed
+        prefetch : maximum number of objects read ahead, default 2 * workers
+
+        Yields
+        ------
+        tuple of uuid, buffer or parsed message
+        """
+        if prefetch is None:
+            prefetch = 2 * workers
+        semaphore = asyncio.Semaphore(max(workers, 1))
+
+        async def fetch(id_):
+            async with semaphore:
+                msg = None if msg_cls is None else msg_cls()
+                return id_, await self._bounded(self.get(id_, msg))
+
+        ids_ = iter(ids_)
+        pending = collections.deque(
+            asyncio.ensure_future(fetch(id_))
+            for id_ in itertools.islice(ids_, max(prefetch, 1))
+        )
+        try:
+            while pending:
+                if ordered:
+                    result = await pending.popleft()
+                else:
+                    done, _ = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    task = done.pop()
+                    pending.remove(task)
+                    result = task.result()
+                id_ = next(ids_, None)
+                if id_ is not None:
+                    pending.append(asyncio.ensure_future(fetch(id_)))
+                yield result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def put_many(self, items):
+        """
+        Write many objects concurrently
+
+        Parameters
+        ----------
+        items : iterable of (uuid, content)
+        """
+        await asyncio.gather(
+            *[self._bounded(self.put(id_, content)) for id_, content in items]
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _close(data, buf):
+    """
+    Close the temporary file of an encoded buffer
+    """
+    if data is not buf and isinstance(data, pa.NativeFile):
+        data.close()
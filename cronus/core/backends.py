@@ -0,0 +1,442 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Registry of the kv store backends of a BaseObjectStore.
+
+Backends are simplekv stores providing url_for, selected by the storetype
+of the store:
+
+hfs : one file per object in a local directory
+memory : in-process dictionary, stores on the same root share their objects
+sqlite : single SQLite database file, suited to many small objects
+s3 : S3 compatible object storage, requires boto3
+
+Additional backends are added with register_backend.
+"""
+import os
+import sqlite3
+import threading
+import urllib.parse
+from io import BytesIO
+
+from simplekv import KeyValueStore, UrlMixin, CopyMixin
+from simplekv.fs import FilesystemStore
+from simplekv.memory import DictStore
+
+from artemis_base.utils.logger import Logger
+
+_BACKENDS = dict()
+
+
+def register_backend(storetype):
+    """
+    Decorator registering a backend factory
+
+    The factory is called with the store root and the backend options
+    and returns a simplekv store supporting url_for.
+    """
+
+    def decorator(factory):
+        _BACKENDS[storetype] = factory
+        return factory
+
+    return decorator
+
+
+def list_backends():
+    return sorted(_BACKENDS)
+
+
+def open_backend(storetype, root, **options):
+    """
+    Open the kv store of a storetype
+
+    Parameters
+    ----------
+    storetype : registered backend name
+    root : location of the store, interpreted by the backend
+    options : backend specific options
+    """
+    try:
+        factory = _BACKENDS[storetype]
+    except KeyError:
+        raise ValueError(f"Unknown storetype {storetype}")
+    return factory(root, **options)
+
+
+@register_backend("hfs")
+def _filesystem(root):
+    return FilesystemStore(f"{root}")
+
+
+class MemoryStore(UrlMixin, DictStore):
+    """
+    Dictionary store addressed by memory:// urls
+    """
+
+    def __init__(self, root, d=None):
+        super().__init__()
+        self.root = str(root)
+        if d is not None:
+            self.d = d
+
+    def _url_for(self, key):
+        return f"memory://{self.root}/{urllib.parse.quote(key)}"
+
+
+# Contents of the in-memory stores of the process, keyed by root
+_MEMORY_STORES = dict()
+_MEMORY_LOCK = threading.Lock()
+
+
+@register_backend("memory")
+def _memory(root):
+    with _MEMORY_LOCK:
+        d = _MEMORY_STORES.setdefault(str(root), dict())
+    return MemoryStore(root, d)
+
+
+# Size of the chunks streamed from a file into a SQLite row
+_CHUNK_SIZE = 1 << 20
+
+
+def _remaining(file):
+    """
+    Bytes left in a seekable file, None if the file cannot seek
+    """
+    try:
+        position = file.tell()
+        end = file.seek(0, os.SEEK_END)
+        file.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return None
+    if end is None:
+        return None
+    return end - position
+
+
+@Logger.logged
+class SQLiteStore(UrlMixin, CopyMixin, KeyValueStore):
+    """
+    Objects stored as rows of a single SQLite database file
+
+    Avoids one file per object for metadata heavy workloads, e.g. many
+    small histogram, tdigest and job protobufs. Each thread uses its own
+    connection, the database is in WAL mode so readers do not block
+    the writer. Files are streamed into the rows with incremental blob I/O
+    when the sqlite3 module supports it. The connections are released
+    with close, or by using the store as a context manager.
+
+    Parameters
+    ----------
+    path : database file
+    timeout : seconds to wait for a database lock
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = os.path.abspath(str(path))
+        self._timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS objects "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL)"
+            )
+            (sql,) = self._conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'objects'"
+            ).fetchone()
+        # Incremental blob I/O addresses rows by rowid,
+        # databases created WITHOUT ROWID fall back to reading the file
+        self._blob_io = hasattr(sqlite3.Connection, "blobopen") and (
+            "WITHOUT ROWID" not in sql.upper()
+        )
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=self._timeout, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _has_key(self, key):
+        cursor = self._conn.execute("SELECT 1 FROM objects WHERE key = ?", (key,))
+        return cursor.fetchone() is not None
+
+    def _delete(self, key):
+        with self._conn:
+            self._conn.execute("DELETE FROM objects WHERE key = ?", (key,))
+
+    def _get(self, key):
+        cursor = self._conn.execute("SELECT value FROM objects WHERE key = ?", (key,))
+        row = cursor.fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def _open(self, key):
+        return BytesIO(self._get(key))
+
+    def get_range(self, key, offset, length):
+        """
+        Bytes of a value starting at offset, e.g. an object of a pack segment
+        """
+        cursor = self._conn.execute(
+            "SELECT substr(value, ?, ?) FROM objects WHERE key = ?",
+            (offset + 1, length, key),
+        )
+        row = cursor.fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def _copy(self, source, dest):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO objects SELECT ?, value FROM objects "
+                "WHERE key = ?",
+                (dest, source),
+            )
+        return dest
+
+    def _put(self, key, data):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?)", (key, data)
+            )
+        return key
+
+    def _put_file(self, key, file):
+        size = _remaining(file)
+        if size is None or not self._blob_io:
+            return self._put(key, file.read())
+        with self._conn:
+            rowid = self._conn.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, zeroblob(?))", (key, size)
+            ).lastrowid
+            with self._conn.blobopen("objects", "value", rowid) as blob:
+                while size > 0:
+                    chunk = file.read(min(size, _CHUNK_SIZE))
+                    if not chunk:
+                        raise IOError(f"File of {key} ended before {size} bytes")
+                    blob.write(chunk)
+                    size -= len(chunk)
+        return key
+
+    def iter_keys(self, prefix=""):
+        cursor = self._conn.execute(
+            "SELECT key FROM objects WHERE key >= ? ORDER BY key", (prefix,)
+        )
+        for (key,) in cursor:
+            if not key.startswith(prefix):
+                break
+            yield key
+
+    def _url_for(self, key):
+        return f"sqlite://{self.path}/{urllib.parse.quote(key)}"
+
+
+@register_backend("sqlite")
+def _sqlite(root, filename="cronus.sqlite", **options):
+    root = str(root)
+    if os.path.splitext(root)[1] in (".db", ".sqlite"):
+        return SQLiteStore(root, **options)
+    return SQLiteStore(os.path.join(root, filename), **options)
+
+
+# boto3 clients shared by the S3 stores of the process,
+# each client holds a pool of reusable connections
+_S3_CLIENTS = dict()
+_S3_LOCK = threading.Lock()
+
+
+def _freeze(value):
+    """
+    Hashable form of an option value, e.g. a dict of botocore config options
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def _s3_client(max_pool_connections=32, **options):
+    key = (max_pool_connections, _freeze(options))
+    with _S3_LOCK:
+        client = _S3_CLIENTS.get(key, None)
+        if client is None:
+            try:
+                import boto3
+                from botocore.config import Config
+            except ImportError:
+                raise ImportError("storetype s3 requires the boto3 package")
+            client = boto3.session.Session().client(
+                "s3",
+                config=Config(max_pool_connections=max_pool_connections),
+                **options,
+            )
+            _S3_CLIENTS[key] = client
+    return client
+
+
+@Logger.logged
+class S3Store(UrlMixin, CopyMixin, KeyValueStore):
+    """
+    Objects stored in an S3 compatible bucket
+
+    Parameters
+    ----------
+    bucket : bucket name
+    prefix : key prefix of the objects in the bucket
+    client : boto3 s3 client, by default a pooled client shared
+        by the stores with the same options
+    options : options of the boto3 client, e.g. endpoint_url, region_name,
+        max_pool_connections
+    """
+
+    def __init__(self, bucket, prefix="", client=None, **options):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = client if client is not None else _s3_client(**options)
+
+    def _key(self, key):
+        return self.prefix + key
+
+    @staticmethod
+    def _missing(error):
+        code = error.response.get("Error", {}).get("Code", "")
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def _has_key(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as error:
+            if self._missing(error):
+                return False
+            raise
+        return True
+
+    def _delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def _open(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as error:
+            if self._missing(error):
+                raise KeyError(key)
+            raise
+        return response["Body"]
+
+    def get_range(self, key, offset, length):
+        """
+        Bytes of an object starting at offset, e.g. an object of a pack segment
+        """
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket,
+                Key=self._key(key),
+                Range=f"bytes={offset}-{offset + length - 1}",
+            )
+        except ClientError as error:
+            if self._missing(error):
+                raise KeyError(key)
+            raise
+        return response["Body"].read()
+
+    def _get(self, key):
+        body = self._open(key)
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    def _copy(self, source, dest):
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=self._key(dest),
+            CopySource={"Bucket": self.bucket, "Key": self._key(source)},
+        )
+        return dest
+
+    def _put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+        return key
+
+    def _put_file(self, key, file):
+        # Multipart upload streams large files in parts
+        self.client.upload_fileobj(file, self.bucket, self._key(key))
+        return key
+
+    def iter_keys(self, prefix=""):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get("Contents", []):
+                yield item["Key"][len(self.prefix) :]
+
+    def _url_for(self, key):
+        return f"s3://{self.bucket}/{urllib.parse.quote(self._key(key))}"
+
+
+@register_backend("s3")
+def _s3(root, **options):
+    url = urllib.parse.urlparse(str(root))
+    if url.scheme == "s3":
+        bucket, prefix = url.netloc, url.path
+    else:
+        bucket, _, prefix = str(root).partition("/")
+    return S3Store(bucket, prefix, **options)
@@ -30,6 +30,9 @@ histograms, tdigests and tool objects.
 
 import collections
 import fnmatch
+import multiprocessing
+import operator
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 
@@ -47,6 +50,77 @@ from artemis_base.utils.utils import autobinning
 from artemis_base.core.tool import ToolBase
 
 
+def _tree_reduce(items, op=operator.add):
+    """
+    Reduce a list pairwise, the depth of the reduction is log2 of its length
+    """
+    items = list(items)
+    while len(items) > 1:
+        reduced = [op(a, b) for a, b in zip(items[::2], items[1::2])]
+        if len(items) % 2:
+            reduced.append(items[-1])
+        items = reduced
+    return items[0]
+
+
+def _sum_stats(a, b):
+    """
+    Sum of the statistics of two histograms, dicts are summed key by key
+    as in the physt histogram addition
+    """
+    if isinstance(a, dict):
+        return {key: value + b[key] for key, value in a.items()}
+    return a + b
+
+
+def merge_all(books, workers=None):
+    """
+    Merge books of the same class into a new book
+
+    Parameters
+    ----------
+    books : iterable of books
+    workers : number of processes, chunks of the books are merged in a
+        process pool and the partial books are then merged
+
+    Returns
+    -------
+    book with the content of all the books
+    """
+    books = list(books)
+    if not books:
+        raise ValueError("No books to merge")
+    cls = books[0].__class__
+    if any(book.__class__ is not cls for book in books):
+        raise TypeError("books can only be merged with books of the same class")
+    if workers is not None and workers > 1 and len(books) > workers:
+        size = -(-len(books) // workers)
+        chunks = [books[i : i + size] for i in range(0, len(books), size)]
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            books = list(pool.map(merge_all, chunks))
+    return cls.merge_all(books)
+
+
+def merge_buffers(cls, buffers):
+    """
+    Deserialize books of a class from their serialized messages and merge them
+
+    Parameters
+    ----------
+    cls : book class, with the protobuf message class in _message
+    buffers : list of serialized messages
+    """
+    books = []
+    for buf in buffers:
+        msg = cls._message()
+        msg.ParseFromString(buf)
+        books.append(cls.__new__(cls)._from_message(msg))
+    if not books:
+        return cls()
+    return merge_all(books)
+
+
 class BaseBook(collections.MutableMapping):
     """Base class for a collection of objects in a dictionary-like object.
 
@@ -89,6 +163,14 @@ class BaseBook(collections.MutableMapping):
 
         return set(self._iter_keys()) == set(other._iter_keys())
 
+    @classmethod
+    def merge_all(cls, books):
+        """
+        Merge a list of books, added pairwise in a tree
+        re-implement in derived classes
+        """
+        return _tree_reduce(books)
+
     def _updated(self):
         pass
 
@@ -244,27 +326,378 @@ class BaseBook(collections.MutableMapping):
         return self
 
 
+class SampleBuffer:
+    """
+    Growable buffer of timer samples
+
+    Samples are kept in a float64 array whose capacity doubles when full,
+    appends do not create Python objects.
+    """
+
+    __slots__ = ("_data", "_size")
+
+    def __init__(self, capacity=1024):
+        self._data = np.empty(capacity, dtype=np.float64)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def values(self):
+        """
+        View of the samples
+        """
+        return self._data[: self._size]
+
+    def _reserve(self, size):
+        if size > len(self._data):
+            data = np.empty(max(size, 2 * len(self._data)), dtype=np.float64)
+            data[: self._size] = self._data[: self._size]
+            self._data = data
+
+    def append(self, value):
+        self._reserve(self._size + 1)
+        self._data[self._size] = value
+        self._size += 1
+
+    def extend(self, values):
+        values = np.ravel(values)
+        size = self._size + len(values)
+        self._reserve(size)
+        self._data[self._size : size] = values
+        self._size = size
+
+
+def _add_stats(hist, values):
+    """
+    Add filled values to the statistics of a histogram, a dict of
+    sum and sum2 or a physt Statistics
+    """
+    stats = hist._stats
+    if stats is None or len(values) == 0:
+        return
+    total = float(values.sum())
+    total2 = float(np.dot(values, values))
+    if isinstance(stats, dict):
+        stats["sum"] = stats.get("sum", 0.0) + total
+        stats["sum2"] = stats.get("sum2", 0.0) + total2
+    else:
+        hist._stats = stats + type(stats)(
+            sum=total,
+            sum2=total2,
+            min=float(values.min()),
+            max=float(values.max()),
+            weight=float(len(values)),
+        )
+
+
+class HistogramBlock:
+    """
+    Bins of many 1-D histograms in one contiguous block
+
+    Frequencies and squared errors of every histogram are the two rows of
+    a 2-D int64 array, each histogram owns a range of columns at its offset.
+    Added histograms become views: their frequencies and errors2 arrays
+    refer to the block, physt fills and block fills update the same bins.
+
+    Block fills bin the values with searchsorted and count them with a
+    single bincount over all the histograms filled. Bin contents, underflow,
+    overflow and the sum and sum of squares statistics of the views are
+    updated as by a physt fill.
+    """
+
+    def __init__(self, capacity=1024):
+        self._data = np.zeros((2, capacity), dtype=np.int64)
+        self._size = 0
+        self._slots = dict()  # name -> [offset, edges, histogram]
+
+    def __contains__(self, name):
+        return name in self._slots
+
+    def __len__(self):
+        return len(self._slots)
+
+    @property
+    def nbins(self):
+        """
+        Number of allocated bins
+        """
+        return self._size
+
+    def slot(self, name):
+        return self._slots[name]
+
+    def _grow(self, size):
+        data = np.zeros((2, max(size, 2 * self._data.shape[1])), dtype=np.int64)
+        data[:, : self._size] = self._data[:, : self._size]
+        self._data = data
+        for slot in self._slots.values():
+            self._bind(slot)
+
+    def _bind(self, slot):
+        offset, edges, hist = slot
+        view = self._data[:, offset : offset + len(edges) - 1]
+        hist.frequencies = view[0]
+        hist.errors2 = view[1]
+
+    def add(self, name, hist):
+        """
+        Copy the bins of a histogram to the block, the histogram becomes a view
+        """
+        if not np.issubdtype(hist.dtype, np.integer):
+            raise ValueError(f"Histogram {name} does not have integer frequencies")
+        if not hist.binning.is_consecutive():
+            raise ValueError(f"Histogram {name} does not have consecutive bins")
+        edges = np.asarray(hist.numpy_bins, dtype=np.float64)
+        nbins = len(edges) - 1
+        slot = self._slots.get(name, None)
+        if slot is not None and len(slot[1]) == len(edges):
+            offset = slot[0]
+        else:
+            offset = self._size
+            if offset + nbins > self._data.shape[1]:
+                self._grow(offset + nbins)
+            self._size += nbins
+        self._data[0, offset : offset + nbins] = hist.frequencies
+        self._data[1, offset : offset + nbins] = hist.errors2
+        slot = [offset, edges, hist]
+        self._slots[name] = slot
+        self._bind(slot)
+        return slot
+
+    def remove(self, name):
+        """
+        Drop a histogram, its bins are not reused
+        """
+        self._slots.pop(name, None)
+
+    @staticmethod
+    def _bins(slot, values):
+        """
+        In-range bin of each value, counts underflow and overflow
+        and accumulates the statistics
+        """
+        _, edges, hist = slot
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        _add_stats(hist, values)
+        nbins = len(edges) - 1
+        pos = np.searchsorted(edges, values, side="right") - 1
+        # The last bin includes its right edge
+        pos[values == edges[-1]] = nbins - 1
+        inside = (pos >= 0) & (pos < nbins)
+        if hist.keep_missed:
+            missed = len(pos) - np.count_nonzero(inside)
+            if missed:
+                underflow = np.count_nonzero(pos < 0)
+                hist.underflow += underflow
+                hist.overflow += missed - underflow
+        return pos[inside]
+
+    def fill_slot(self, slot, values):
+        offset, edges, _ = slot
+        nbins = len(edges) - 1
+        counts = np.bincount(self._bins(slot, values), minlength=nbins)
+        self._data[:, offset : offset + nbins] += counts
+
+    def fill(self, name, values):
+        self.fill_slot(self._slots[name], values)
+
+    def fill_many(self, data):
+        """
+        Fill several histograms with a single bincount
+
+        Parameters
+        ----------
+        data : iterable of (histogram name, values)
+        """
+        positions = []
+        for name, values in data:
+            slot = self._slots[name]
+            positions.append(self._bins(slot, values) + slot[0])
+        if not positions:
+            return
+        counts = np.bincount(np.concatenate(positions), minlength=self._size)
+        self._data[:, : self._size] += counts
+
+
+class FillHandle:
+    """
+    Fill of a booked histogram, resolved once
+
+    Holds the histogram and its timer samples, a fill does not build the
+    histogram name nor look it up in the book. The handle resolves them
+    again after the book changes, e.g. on a rebook.
+    """
+
+    __slots__ = ("name", "_book", "_generation", "_hist", "_timer", "_slot")
+
+    def __init__(self, book, name):
+        self.name = name
+        self._book = book
+        self._resolve()
+
+    def _resolve(self):
+        book = self._book
+        self._generation = book._generation
+        self._hist = book._get(self.name)
+        if self._hist is None:
+            raise KeyError(self.name)
+        self._timer = None
+        if book._rebooked is False:
+            self._timer = book._timers.get(self.name, None)
+        self._slot = None
+        if book._block is not None:
+            self._slot = book._block.slot(self.name)
+
+    def fill(self, data):
+        if self._generation != self._book._generation:
+            self._resolve()
+        if self._slot is not None:
+            if isinstance(data, list):
+                data = np.asarray(data)
+            self._book._block.fill_slot(self._slot, data)
+        elif isinstance(data, np.ndarray):
+            self._hist.fill_n(data)
+        elif isinstance(data, list):
+            data = np.asarray(data)
+            self._hist.fill_n(data)
+        else:
+            self._hist.fill(data)
+        if self._timer is not None:
+            if isinstance(data, np.ndarray):
+                self._timer.extend(data)
+            else:
+                self._timer.append(data)
+
+    __call__ = fill
+
+
 @Logger.logged
 class ArtemisBook(BaseBook):
     """
     Book for histograms and timers.
 
+    A compact book keeps the bins of all its histograms in a HistogramBlock,
+    histograms are views of the block and fill_many or fill_batch fill
+    many histograms in a single pass.
+
+    Parameters
+    ----------
+        hists : dict
+            dictionary of histograms to initialize book
+        compact : bool
+            store the bins in a HistogramBlock
+
     Attributes
     ----------
         _timers : OrderedDict
-            dictionary of timer objects
+            dictionary of the SampleBuffer of each timer
     """
 
-    def __init__(self, hists={}):
+    # Incremented on every change of the histograms, invalidates FillHandles
+    _generation = 0
+    _block = None
+
+    def __init__(self, hists={}, compact=False):
+        if compact is True:
+            self._block = HistogramBlock()
         super().__init__(hists)
         self._timers = collections.OrderedDict()
         self._rebooked = False
+        self._handles = dict()
+
+    @property
+    def compact(self):
+        return self._block is not None
+
+    def _updated(self):
+        self._generation += 1
+
+    def _set(self, name, value):
+        if self._block is not None:
+            self._block.add(name, value)
+        super()._set(name, value)
+
+    def _del(self, name):
+        if self._block is not None:
+            self._block.remove(name)
+        super()._del(name)
 
     def compatible(self, other):
         return set(self._iter_keys()) == set(other._iter_keys()) and all(
             self[n].has_same_bins(other[n]) for n in self.keys()
         )
 
+    # Number of books stacked in one reduction of merge_all
+    _merge_chunk_size = 128
+    _message = HistogramCollection
+
+    @classmethod
+    def merge_all(cls, books):
+        """
+        Merge a list of books with a stacked sum of their bins
+
+        Binnings are checked once for the list, then frequencies, errors2
+        and missed values of each book are concatenated in a row and the
+        rows are summed in chunks of books. Histograms missing from
+        a book count as empty.
+        """
+        hists = collections.OrderedDict()
+        for book in books:
+            for n, h in book._content.items():
+                ref = hists.get(n, None)
+                if ref is None:
+                    hists[n] = h
+                elif h.binning is not ref.binning and not np.array_equal(
+                    h.binning.bins, ref.binning.bins
+                ):
+                    raise ValueError(f"Histogram {n} has incompatible binning")
+        names = tuple(hists)
+        empty = [np.zeros_like(h.frequencies) for h in hists.values()]
+        missed = np.zeros(3, dtype=np.int64)
+
+        def row(book):
+            content = book._content
+            if tuple(content) == names:
+                hs = list(content.values())
+                return np.concatenate(
+                    [h.frequencies for h in hs]
+                    + [h.errors2 for h in hs]
+                    + [h._missed for h in hs]
+                )
+            hs = [content.get(n, None) for n in names]
+            return np.concatenate(
+                [e if h is None else h.frequencies for h, e in zip(hs, empty)]
+                + [e if h is None else h.errors2 for h, e in zip(hs, empty)]
+                + [missed if h is None else h._missed for h in hs]
+            )
+
+        total = None
+        for i in range(0, len(books), cls._merge_chunk_size):
+            chunk = books[i : i + cls._merge_chunk_size]
+            partial = np.stack([row(book) for book in chunk]).sum(axis=0)
+            total = partial if total is None else total + partial
+
+        sizes = [len(e) for e in empty]
+        bounds = np.cumsum(sizes + sizes + [3] * len(sizes))[:-1]
+        parts = np.split(total, bounds)
+        num = len(names)
+        content = collections.OrderedDict()
+        for i, (n, ref) in enumerate(hists.items()):
+            stats = [book._content[n]._stats for book in books if n in book._content]
+            if any(x is None for x in stats):
+                stats = None
+            else:
+                stats = _tree_reduce(stats, _sum_stats)
+            h = Histogram1D(ref.binning, parts[i], parts[num + i], stats=stats)
+            h.underflow, h.overflow, h.inner_missed = parts[2 * num + i]
+            if ref.axis_name:
+                h.axis_name = ref.axis_name
+            content[n] = h
+        return cls(content)
+
     def reset(self):
         """
         clear bin contents of all histograms
@@ -284,12 +717,19 @@ class ArtemisBook(BaseBook):
         pass
 
     def book(self, algname, name, bins, axis_name=None, timer=False):
+        """
+        Book a histogram
+
+        Returns
+        -------
+        FillHandle of the histogram
+        """
         name_ = "."
         name_ = name_.join([algname, name])
         self.__logger.info("Booking %s", name_)
         # TODO
         # Explore more options for correctly initializing h1
-        value = self._get(name)
+        value = self._get(name_)
         if value is not None:
             self.__logger.error("Histogram already exists %s", name_)
         else:
@@ -301,10 +741,25 @@ class ArtemisBook(BaseBook):
             self[name_] = h
 
             if timer is True:
-                self._timers[name_] = []
+                self._timers[name_] = SampleBuffer()
 
         if axis_name:
             self._get(name_).axis_name = axis_name
+        return self.handle(name_)
+
+    def handle(self, name):
+        """
+        FillHandle of a histogram of the book
+
+        Parameters
+        ----------
+        name : full name of the histogram, algname.name
+        """
+        handle = self._handles.get(name, None)
+        if handle is None:
+            handle = FillHandle(self, name)
+            self._handles[name] = handle
+        return handle
 
     def rebook(self, excludes=[]):
         """
@@ -321,7 +776,8 @@ class ArtemisBook(BaseBook):
                 bins = x.binning
             else:
                 try:
-                    bins = autobinning(timer)
+                    values = timer.values
+                    bins = autobinning(values[~np.isnan(values)])
                 except IndexError:
                     self.__logger.warning("%s fails rebook, use original bins", n)
                     bins = x.binning
@@ -331,26 +787,60 @@ class ArtemisBook(BaseBook):
 
     def _fill_timer(self, algname, name, data):
         name_ = algname + "." + name
-        if isinstance(data, list):
+        if isinstance(data, (list, np.ndarray)):
             self._timers[name_].extend(data)
-        elif isinstance(data, np.ndarray):
-            self._timers[name_].extend(list(data))
         else:
             self._timers[name_].append(data)
 
     def fill(self, algname, name, data):
-        name_ = algname + "." + name
-        if isinstance(data, list):
-            data = np.asarray(data)
-            self._get(name_).fill_n(data)
-        elif isinstance(data, np.ndarray):
-            self._get(name_).fill_n(data)
-        else:
-            self._get(name_).fill(data)
+        """
+        Fill a histogram by name, see book for a FillHandle
+        """
+        self.handle(algname + "." + name).fill(data)
+
+    def fill_many(self, data):
+        """
+        Fill several histograms
+
+        Parameters
+        ----------
+        data : dict of full histogram name, or FillHandle, to values
+        """
+        if self._block is not None:
+            items = [
+                (n.name if isinstance(n, FillHandle) else n, v) for n, v in data.items()
+            ]
+            self._block.fill_many(items)
+            if self._timers and self._rebooked is False:
+                for name, values in items:
+                    if name in self._timers:
+                        self._timers[name].extend(values)
+            return
+        handles = self._handles
+        for name, values in data.items():
+            if isinstance(name, FillHandle):
+                name.fill(values)
+                continue
+            handle = handles.get(name, None)
+            if handle is None:
+                handle = self.handle(name)
+            handle.fill(values)
+
+    def fill_batch(self, batch, columns):
+        """
+        Fill histograms from the columns of a RecordBatch or Table
 
-        if self._rebooked is False:
-            if name_ in self._timers.keys():
-                self._fill_timer(algname, name, data)
+        Parameters
+        ----------
+        batch : pyarrow RecordBatch or Table
+        columns : dict of full histogram name to column name
+        """
+        self.fill_many(
+            {
+                name: batch.column(column).to_numpy(zero_copy_only=False)
+                for name, column in columns.items()
+            }
+        )
 
     def _from_message(self, msg):
 
@@ -416,6 +906,21 @@ class TDigestBook(BaseBook):
 
         self._set(name, value)
 
+    _message = TDigest_store
+
+    @classmethod
+    def merge_all(cls, books):
+        """
+        Merge a list of books, the digests of each name are merged in a tree
+        """
+        digests = collections.OrderedDict()
+        for book in books:
+            for n, x in book._content.items():
+                digests.setdefault(n, []).append(x)
+        return cls(
+            collections.OrderedDict((n, _tree_reduce(x)) for n, x in digests.items())
+        )
+
     def reset(self):
         """
         clear bin contents of all histograms
@@ -0,0 +1,143 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compression codecs of stored objects.
+
+Objects are compressed as a whole in the lz4 or zstd frame format.
+The codec of an object is recorded in the query of its address,
+e.g. ``file:///data/{name}?codec=zstd``, the object metadata alone
+determines how to read it back.
+
+Arrow IPC files and streams are not framed, their record batch buffers are
+compressed by the Arrow writer and stay readable by any Arrow reader.
+"""
+import urllib.parse
+
+import pyarrow as pa
+
+CODECS = ("lz4", "zstd")
+
+# Arrow IPC FileTypes, compressed with Arrow buffer compression
+IPC_TYPES = (5, 6)
+
+# Policy keys are the object info types, plural forms are accepted
+_ALIASES = {"logs": "log", "jobs": "job", "tables": "table", "files": "file"}
+_KINDS = ("menu", "config", "file", "hists", "tdigests", "log", "job", "table")
+
+
+def make_policy(codecs):
+    """
+    Validated codec of each object info type
+
+    Parameters
+    ----------
+    codecs : dict of info type to codec name, None or "none" for no compression
+        e.g. {"hists": "zstd", "file": "lz4"}
+    """
+    policy = dict()
+    for kind, codec in (codecs or dict()).items():
+        kind = _ALIASES.get(kind, kind)
+        if kind not in _KINDS:
+            raise ValueError(f"Unknown object type {kind}")
+        if codec is None or codec == "none":
+            continue
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec}")
+        if not pa.Codec.is_available(codec):
+            raise ValueError(f"Codec {codec} is not available in pyarrow")
+        policy[kind] = codec
+    return policy
+
+
+def address_codec(address):
+    """
+    Codec recorded in an address, None for an uncompressed object
+    """
+    query = urllib.parse.urlparse(address).query
+    if not query:
+        return None
+    return urllib.parse.parse_qs(query).get("codec", [None])[0]
+
+
+def with_codec(address, codec):
+    """
+    Address recording a codec, the fragment of packed objects is kept
+    """
+    url = urllib.parse.urlparse(address)
+    query = "" if codec is None else f"codec={codec}"
+    return urllib.parse.urlunparse(url._replace(query=query))
+
+
+def compress(buf, codec):
+    """
+    Compress a buffer as a single frame
+
+    Returns
+    -------
+    pyarrow Buffer
+    """
+    sink = pa.BufferOutputStream()
+    with pa.CompressedOutputStream(sink, codec) as stream:
+        stream.write(buf)
+    return sink.getvalue()
+
+
+def decompress(buf, codec):
+    """
+    Decompress a frame
+
+    Returns
+    -------
+    pyarrow Buffer
+    """
+    if codec is None:
+        return buf
+    with pa.CompressedInputStream(pa.BufferReader(buf), codec) as stream:
+        return stream.read_buffer()
+
+
+def ipc_options(codec):
+    return pa.ipc.IpcWriteOptions(compression=codec)
+
+
+def recompress_ipc(source, codec, stream=False, sink=None):
+    """
+    Rewrite an Arrow IPC file or stream with compressed record batch buffers
+
+    Batches are read one at a time from the source, a buffer or a seekable
+    file, and written to the sink, e.g. a temporary file. Without a sink
+    the rewritten buffer is returned.
+    """
+    if stream:
+        reader = pa.ipc.open_stream(source)
+        batches = reader
+    else:
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    out = pa.BufferOutputStream() if sink is None else sink
+    if stream:
+        writer = pa.ipc.new_stream(out, reader.schema, options=ipc_options(codec))
+    else:
+        writer = pa.ipc.new_file(out, reader.schema, options=ipc_options(codec))
+    for batch in batches:
+        writer.write_batch(batch)
+    writer.close()
+    if sink is None:
+        return out.getvalue()
@@ -21,10 +21,17 @@
 Interface to the Artemis Metadata Store
 """
 from pathlib import Path
+import collections
+import itertools
+import os
+import tempfile
+import time
 import uuid
-import hashlib
 import urllib.parse
 from dataclasses import dataclass
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
 
 import pyarrow as pa
 import numpy as np
@@ -35,7 +42,45 @@ from artemis_format.pymodels.cronus_pb2 import CronusObject, FileType
 from artemis_format.pymodels.menu_pb2 import Menu as Menu_pb
 from artemis_format.pymodels.configuration_pb2 import Configuration
 from artemis_base.utils.logger import Logger
-from cronus.core.book import BaseBook
+from cronus.core.book import BaseBook, ArtemisBook, TDigestBook
+from cronus.core.book import merge_all, merge_buffers
+from cronus.core.hashing import (
+    HashCache,
+    new_hash,
+    hash_stream,
+    hash_buffer,
+    hash_file,
+    hash_files,
+)
+from cronus.core.journal import (
+    MetaJournal,
+    OP_OBJECT,
+    OP_PARTITION,
+    OP_JOB_IDX,
+    OP_UPDATE,
+    OP_REMOVE,
+)
+from cronus.core.backends import open_backend, SQLiteStore
+from cronus.core.codecs import (
+    IPC_TYPES,
+    make_policy,
+    address_codec,
+    with_codec,
+    compress,
+    decompress,
+    recompress_ipc,
+)
+from cronus.core.metrics import StoreMetrics, nbytes, timed, timer
+from cronus.core.lock import StoreLock, StoreConflictError, read_head, write_head
+from cronus.core.pack import PackWriter, SEGMENT_SIZE, parse_address
+from cronus.core.writer import ObjectWriter, FORMATS
+from cronus.core.index import (
+    StoreIndex,
+    ObjectIndex,
+    scan_store,
+    object_value,
+    encode_objects,
+)
 
 # Import all the info objects to set the oneof of a CronusObject
 # Annoying boiler plate
@@ -51,6 +96,68 @@ from artemis_format.pymodels.cronus_pb2 import (
     TDigestObjectInfo,
 )
 
+# Repeated field of a DatasetObjectInfo holding each type of child object
+# Log objects do not set an info object
+_DATASET_FIELDS = {
+    "file": "files",
+    "hists": "hists",
+    "tdigests": "tdigests",
+    "log": "logs",
+    "job": "jobs",
+    "table": "tables",
+    None: "logs",
+}
+_DATASET_CHILDREN = ("files", "hists", "tdigests", "logs", "jobs", "tables")
+
+# Content persisted as raw bytes by put
+_BUFFER_TYPES = (pa.Buffer, pa.NativeFile, bytes, bytearray, memoryview, np.ndarray)
+
+# Chunk size when copying from a NativeFile
+_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Key suffix of content-addressed blobs, {digest}.{algorithm}.blob
+_BLOB_SUFFIX = ".blob"
+
+# Key suffix of the blobs released by a store, collected as garbage
+_RELEASED_SUFFIX = ".released"
+
+# Key suffix of the serialized Arrow schema of a written file
+_SCHEMA_SUFFIX = ".schema"
+
+# Name of the merged books of a dataset, {dataset}.reduced.{uuid}.{type}
+# Reduced objects are not job outputs and are skipped by later reductions
+_REDUCED = ".reduced."
+
+# Key suffix of the uuids of the objects merged in a reduced object
+_SOURCES_SUFFIX = ".sources"
+
+# Book class of the mergeable objects of a dataset
+_BOOKS = {"hists": ArtemisBook, "tdigests": TDigestBook}
+
+# Field numbers of the store info and of its objects, used to scan a
+# serialized store without parsing the objects
+_INFO_FIELD = CronusObjectStore.DESCRIPTOR.fields_by_name["info"]
+_STORE_FIELDS = (
+    _INFO_FIELD.number,
+    _INFO_FIELD.message_type.fields_by_name["objects"].number,
+)
+
+
+def _blob_key(address):
+    """
+    kv store key of the content-addressed blob of an address, otherwise None
+    """
+    if _BLOB_SUFFIX not in address:
+        return None
+    path = urllib.parse.unquote(urllib.parse.urlparse(address).path)
+    if not path.endswith(_BLOB_SUFFIX):
+        return None
+    return os.path.basename(path)
+
+
+def _to_bytes(buf):
+    return buf if isinstance(buf, bytes) else buf.to_pybytes()
+
 
 @dataclass
 class MetaObject:
@@ -80,20 +187,109 @@ class BaseObjectStore(BaseBook):
         storetype="hfs",
         algorithm="sha1",
         alt_root=None,
+        journal=False,
+        journal_threshold=100000,
+        lazy=False,
+        hash_workers=1,
+        hash_processes=False,
+        hash_cache=False,
+        memory_map=False,
+        store_options=None,
+        pack=False,
+        pack_segment_size=SEGMENT_SIZE,
+        dedup=False,
+        codecs=None,
+        concurrent=False,
+        lock_timeout=None,
+        read_only=False,
+        metrics=None,
     ):
         """
         Loads a base store type
         Requires a root path where the store resides
         Create a store from persisted data
         Or create a new one
+
+        Parameters
+        ----------
+        storetype : kv store backend, e.g. hfs, memory, sqlite or s3,
+            see cronus.core.backends
+        store_options : dict of backend specific options
+        journal : record registrations in an append-only journal,
+            save_store only writes the new records
+        journal_threshold : number of journal records before save_store
+            compacts the journal into the store snapshot
+        lazy : open a persisted store with its side index,
+            objects are parsed when first accessed
+        algorithm : hash algorithm of on-disk files, e.g. sha1, blake2b, xxh64
+        hash_workers : number of files hashed concurrently when registering
+            a directory
+        hash_processes : hash files in a process pool rather than a thread pool
+        hash_cache : keep a persistent cache of on-disk file digests beside
+            the metastore, unchanged files are not rehashed
+        memory_map : get and open local objects through a memory map,
+            reads do not copy the object into memory
+        pack : append histograms, tdigests and job summaries to per-dataset
+            pack segments rather than writing a file per object
+        pack_segment_size : size in bytes of a pack segment
+        dedup : store buffers as content-addressed blobs, objects with
+            identical content share a single blob
+        codecs : dict of object type to compression codec, lz4 or zstd,
+            e.g. {"hists": "zstd", "file": "lz4"}
+        concurrent : share the store with writers in other processes,
+            commits are serialized by a lock file and rebased on the
+            commits of the other writers, implies journal
+        lock_timeout : seconds to wait for the lock of a concurrent store,
+            None to wait indefinitely
+        read_only : the metastore is not persisted, e.g. by the workers
+            of a JobRunner, objects are still written to the kv store
+        metrics : StoreMetrics registry recording the store operations,
+            True for a new registry, None to disable
         """
+        if metrics is True:
+            metrics = StoreMetrics()
+        self._metrics = metrics or None
+        # Unparsed objects of a lazily loaded store
+        self._lazy_buf = None
+        self._lazy_spans = dict()
+        self._lazy_parents = dict()
+        # Secondary indexes, maintained by _set and _del
+        self._index = ObjectIndex()
+        # Number of objects referencing each content-addressed blob
+        self._blob_refs = collections.Counter()
+        # kv keys of removed objects, deleted once save_store commits
+        self._trash = []
+        # Blobs whose last reference this store removed, and the persisted set
+        self._released = set()
+        self._released_saved = set()
+
         self._mstore = CronusObjectStore()
-        self._dstore = FilesystemStore(f"{root}")
+        self._dstore = open_backend(storetype, root, **(store_options or dict()))
         self._alt_dstore = None
         if alt_root is not None:
             self.__logger.info("Create alternative data store location")
             self._alt_dstore = FilesystemStore(f"{alt_root}")
+        new_hash(algorithm)  # Validate the algorithm
         self._algorithm = algorithm
+        self._hash_workers = hash_workers
+        self._hash_processes = hash_processes
+        self._memory_map = memory_map
+        self._dedup = dedup
+        self._codecs = make_policy(codecs)
+        self._pack_segment_size = pack_segment_size
+        self._packer = None
+        if pack is True:
+            self._packer = PackWriter(self._dstore, pack_segment_size)
+        self._read_only = read_only
+        # Head of the store seen by a concurrent writer
+        self._store_lock = None
+        self._generation = 0
+        self._epoch = 0
+        # Committed version of the objects changed by pending records,
+        # None for new objects, compared with the commits of other writers
+        self._committed = dict()
+        if concurrent is True:
+            journal = True
         if store_uuid is None:
             # Generate a new store
             self.__logger.info("Generating new metastore")
@@ -106,7 +302,14 @@ class BaseObjectStore(BaseBook):
             self.__logger.info("Created on %s", self._mstore.info.created.ToDatetime())
         elif store_uuid is not None:
             self.__logger.info("Load metastore from path")
-            self._load_from_path(name, store_uuid)
+            if concurrent is True:
+                # Held until the journal is replayed, writes are not atomic
+                self._store_lock = StoreLock(
+                    self._lock_path(f"{name}.lock"), lock_timeout
+                )
+                self._store_lock.acquire()
+                self._generation, self._epoch = read_head(self._dstore, f"{name}.head")
+            self._load_from_path(name, store_uuid, lazy)
         else:
             self.__logger.error(
                 "Cannot retrieve store: %s from datastore %s", store_uuid, root
@@ -121,6 +324,13 @@ class BaseObjectStore(BaseBook):
 
         self._dups = dict()
         self._child_stores = dict()
+        self._journal = None
+        self._journal_threshold = journal_threshold
+        self._hash_cache = None
+        if hash_cache is True:
+            self._hash_cache = HashCache(self._dstore, f"{self._name}.hashcache")
+        if store_uuid is not None:
+            self._load_released()
 
         objects = dict()
 
@@ -143,6 +353,22 @@ class BaseObjectStore(BaseBook):
 
         super().__init__(objects)
 
+        # A store with a journal on disk is always reopened in journal mode
+        journal_key = f"{self._name}.journal"
+        if store_uuid is not None and journal_key in self._dstore:
+            journal = True
+        if journal is True:
+            self._journal = MetaJournal(self._dstore, journal_key)
+            if store_uuid is not None:
+                self._replay_journal()
+        if concurrent is True:
+            if self._store_lock is None:
+                self._store_lock = StoreLock(
+                    self._lock_path(f"{self._name}.lock"), lock_timeout
+                )
+            else:
+                self._store_lock.release()
+
     @property
     def store_name(self):
         return self._name
@@ -159,7 +385,26 @@ class BaseObjectStore(BaseBook):
     def store_aux(self):
         return self._aux
 
-    def _load_from_path(self, name, id_):
+    @property
+    def metrics(self):
+        """
+        StoreMetrics registry of the store operations, None when disabled
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        self._metrics = metrics
+
+    @property
+    def hash_cache(self):
+        """
+        Cache of on-disk file digests, reports hit and miss counters
+        """
+        return self._hash_cache
+
+    @timed("load")
+    def _load_from_path(self, name, id_, lazy=False):
         self.__logger.info("Loading from path")
         try:
             buf = self._dstore.get(name)
@@ -170,17 +415,484 @@ class BaseObjectStore(BaseBook):
             self.__logger.error("Unknown error")
             raise
 
-        self._mstore.ParseFromString(buf)
+        index = None
+        if lazy is True:
+            index = StoreIndex.load(self._dstore, f"{name}.index", buf)
+        if index is None:
+            self._mstore.ParseFromString(buf)
+        else:
+            # Parse the store header only, objects are parsed on access
+            header, spans = scan_store(buf, *_STORE_FIELDS)
+            self._lazy_spans = index.spans()
+            if len(spans) != len(self._lazy_spans):
+                self.__logger.error("Index does not match the store %s", name)
+                raise ValueError
+            self._mstore.ParseFromString(header)
+            self._lazy_buf = buf
+            self._lazy_parents = index.parents()
         if name != self._mstore.name:
             self.__logger.error(
                 "Store name expected: %s received: %s", self._name, name
             )
             raise ValueError
 
-    def save_store(self):
+    @timed("replay")
+    def _replay_journal(self):
+        """
+        Apply the journal records on top of the loaded snapshot
+        Replay is idempotent, records already folded in the snapshot are skipped
+        """
+        self.__logger.info("Replaying journal %s", self._journal.key)
+        for record in self._journal.records():
+            self._apply_record(*record)
+        self.__logger.info("Replayed %s records", self._journal.num_records)
+
+    def _apply_record(self, op, parent, field, payload):
+        """
+        Apply a journal record, records already applied are skipped
+        """
+        if op == OP_OBJECT:
+            obj = CronusObject()
+            obj.ParseFromString(payload)
+            if obj.uuid in self:
+                return
+            if parent:
+                _new = getattr(self[parent].dataset, field).add()
+            else:
+                _new = self._mstore.info.objects.add()
+            _new.CopyFrom(obj)
+            self._set(_new.uuid, _new)
+        elif op == OP_PARTITION:
+            if field not in self[parent].dataset.partitions:
+                self[parent].dataset.partitions.append(field)
+        elif op == OP_JOB_IDX:
+            dataset = self[parent].dataset
+            dataset.job_idx = max(dataset.job_idx, MetaJournal.job_idx(payload))
+        elif op == OP_UPDATE:
+            obj = CronusObject()
+            obj.ParseFromString(payload)
+            self._update_object(obj)
+        elif op == OP_REMOVE:
+            if self._get(payload.decode()) is not None:
+                self._discard(payload.decode())
+        else:
+            self.__logger.error("Unknown journal record %s", op)
+            raise ValueError
+
+    def _lock_path(self, key):
+        """
+        Path of the lock file of a concurrent store
+        """
+        path = self._local_path(key)
+        if path is None and isinstance(self._dstore, SQLiteStore):
+            path = os.path.join(os.path.dirname(self._dstore.path), key)
+        if path is None:
+            self.__logger.error("Concurrent writers require a local store")
+            raise ValueError
+        return path
+
+    def _commit(self, compact=False):
+        """
+        Compare-and-swap commit of the pending records of a concurrent store
+
+        Under the store lock, the commits of other writers since the last
+        commit or load are applied first, then the pending records are
+        appended and the generation is incremented.
+        """
+        head_key = f"{self._name}.head"
+        with self._store_lock:
+            generation, epoch = read_head(self._dstore, head_key)
+            if generation != self._generation:
+                self._rebase(epoch)
+                self._generation = generation
+                self._epoch = epoch
+            if not compact and self._journal.num_pending == 0:
+                self._committed = dict()
+                return
+            if (
+                compact
+                or self._mstore.name not in self._dstore
+                or self._journal.num_records + self._journal.num_pending
+                >= self._journal_threshold
+            ):
+                self._write_snapshot()
+                self._journal.reset()
+                self._epoch += 1
+            else:
+                self._journal.flush()
+            self._generation += 1
+            write_head(self._dstore, head_key, self._generation, self._epoch)
+            self._committed = dict()
+
+    def _rebase(self, epoch):
+        """
+        Apply the commits of other writers beneath the pending records
+
+        Raises StoreConflictError if another writer changed an object
+        that is also changed by a pending record.
+        """
+        pending = list(self._journal.pending())
+        # Pending version of the changed objects, None for removed objects
+        mine = dict()
+        for op, _, _, payload in pending:
+            if op in (OP_OBJECT, OP_UPDATE):
+                obj = CronusObject()
+                obj.ParseFromString(payload)
+                mine[obj.uuid] = obj
+            elif op == OP_REMOVE:
+                mine[payload.decode()] = None
+        start = self._journal.size
+        if epoch != self._epoch:
+            # Another writer compacted the journal, merge the new snapshot
+            # and replay the journal from its start. Records already seen
+            # are replayed too, the pending records take precedence.
+            self.__logger.info("Rebase on snapshot %s", self._mstore.name)
+            snapshot = CronusObjectStore()
+            snapshot.ParseFromString(self._dstore.get(self._mstore.name))
+            self._check_snapshot(snapshot, mine)
+            self._merge_snapshot(snapshot)
+            start = 0
+        for op, parent, field, payload in self._journal.records(start):
+            if op in (OP_OBJECT, OP_UPDATE):
+                obj = CronusObject()
+                obj.ParseFromString(payload)
+                if obj.uuid in mine and mine[obj.uuid] != obj:
+                    self.__logger.error("Conflicting change of %s", obj.uuid)
+                    raise StoreConflictError(obj.uuid)
+            elif op == OP_REMOVE and mine.get(payload.decode(), None) is not None:
+                self.__logger.error("Conflicting removal of %s", payload.decode())
+                raise StoreConflictError(payload.decode())
+            self._apply_record(op, parent, field, payload)
+        for record in pending:
+            self._apply_record(*record)
+
+    def _check_snapshot(self, snapshot, mine):
+        """
+        Compare the pending objects with a snapshot of another writer
+
+        An object diverges when the snapshot holds neither its committed
+        version nor its pending version, e.g. it was changed or removed
+        by another writer before the journal was compacted.
+        """
+        theirs = dict()
+        for obj in snapshot.info.objects:
+            if obj.uuid in mine:
+                theirs[obj.uuid] = obj
+            if obj.WhichOneof("info") == "dataset":
+                for field in _DATASET_CHILDREN:
+                    for child in getattr(obj.dataset, field):
+                        if child.uuid in mine:
+                            theirs[child.uuid] = child
+        for id_, obj in mine.items():
+            base = self._committed.get(id_, None)
+            other = theirs.get(id_, None)
+            if other is None:
+                diverged = base is not None and obj is not None
+            else:
+                diverged = other != base and other != obj
+            if diverged:
+                self.__logger.error("Conflicting change of %s", id_)
+                raise StoreConflictError(id_)
+
+    def _track(self, obj):
+        """
+        Keep the committed version of an object before a pending change
+        """
+        if self._store_lock is not None and obj.uuid not in self._committed:
+            committed = CronusObject()
+            committed.CopyFrom(obj)
+            self._committed[obj.uuid] = committed
+
+    def _merge_snapshot(self, snapshot):
+        """
+        Add the objects of a parsed snapshot missing from the store,
+        objects changed in the snapshot are replaced
+        """
+        for obj in snapshot.info.objects:
+            current = self._get(obj.uuid)
+            if current is None:
+                _new = self._mstore.info.objects.add()
+                _new.CopyFrom(obj)
+                self._set(_new.uuid, _new)
+                if _new.WhichOneof("info") == "dataset":
+                    for field in _DATASET_CHILDREN:
+                        for child in getattr(_new.dataset, field):
+                            self._set(child.uuid, child)
+            elif obj.WhichOneof("info") == "dataset":
+                dataset = current.dataset
+                for key in obj.dataset.partitions:
+                    if key not in dataset.partitions:
+                        dataset.partitions.append(key)
+                dataset.job_idx = max(dataset.job_idx, obj.dataset.job_idx)
+                for field in _DATASET_CHILDREN:
+                    for child in getattr(obj.dataset, field):
+                        if self._get(child.uuid) is None:
+                            _new = getattr(dataset, field).add()
+                            _new.CopyFrom(child)
+                            self._set(_new.uuid, _new)
+                        elif self[child.uuid] != child:
+                            self._update_object(child)
+            elif current != obj:
+                self._update_object(obj)
+
+    def _materialize(self, id_):
+        """
+        Parse an object of a lazily loaded store
+        Datasets are parsed with all their children
+        """
+        if id_ in self._lazy_parents:
+            self._materialize(self._lazy_parents[id_])
+            return self._content.get(id_, None)
+        span = self._lazy_spans.pop(id_, None)
+        if span is None:
+            return None
+        obj = self._mstore.info.objects.add()
+        obj.ParseFromString(object_value(self._lazy_buf, span[0]))
+        self._set(obj.uuid, obj)
+        if obj.WhichOneof("info") == "dataset":
+            for field in _DATASET_CHILDREN:
+                for child in getattr(obj.dataset, field):
+                    self._lazy_parents.pop(child.uuid, None)
+                    self._set(child.uuid, child)
+        return obj
+
+    def _materialize_all(self):
+        for id_ in list(self._lazy_spans):
+            self._materialize(id_)
+        self._lazy_buf = None
+
+    def _get(self, name):
+        attempt = self._content.get(name, None)
+        if attempt is None and self._lazy_buf is not None:
+            attempt = self._materialize(name)
+        return attempt
+
+    def _set(self, name, value):
+        super()._set(name, value)
+        self._index.add(name, value)
+        self._ref_blob(value, 1)
+
+    def _del(self, name):
+        value = self._content.get(name, None)
+        super()._del(name)
+        self._index.remove(name, value)
+        self._ref_blob(value, -1)
+
+    def _discard(self, id_):
+        """
+        Remove an object from its parent and from the store
+
+        Returns
+        -------
+        name of the repeated field holding the object
+        """
+        obj = self[id_]
+        if obj.parent_uuid == self._uuid:
+            field = "objects"
+            container = self._mstore.info.objects
+        else:
+            field = _DATASET_FIELDS[obj.WhichOneof("info")]
+            container = getattr(self[obj.parent_uuid].dataset, field)
+        self._del(id_)
+        for i, child in enumerate(container):
+            if child.uuid == id_:
+                del container[i]
+                break
+        return field
+
+    def _remove(self, id_):
+        """
+        Remove an object, the removal is journaled
+        """
+        parent = self[id_].parent_uuid
+        self._track(self[id_])
+        field = self._discard(id_)
+        if self._journal is not None:
+            self._journal.record_remove(
+                id_, field, "" if parent == self._uuid else parent
+            )
+
+    def _ref_blob(self, obj, count):
+        key = _blob_key(obj.address)
+        if key is not None:
+            self._blob_refs[key] += count
+            if self._blob_refs[key] <= 0:
+                del self._blob_refs[key]
+                self._released.add(key)
+            else:
+                self._released.discard(key)
+
+    def _load_released(self):
+        try:
+            data = self._dstore.get(f"{self._name}{_RELEASED_SUFFIX}")
+        except KeyError:
+            return
+        self._released_saved = set(data.decode().split())
+        self._released.update(self._released_saved)
+
+    def _save_released(self):
+        """
+        Persist the released blobs, collected by a later collect_garbage
+        """
+        if self._released == self._released_saved:
+            return
+        key = f"{self._name}{_RELEASED_SUFFIX}"
+        if self._released:
+            self._dstore.put(key, "\n".join(sorted(self._released)).encode())
+        elif key in self._dstore:
+            self._dstore.delete(key)
+        self._released_saved = set(self._released)
+
+    def _update_object(self, obj):
+        """
+        Replace the metadata of an existing object
+        """
+        current = self[obj.uuid]
+        self._ref_blob(current, -1)
+        current.CopyFrom(obj)
+        self._ref_blob(current, 1)
+
+    def __len__(self):
+        return len(self._content) + len(self._lazy_spans) + len(self._lazy_parents)
+
+    def __iter__(self):
+        self._materialize_all()
+        return super().__iter__()
+
+    def _iter_keys(self):
+        self._materialize_all()
+        return super()._iter_keys()
+
+    def _iter_values(self):
+        self._materialize_all()
+        return super()._iter_values()
+
+    def items(self):
+        self._materialize_all()
+        return super().items()
+
+    def _serialize_store(self):
+        """
+        Serialize the metastore
+        Unparsed objects of a lazily loaded store are copied as is
+        """
         buf = self._mstore.SerializeToString()
+        if self._lazy_spans:
+            buf += encode_objects(
+                _STORE_FIELDS[0],
+                [self._lazy_buf[start:end] for start, end in self._lazy_spans.values()],
+            )
+        return buf
+
+    def _write_index(self, buf):
+        """
+        Persist the side index of a snapshot
+        """
+        _, spans = scan_store(buf, *_STORE_FIELDS)
+        top = [obj.uuid for obj in self._mstore.info.objects]
+        top.extend(self._lazy_spans)
+        uuids = list(top)
+        datasets = [""] * len(top)
+        starts = [start for start, _ in spans]
+        ends = [end for _, end in spans]
+        for obj in self._mstore.info.objects:
+            if obj.WhichOneof("info") != "dataset":
+                continue
+            for field in _DATASET_CHILDREN:
+                for child in getattr(obj.dataset, field):
+                    uuids.append(child.uuid)
+                    datasets.append(obj.uuid)
+        uuids.extend(self._lazy_parents)
+        datasets.extend(self._lazy_parents.values())
+        starts.extend([-1] * (len(uuids) - len(starts)))
+        ends.extend([-1] * (len(uuids) - len(ends)))
+        StoreIndex(uuids, datasets, starts, ends).write(
+            self._dstore, f"{self._name}.index", buf
+        )
+
+        if self._lazy_buf is not None:
+            # Unparsed objects now refer to the new snapshot
+            self._lazy_buf = buf
+            self._lazy_spans = dict(
+                zip(self._lazy_spans, spans[len(self._mstore.info.objects) :])
+            )
+
+    def _write_snapshot(self):
+        buf = self._serialize_store()
         self._dstore.put(self._mstore.name, buf)
+        self._write_index(buf)
 
+    @timed("save")
+    def save_store(self):
+        """
+        Persist the metastore
+        A journaled store only appends the new records, the journal is
+        folded into the snapshot once it exceeds the journal threshold
+        """
+        if self._read_only is True:
+            self.__logger.error("Store %s is read only", self._name)
+            raise ValueError
+        if self._hash_cache is not None:
+            self._hash_cache.save()
+        self._save_released()
+        if self._packer is not None:
+            self._packer.flush()
+        if self._store_lock is not None:
+            self._commit()
+        elif self._journal is None:
+            self._write_snapshot()
+        elif (
+            self._mstore.name not in self._dstore
+            or self._journal.num_records + self._journal.num_pending
+            >= self._journal_threshold
+        ):
+            self.compact_store()
+        else:
+            self._journal.flush()
+        self._empty_trash()
+
+    def compact_store(self):
+        """
+        Write a full snapshot of the metastore and drop the journal
+        """
+        if self._read_only is True:
+            self.__logger.error("Store %s is read only", self._name)
+            raise ValueError
+        if self._store_lock is not None:
+            self._commit(compact=True)
+        else:
+            self._write_snapshot()
+            if self._journal is not None:
+                self._journal.reset()
+        self._empty_trash()
+
+    def _empty_trash(self):
+        """
+        Delete the content of removed objects, no longer referenced
+        by the persisted metastore
+        """
+        for key in self._trash:
+            if key in self._dstore:
+                self._dstore.delete(key)
+        self._trash = []
+
+    def close(self):
+        """
+        Release the connections of the kv store backends
+        The metastore is not saved, call save_store first
+        """
+        for dstore in (self._dstore, self._alt_dstore):
+            close = getattr(dstore, "close", None)
+            if close is not None:
+                close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @timed("register")
     def register_content(self, content, info, **kwargs):
         """
         Returns a dataclass representing the content object
@@ -404,67 +1116,163 @@ class BaseObjectStore(BaseBook):
         obj.uuid = str(uuid.uuid4())
         obj.name = f"{dataset_id}.job_{job_id}.{obj.uuid}.log"
         obj.parent_uuid = dataset_id
-        obj.address = self._dstore.url_for(obj.name)
+        obj.address = self._url_for(obj.name, "log")
         self[obj.uuid] = obj
         return MetaObject(obj.name, obj.uuid, obj.parent_uuid, obj.address)
 
+    def register_many(self, contents, info, dataset_id, job_id, partition_key):
+        """
+        Register a batch of partition files or tables of a job
+
+        The dataset and partitions are validated once per batch
+        and the metadata objects are added to the dataset in bulk.
+
+        Parameters
+        ----------
+        contents : list of buffers for files, list of table messages for tables
+        info : FileObjectInfo or TableObjectInfo common to the batch
+        dataset_id : uuid of dataset
+        job_id : job index
+        partition_key : partition of the batch, or list of partitions
+            aligned with contents
+
+        Returns
+        -------
+        pyarrow RecordBatch with name, uuid, parent_uuid and address columns
+        """
+        if isinstance(partition_key, str):
+            partition_keys = [partition_key] * len(contents)
+        else:
+            partition_keys = list(partition_key)
+            if len(partition_keys) != len(contents):
+                self.__logger.error("Partition keys do not match the contents")
+                raise ValueError
+
+        dataset = self[dataset_id].dataset
+        missing = set(partition_keys).difference(dataset.partitions)
+        if missing:
+            self.__logger.error(
+                "Partitions %s not registered for dataset %s", missing, dataset_id
+            )
+            raise ValueError
+
+        self.__logger.debug("Registering %s objects", len(contents))
+        objs = []
+        if isinstance(info, FileObjectInfo):
+            field = dataset.files
+            key = str(FileType.Name(info.type)).lower()
+            uuids = set()
+            for key_ in partition_keys:
+                obj = CronusObject()
+                obj.uuid = str(uuid.uuid4())
+                while obj.uuid in self or obj.uuid in uuids:
+                    obj.uuid = str(uuid.uuid4())
+                uuids.add(obj.uuid)
+                obj.name = f"{dataset_id}.job_{job_id}.part_{key_}.{obj.uuid}.{key}"
+                obj.parent_uuid = dataset_id
+                obj.address = self._url_for(obj.name, "file", info.type)
+                obj.file.CopyFrom(info)
+                objs.append(obj)
+        elif isinstance(info, TableObjectInfo):
+            field = dataset.tables
+            # The batch is validated before any object is added or written
+            counts = collections.Counter(table.uuid for table in contents)
+            duplicates = [id_ for id_, n in counts.items() if n > 1 or id_ in self]
+            if duplicates:
+                self.__logger.error("Keys exist %s", duplicates)
+                raise ValueError
+            for table in contents:
+                obj = CronusObject()
+                obj.uuid = table.uuid
+                obj.name = table.name
+                obj.parent_uuid = dataset_id
+                obj.address = self._url_for(obj.name, "table")
+                obj.table.CopyFrom(info)
+                objs.append(obj)
+        else:
+            self.__logger.error("Batch registration of files or tables only")
+            raise TypeError
+
+        field.extend(objs)
+        objs = field[len(field) - len(objs) :]
+        for obj in objs:
+            self._add(obj.uuid, obj)
+        if isinstance(info, TableObjectInfo):
+            for table, obj in zip(contents, objs):
+                self._put_message(obj.uuid, table)
+
+        return pa.RecordBatch.from_arrays(
+            [
+                pa.array([obj.name for obj in objs], pa.string()),
+                pa.array([obj.uuid for obj in objs], pa.string()),
+                pa.array([dataset_id] * len(objs), pa.string()).dictionary_encode(),
+                pa.array([obj.address for obj in objs], pa.string()),
+            ],
+            ["name", "uuid", "parent_uuid", "address"],
+        )
+
     def update_dataset(self, dataset_id, buf):
         """
+        Add the objects of a serialized dataset delta, e.g. the output of a job
+
+        Parameters
+        ----------
+        dataset_id : uuid of dataset
+        buf : serialized DatasetObjectInfo
         """
         _update = DatasetObjectInfo()
         _update.ParseFromString(buf)
+        self.merge_datasets([(dataset_id, _update)])
 
-        parts = self[dataset_id].dataset.partitions
+    def merge_datasets(self, deltas):
+        """
+        Add the objects of many dataset deltas in a single batched pass
 
-        if parts != _update.partitions:
-            self.__logger.error("Paritions not equal")
-            self.__logger.error("Dataset %s", dataset_id)
-            self.__logger.error("Expected: %s", parts)
-            self.__logger.error(_update.partitions)
-        objs = []
-        for obj in _update.jobs:
-            _new = self[dataset_id].dataset.jobs.add()
-            _new.CopyFrom(obj)
-            self[_new.uuid] = _new
-            objs.append(
-                MetaObject(_new.name, _new.uuid, _new.parent_uuid, _new.address)
-            )
-        for obj in _update.hists:
-            _new = self[dataset_id].dataset.hists.add()
-            _new.CopyFrom(obj)
-            self[_new.uuid] = _new
-            objs.append(
-                MetaObject(_new.name, _new.uuid, _new.parent_uuid, _new.address)
-            )
+        Objects are appended in bulk to each dataset field, the dataset is
+        looked up once. Objects already in the store, e.g. from a job
+        submitted twice, are skipped.
 
-        for obj in _update.tdigests:
-            _new = self[dataset_id].dataset.tdigests.add()
-            _new.CopyFrom(obj)
-            self[_new.uuid] = _new
-            objs.append(
-                MetaObject(_new.name, _new.uuid, _new.parent_uuid, _new.address)
-            )
-        for obj in _update.files:
-            _new = self[dataset_id].dataset.files.add()
-            _new.CopyFrom(obj)
-            self[_new.uuid] = _new
-            objs.append(
-                MetaObject(_new.name, _new.uuid, _new.parent_uuid, _new.address)
-            )
-        for obj in _update.logs:
-            _new = self[dataset_id].dataset.logs.add()
-            _new.CopyFrom(obj)
-            self[_new.uuid] = _new
-            objs.append(
-                MetaObject(_new.name, _new.uuid, _new.parent_uuid, _new.address)
-            )
-        for obj in _update.tables:
-            _new = self[dataset_id].dataset.logs.add()
-            _new.CopyFrom(obj)
-            self[_new.uuid] = _new
-            objs.append(
-                MetaObject(_new.name, _new.uuid, _new.parent_uuid, _new.address)
-            )
+        Parameters
+        ----------
+        deltas : iterable of (dataset uuid, DatasetObjectInfo)
+
+        Returns
+        -------
+        dict of number of objects added and of duplicates skipped
+        """
+        grouped = collections.defaultdict(list)
+        for dataset_id, delta in deltas:
+            grouped[dataset_id].append(delta)
+
+        stats = {"added": 0, "duplicates": 0}
+        seen = set()
+        for dataset_id, updates in grouped.items():
+            dataset = self[dataset_id].dataset
+            parts = dataset.partitions
+            for _update in updates:
+                if parts != _update.partitions:
+                    self.__logger.error("Paritions not equal")
+                    self.__logger.error("Dataset %s", dataset_id)
+                    self.__logger.error("Expected: %s", parts)
+                    self.__logger.error(_update.partitions)
+            for field in ("jobs", "hists", "tdigests", "files", "logs", "tables"):
+                objs = []
+                for _update in updates:
+                    for obj in getattr(_update, field):
+                        if obj.uuid in seen or self._get(obj.uuid) is not None:
+                            self.__logger.warning("Skip duplicate %s", obj.uuid)
+                            stats["duplicates"] += 1
+                            continue
+                        seen.add(obj.uuid)
+                        objs.append(obj)
+                if not objs:
+                    continue
+                container = getattr(dataset, field)
+                container.extend(objs)
+                for _new in container[len(container) - len(objs) :]:
+                    self._add(_new.uuid, _new)
+                stats["added"] += len(objs)
+        return stats
 
     def new_job(self, dataset_id):
         """
@@ -474,8 +1282,21 @@ class BaseObjectStore(BaseBook):
         ----------
         dataset_id : uuid of a registered dataset
         """
+        if self._store_lock is not None:
+            # Allocated and committed under the lock,
+            # job indices are unique across the writers
+            with self._store_lock:
+                self._commit()
+                job_idx = self._new_job(dataset_id)
+                self._commit()
+            return job_idx
+        return self._new_job(dataset_id)
+
+    def _new_job(self, dataset_id):
         job_idx = self[dataset_id].dataset.job_idx
         self[dataset_id].dataset.job_idx += 1
+        if self._journal is not None:
+            self._journal.record_job_idx(dataset_id, job_idx + 1)
         return job_idx
 
     def new_partition(self, dataset_id, partition_key):
@@ -493,23 +1314,30 @@ class BaseObjectStore(BaseBook):
 
         """
         self[dataset_id].dataset.partitions.append(partition_key)
+        if self._journal is not None:
+            self._journal.record_partition(dataset_id, partition_key)
 
+    @timed("put", size=lambda result, id_, content: nbytes(content))
     def put(self, id_, content):
         """
         Writes data to kv store
         Support for:
         data wrapped as a pyarrow Buffer
+        any object supporting the buffer protocol, e.g. bytes or numpy array
+        pyarrow NativeFile, e.g. a BufferReader or memory map, read in chunks
         protocol buffer message
 
+        Buffers are written without an intermediate copy
+
         Parameters
         ----------
         id_ : uuid of object
-        content : pyarrow Buffer or protobuf msg
+        content : pyarrow Buffer, buffer-like object, NativeFile or protobuf msg
 
         Returns
         ----------
         """
-        if type(content) is pa.lib.Buffer:
+        if isinstance(content, _BUFFER_TYPES):
             try:
                 self._put_object(id_, content)
             except Exception:
@@ -520,6 +1348,115 @@ class BaseObjectStore(BaseBook):
             except Exception:
                 raise
 
+    def open_writer(self, id_, schema, format="file"):
+        """
+        Open a RecordBatch writer streaming into a registered file object
+
+        Batches are written to a temporary file as they are received,
+        the file replaces the object content and the object metadata,
+        e.g. schema, number of rows and size, is finalized when the writer
+        is closed.
+
+        Parameters
+        ----------
+        id_ : uuid of a file object, e.g. registered with register_content
+            without content
+        schema : pyarrow schema of the batches
+        format : "file" for a RecordBatchFile, "stream" for a RecordBatchStream
+
+        Returns
+        ----------
+        ObjectWriter, to be closed or used as a context manager
+        """
+        if format not in FORMATS:
+            self.__logger.error("Unknown ipc format %s", format)
+            raise ValueError
+        obj = self[id_]
+        if obj.WhichOneof("info") != "file":
+            self.__logger.error("Object %s is not a file", id_)
+            raise TypeError
+        if obj.file.type != FORMATS[format]:
+            self.__logger.error(
+                "Format %s does not match file type %s", format, obj.file.type
+            )
+            raise ValueError
+
+        target = self._local_path(obj.name)
+        codec = self._codecs.get("file", None)
+        if target is not None:
+            dirname = os.path.dirname(target)
+            os.makedirs(dirname, exist_ok=True)
+            path = os.path.join(dirname, f".tmp-{uuid.uuid4().hex}")
+
+            def commit():
+                os.replace(path, target)
+
+            return ObjectWriter(self, id_, schema, format, path, commit, codec)
+
+        # kv stores without a local path receive the file on close
+        fd, path = tempfile.mkstemp(suffix=".arrow")
+        os.close(fd)
+
+        def commit():
+            try:
+                self._dstore.put_file(obj.name, path)
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)
+
+        return ObjectWriter(self, id_, schema, format, path, commit, codec)
+
+    def file_schema(self, id_):
+        """
+        Arrow schema of a file written with open_writer, otherwise None
+        """
+        try:
+            buf = self._dstore.get(self[id_].name + _SCHEMA_SUFFIX)
+        except KeyError:
+            return None
+        return pa.ipc.read_schema(pa.py_buffer(buf))
+
+    def _finalize_file(self, id_, schema=None, **kwargs):
+        """
+        Record the properties of a written file in its metadata
+
+        The file aux message has no schema field, the serialized schema
+        is persisted next to the object, see file_schema
+
+        Parameters
+        ----------
+        id_ : uuid of the file object
+        schema : pyarrow schema of the file
+        kwargs : fields of the file aux message
+        """
+        obj = self[id_]
+        aux = obj.file.aux
+        fields = aux.DESCRIPTOR.fields_by_name
+        unknown = set(kwargs).difference(fields)
+        if unknown:
+            self.__logger.error("Unknown file properties %s", unknown)
+            raise ValueError
+        self._track(obj)
+        for key, value in kwargs.items():
+            setattr(aux, key, value)
+        if schema is not None:
+            self._dstore.put(obj.name + _SCHEMA_SUFFIX, schema.serialize().to_pybytes())
+        path = self._local_path(obj.name)
+        if self._dedup is True and path is not None:
+            # Move the written file to its blob, or drop it for a known blob
+            with timer(self._metrics, "hash"):
+                digest = hash_file(path, self._algorithm)
+            key = self._blob_for(digest)
+            blob_path = self._local_path(key)
+            if os.path.exists(blob_path):
+                os.remove(path)
+            else:
+                os.replace(path, blob_path)
+            self._link(obj, key, journal=False)
+        if self._journal is not None:
+            self._journal.record_update(obj)
+
+    @timed("get", size=lambda result, id_, msg=None: nbytes(result or msg))
     def get(self, id_, msg=None):
         """
         Retrieves data from kv store
@@ -535,7 +1472,8 @@ class BaseObjectStore(BaseBook):
 
         Returns
         ---------
-        In-memory buffer of data
+        In-memory buffer of data,
+        a pyarrow Buffer over a memory map for a memory mapped store
         Deserialized protobuf message in python class instance
 
         Note:
@@ -547,6 +1485,66 @@ class BaseObjectStore(BaseBook):
         else:
             self._get_message(id_, msg)
 
+    def get_many(self, ids_, msg_cls=None, workers=8, ordered=True, prefetch=None):
+        """
+        Retrieve many objects, streaming the results as they are read
+
+        Backend reads and protobuf parsing run on a thread pool,
+        the metadata lookups are done upfront in the calling thread.
+        At most prefetch objects are held in memory ahead of the consumer.
+
+        Parameters
+        ----------
+        ids_ : iterable of uuids
+        msg_cls : protobuf message class to parse the objects into,
+            None to retrieve the buffers
+        workers : number of concurrent reads
+        ordered : yield in the order of the uuids, otherwise as completed
+        prefetch : maximum number of objects read ahead, default 2 * workers
+
+        Yields
+        ------
+        tuple of uuid, buffer or parsed message
+        """
+        requests = [(id_, *self._locate(id_)) for id_ in ids_]
+        if prefetch is None:
+            prefetch = 2 * workers
+
+        def fetch(request):
+            id_, key, path, span, codec = request
+            if msg_cls is None:
+                return id_, self._read_object(key, path, span, codec)
+            msg = msg_cls()
+            try:
+                msg.ParseFromString(self._read_message(key, span, codec))
+            except KeyError:
+                self.__logger.error("Message not found in store %s", key)
+                raise
+            return id_, msg
+
+        if workers <= 1:
+            for request in requests:
+                yield fetch(request)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            requests = iter(requests)
+            pending = collections.deque(
+                pool.submit(fetch, r) for r in itertools.islice(requests, prefetch)
+            )
+            while pending:
+                if ordered:
+                    future = pending.popleft()
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    future = done.pop()
+                    pending.remove(future)
+                request = next(requests, None)
+                if request is not None:
+                    pending.append(pool.submit(fetch, request))
+                yield future.result()
+
+    @timed("open")
     def open(self, id_):
         """
         Open a stream for reading
@@ -578,19 +1576,156 @@ class BaseObjectStore(BaseBook):
             # Need to handle compressed files
             return self._open_stream(id_)
 
+    def repack(self, dataset_ids=None, delete=True, segment_size=None):
+        """
+        Consolidate the histograms, tdigests and job summaries of datasets
+        in new pack segments, in name order
+
+        Objects already packed and objects written one file per object
+        are both moved. With delete, the metastore is saved before the
+        previous segments and files are deleted, otherwise it must be
+        saved afterwards.
+
+        Parameters
+        ----------
+        dataset_ids : list of dataset uuids, all datasets by default
+        delete : save the store, then delete the previous segments and files.
+            Segments must not be referenced by another store, e.g. a job
+            store not yet merged
+        segment_size : size of the new segments, default the store segment size
+
+        Returns
+        -------
+        dict of number of objects and bytes moved, files removed
+        """
+        if delete is True and self._read_only is True:
+            self.__logger.error("Store %s is read only", self._name)
+            raise ValueError
+        if dataset_ids is None:
+            self._materialize_all()
+            dataset_ids = [
+                obj.uuid
+                for obj in self._mstore.info.objects
+                if obj.WhichOneof("info") == "dataset"
+            ]
+        if segment_size is None:
+            segment_size = self._pack_segment_size
+        packer = PackWriter(self._dstore, segment_size)
+        stats = {"objects": 0, "bytes": 0, "removed": 0}
+        old = set()
+        for dataset_id in dataset_ids:
+            dataset = self[dataset_id].dataset
+            objs = [
+                o for f in ("hists", "tdigests", "jobs") for o in getattr(dataset, f)
+            ]
+            objs.sort(key=lambda o: o.name)
+            if self._packer is not None:
+                self._packer.roll(dataset_id)
+            for obj in objs:
+                key, path, span, _ = self._locate(obj.uuid)
+                data = self._read_raw(key, path, span)
+                self._repack_object(obj, bytes(data), packer)
+                old.add(key)
+                stats["objects"] += 1
+                stats["bytes"] += len(data)
+        packer.close()
+        if delete is True:
+            # The persisted metastore still addresses the old keys
+            self.save_store()
+            for key in old:
+                if key in self._dstore:
+                    self._dstore.delete(key)
+                    stats["removed"] += 1
+        self.__logger.info("Repacked %s", stats)
+        return stats
+
+    def collect_garbage(self, dry_run=False):
+        """
+        Delete the content-addressed blobs released by this store
+
+        Only the blobs whose last reference was removed by this store are
+        deleted. Blobs are shared by all the stores of the kv store, a blob
+        still referenced by the saved metastore or journal of another store
+        is kept, as is any blob of a store not yet saved, e.g. a job store
+        not yet merged. The released blobs are persisted by save_store.
+
+        Parameters
+        ----------
+        dry_run : only return the unreferenced blobs
+
+        Returns
+        -------
+        list of unreferenced blob keys
+        """
+        self._materialize_all()
+        released = [key for key in self._released if key not in self._blob_refs]
+        garbage = self._unshared(released)
+        if dry_run is False:
+            for key in garbage:
+                if key in self._dstore:
+                    self._dstore.delete(key)
+            self._released.difference_update(released)
+            if self._read_only is False:
+                self._save_released()
+        self.__logger.info("Collected %s unreferenced blobs", len(garbage))
+        return garbage
+
+    def _unshared(self, keys):
+        """
+        Blob keys not referenced by the other stores of the kv store
+
+        The saved metastores and journals of the other stores are searched
+        for the blob keys of the object addresses.
+        """
+        keys = set(keys)
+        own = (self._name, f"{self._name}.journal")
+        for key in self._dstore.iter_keys():
+            if not keys:
+                break
+            if key in own or not key.endswith((".cronus.pb", ".cronus.pb.journal")):
+                continue
+            buf = self._dstore.get(key)
+            keys = {blob for blob in keys if blob.encode() not in buf}
+        return sorted(keys)
+
+    @property
+    def blob_refs(self):
+        """
+        Number of objects referencing each content-addressed blob
+        """
+        self._materialize_all()
+        return dict(self._blob_refs)
+
     def list(self, prefix="", suffix=""):
+        """
+        Objects with names matching a prefix and a suffix, in name order
+        """
+        self._materialize_all()
         objs = []
-        for id_ in self.keys():
-            if self[id_].name.startswith(prefix) and self[id_].name.endswith(suffix):
-                self.__logger.debug(self[id_].name)
-                objs.append(
-                    MetaObject(
-                        self[id_].name,
-                        self[id_].uuid,
-                        self[id_].parent_uuid,
-                        self[id_].address,
-                    )
-                )
+        for id_ in self._index.find(prefix, suffix):
+            obj = self._content[id_]
+            objs.append(MetaObject(obj.name, obj.uuid, obj.parent_uuid, obj.address))
+        return objs
+
+    def list_children(self, dataset_id, partition_key=None, job_id=None):
+        """
+        Objects of a dataset, optionally restricted to a partition and/or a job
+
+        Parameters
+        ----------
+        dataset_id : uuid of dataset
+        partition_key : partition of the objects
+        job_id : job index of the objects
+
+        Returns
+        -------
+        list of MetaObject dataclass
+        """
+        self[dataset_id]  # parses the dataset of a lazily loaded store
+        objs = []
+        for id_ in self._index.children(dataset_id, partition_key, job_id):
+            obj = self._content[id_]
+            objs.append(MetaObject(obj.name, obj.uuid, obj.parent_uuid, obj.address))
         return objs
 
     def list_partitions(self, dataset_id):
@@ -599,16 +1734,223 @@ class BaseObjectStore(BaseBook):
     def list_jobs(self, dataset_id):
         return self[dataset_id].dataset.jobs
 
-    def list_tdigests(self, dataset_id):
-        return self[dataset_id].dataset.tdigests
+    def list_tdigests(self, dataset_id, aggregated=False):
+        return self._list_mergeable(dataset_id, "tdigests", aggregated)
+
+    def list_histograms(self, dataset_id, aggregated=False):
+        """
+        Histogram collections of the jobs of a dataset,
+        reduced collections are not listed
+
+        Parameters
+        ----------
+        dataset_id : uuid of dataset
+        aggregated : only the latest reduced collection, see aggregate,
+            when it merged every job collection, otherwise the job collections
+        """
+        return self._list_mergeable(dataset_id, "hists", aggregated)
+
+    def _list_mergeable(self, dataset_id, field, aggregated):
+        objs = getattr(self[dataset_id].dataset, field)
+        jobs = [obj for obj in objs if _REDUCED not in obj.name]
+        if aggregated is not True:
+            return jobs
+        reduced = [obj for obj in objs if _REDUCED in obj.name]
+        if reduced:
+            sources = self._sources(reduced[-1].uuid)
+            if sources is not None and set(sources) == {o.uuid for o in jobs}:
+                return reduced[-1:]
+            self.__logger.info("Aggregate %s is stale", reduced[-1].uuid)
+        return jobs
+
+    def reduce_histograms(self, dataset_id, workers=8, register=False):
+        """
+        Merge the histograms of the jobs of a dataset
+
+        Collections are fetched on a thread pool, chunks are deserialized
+        and merged in a process pool of workers and the partial books
+        are merged in the calling process.
+
+        Parameters
+        ----------
+        dataset_id : uuid of dataset
+        workers : number of concurrent reads and of merge processes
+        register : register the merged collection in the dataset, with
+            the uuids of the merged collections as its sources
+
+        Returns
+        -------
+        ArtemisBook, MetaObject of the registered collection or None
+        """
+        return self._reduce(dataset_id, "hists", ArtemisBook, workers, register)
+
+    def reduce_tdigests(self, dataset_id, workers=8, register=False):
+        """
+        Merge the tdigests of the jobs of a dataset, see reduce_histograms
+
+        Returns
+        -------
+        TDigestBook, MetaObject of the registered digests or None
+        """
+        return self._reduce(dataset_id, "tdigests", TDigestBook, workers, register)
+
+    def sources(self, id_):
+        """
+        uuids of the objects merged in a reduced object
+        """
+        sources = self._sources(id_)
+        if sources is None:
+            self.__logger.error("Object %s is not a reduction", id_)
+            raise KeyError(id_)
+        return sources
+
+    def _sources(self, id_):
+        try:
+            buf = self._dstore.get(self[id_].name + _SOURCES_SUFFIX)
+        except KeyError:
+            return None
+        table = pa.ipc.open_file(pa.py_buffer(buf)).read_all()
+        return table.column(0).to_pylist()
+
+    def aggregate(self, dataset_id, field="hists", workers=8):
+        """
+        Merged histograms or tdigests of a dataset, cached in the store
 
-    def list_histograms(self, dataset_id):
-        return self[dataset_id].dataset.hists
+        The aggregate is a reduced object of the dataset keyed by its
+        sources, the uuids of the merged job objects. Objects of new jobs
+        are merged into the cached aggregate, which then replaces it.
+        The aggregate is merged again from all the jobs only when one of
+        its sources was removed, see remove_job. Content of a replaced
+        aggregate is deleted by the next save_store. A read only store
+        merges the aggregate without caching it.
+
+        Parameters
+        ----------
+        dataset_id : uuid of dataset
+        field : hists or tdigests
+        workers : number of concurrent reads and of merge processes
+
+        Returns
+        -------
+        ArtemisBook or TDigestBook
+        """
+        cls = _BOOKS[field]
+        objs = getattr(self[dataset_id].dataset, field)
+        ids_ = [obj.uuid for obj in objs if _REDUCED not in obj.name]
+        cached = [obj.uuid for obj in objs if _REDUCED in obj.name]
+        if cached:
+            # Sources deleted by another instance of the store, e.g. one that
+            # replaced the aggregate and was saved, invalidate the aggregate
+            sources = self._sources(cached[-1])
+            known = set(sources or ())
+            if sources is not None and known.issubset(ids_):
+                new = [id_ for id_ in ids_ if id_ not in known]
+                buf = _to_bytes(self.get(cached[-1]))
+                if not new:
+                    return merge_buffers(cls, [buf])
+                self.__logger.info("Fold %s %s into aggregate", len(new), field)
+                book = merge_all(
+                    [merge_buffers(cls, [buf]), self._merge(new, cls, workers)]
+                )
+                if self._read_only is False:
+                    self._register_reduced(book, field, dataset_id, sources + new)
+                    self._remove_reduced(cached[-1])
+                return book
+            if self._read_only is False:
+                self.__logger.info("Invalidate aggregate %s", cached[-1])
+                self._remove_reduced(cached[-1])
+        book, _ = self._reduce(
+            dataset_id, field, cls, workers, self._read_only is False
+        )
+        return book
+
+    def remove_job(self, dataset_id, job_id):
+        """
+        Remove the objects of a job from a dataset
+
+        Content of the objects is not deleted from the kv store.
+        Reduced objects of the dataset which merged objects of the job
+        are removed.
+
+        Returns
+        -------
+        list of uuids of the removed objects
+        """
+        ids_ = [obj.uuid for obj in self.list_children(dataset_id, job_id=job_id)]
+        removed = set(ids_)
+        for field in _BOOKS:
+            for obj in list(getattr(self[dataset_id].dataset, field)):
+                if _REDUCED not in obj.name:
+                    continue
+                sources = self._sources(obj.uuid)
+                if sources is None or removed.intersection(sources):
+                    self._remove_reduced(obj.uuid)
+        for id_ in ids_:
+            self._remove(id_)
+        self.__logger.info("Removed %s objects of job %s", len(ids_), job_id)
+        return ids_
+
+    def _remove_reduced(self, id_):
+        """
+        Remove a reduced object, its content and sources are deleted
+        once the removal is saved
+        """
+        name = self[id_].name
+        self._remove(id_)
+        self._trash.extend([name, name + _SOURCES_SUFFIX])
+
+    def _merge(self, ids_, cls, workers):
+        """
+        Fetch and merge the books of objects
+        """
+        buffers = [_to_bytes(buf) for _, buf in self.get_many(ids_, workers=workers)]
+        if workers > 1 and len(buffers) > workers:
+            size = -(-len(buffers) // workers)
+            chunks = [buffers[i : i + size] for i in range(0, len(buffers), size)]
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                return merge_all(pool.map(merge_buffers, [cls] * len(chunks), chunks))
+        return merge_buffers(cls, buffers)
+
+    def _reduce(self, dataset_id, field, cls, workers, register):
+        ids_ = [
+            obj.uuid
+            for obj in getattr(self[dataset_id].dataset, field)
+            if _REDUCED not in obj.name
+        ]
+        self.__logger.info("Reduce %s %s of dataset %s", len(ids_), field, dataset_id)
+        book = self._merge(ids_, cls, workers)
+        metaobj = None
+        if register is True:
+            metaobj = self._register_reduced(book, field, dataset_id, ids_)
+        return book, metaobj
+
+    def _register_reduced(self, book, field, dataset_id, sources):
+        """
+        Register a merged book, its sources are persisted next to it
+        """
+        info = HistsObjectInfo() if field == "hists" else TDigestObjectInfo()
+        info.created.GetCurrentTime()
+        obj = getattr(self[dataset_id].dataset, field).add()
+        obj.uuid = str(uuid.uuid4())
+        obj.parent_uuid = dataset_id
+        suffix = "hist.pb" if field == "hists" else "tdigest.pb"
+        obj.name = f"{dataset_id}{_REDUCED}{obj.uuid}.{suffix}"
+        obj.address = self._url_for(obj.name, field)
+        getattr(obj, field).CopyFrom(info)
+        self._add_message(obj, book._to_message())
+
+        batch = pa.RecordBatch.from_arrays([pa.array(sources, pa.string())], ["uuid"])
+        sink = pa.BufferOutputStream()
+        writer = pa.RecordBatchFileWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        writer.close()
+        self._dstore.put(obj.name + _SOURCES_SUFFIX, sink.getvalue().to_pybytes())
+        return MetaObject(obj.name, obj.uuid, obj.parent_uuid, obj.address)
 
     def _compute_hash(self, stream):
-        hashobj = hashlib.new(self._algorithm)
-        hashobj.update(stream.read())
-        return hashobj.hexdigest()
+        with timer(self._metrics, "hash"):
+            return hash_stream(stream, self._algorithm)
 
     def _register_menu(self, menu, menuinfo):
         self.__logger.info("Registering menu object")
@@ -620,7 +1962,7 @@ class BaseObjectStore(BaseBook):
         obj.parent_uuid = self._uuid
         obj.name = menu.name
         # New data, get a url from the datastore
-        obj.address = self._dstore.url_for(obj.name)
+        obj.address = self._url_for(obj.name, "menu")
         self.__logger.info("Retrieving url %s", obj.address)
         self.__logger.info("obj name %s", obj.name)
         # Copy the info object
@@ -641,7 +1983,7 @@ class BaseObjectStore(BaseBook):
         obj.parent_uuid = self._uuid
         obj.name = config.name
         # New data, get a url from the datastore
-        obj.address = self._dstore.url_for(obj.name)
+        obj.address = self._url_for(obj.name, "config")
         self.__logger.info("Retrieving url %s", obj.address)
         self.__logger.info("obj name %s", obj.name)
 
@@ -676,7 +2018,7 @@ class BaseObjectStore(BaseBook):
         obj.uuid = table.uuid
         obj.name = table.name
         obj.parent_uuid = dataset_id
-        obj.address = self._dstore.url_for(obj.name)
+        obj.address = self._url_for(obj.name, "table")
         self.__logger.debug("Retrieving url %s", obj.address)
         obj.table.CopyFrom(tableinfo)
         self[obj.uuid] = obj
@@ -715,7 +2057,7 @@ class BaseObjectStore(BaseBook):
 
         obj.name = f"{dataset_id}.job_{job_id}.part_{partition_key}.{obj.uuid}.{key}"
         obj.parent_uuid = dataset_id
-        obj.address = self._dstore.url_for(obj.name)
+        obj.address = self._url_for(obj.name, "file", fileinfo.type)
         self.__logger.debug("Retrieving url %s", obj.address)
         obj.file.CopyFrom(fileinfo)
 
@@ -739,10 +2081,9 @@ class BaseObjectStore(BaseBook):
         obj.uuid = str(uuid.uuid4())
         obj.parent_uuid = dataset_id
         obj.name = f"{dataset_id}.job_{job_id}.{obj.uuid}.hist.pb"
-        obj.address = self._dstore.url_for(obj.name)
+        obj.address = self._url_for(obj.name, "hists")
         obj.hists.CopyFrom(histsinfo)
-        self[obj.uuid] = obj
-        self._put_message(obj.uuid, hists)
+        self._add_message(obj, hists)
         return MetaObject(obj.name, obj.uuid, obj.parent_uuid, obj.address)
 
     def _register_tdigests(self, tdigests, tdigestinfo, dataset_id, job_id):
@@ -761,10 +2102,9 @@ class BaseObjectStore(BaseBook):
         obj.uuid = str(uuid.uuid4())
         obj.parent_uuid = dataset_id
         obj.name = f"{dataset_id}.job_{job_id}.{obj.uuid}.tdigest.pb"
-        obj.address = self._dstore.url_for(obj.name)
+        obj.address = self._url_for(obj.name, "tdigests")
         obj.tdigests.CopyFrom(tdigestinfo)
-        self[obj.uuid] = obj
-        self._put_message(obj.uuid, tdigests)
+        self._add_message(obj, tdigests)
 
         return MetaObject(obj.name, obj.uuid, obj.parent_uuid, obj.address)
 
@@ -784,25 +2124,33 @@ class BaseObjectStore(BaseBook):
         obj.uuid = str(uuid.uuid4())
         obj.parent_uuid = dataset_id
         obj.name = f"{dataset_id}.job_{job_id}.{obj.uuid}.job.pb"
-        obj.address = self._dstore.url_for(obj.name)
+        obj.address = self._url_for(obj.name, "job")
         obj.job.CopyFrom(jobinfo)
-        self[obj.uuid] = obj
-        self._put_message(obj.uuid, meta)
+        self._add_message(obj, meta)
 
         return MetaObject(obj.name, obj.uuid, obj.parent_uuid, obj.address)
 
-    def _register_file(self, location, fileinfo, dataset_id, partition_key):
+    def _register_file(
+        self, location, fileinfo, dataset_id, partition_key, digest=None
+    ):
         """
         Returns the content identifier
         for a file that is already in a store
         Requires a stream as bytes
+        The digest of the file content is computed if not provided
         """
         self.__logger.debug("Registering on disk file %s", location)
         path = Path(location)
         if path.is_absolute() is False:
             path = path.resolve()
+        if digest is None:
+            with timer(self._metrics, "hash"):
+                if self._hash_cache is not None:
+                    digest = self._hash_cache.hash_file(path, self._algorithm)
+                else:
+                    digest = hash_file(path, self._algorithm)
         obj = self[dataset_id].dataset.files.add()
-        obj.uuid = self._compute_hash(pa.input_stream(str(path)))
+        obj.uuid = digest
         obj.name = f"{dataset_id}.part_{partition_key}.{obj.uuid}.{path.name}"
         obj.parent_uuid = dataset_id
         # Create a Path object, ensure that location points to a file
@@ -824,10 +2172,23 @@ class BaseObjectStore(BaseBook):
     def _register_dir(self, location, glob, fileinfo, dataset_id, partition_key):
         """
         Registers a directory of files in a store
+        Files are hashed concurrently and registered in path order
         """
+        paths = sorted(Path(location).glob(glob))
+        with timer(self._metrics, "hash"):
+            if self._hash_cache is not None:
+                digests = self._hash_cache.hash_files(
+                    paths, self._algorithm, self._hash_workers, self._hash_processes
+                )
+            else:
+                digests = hash_files(
+                    paths, self._algorithm, self._hash_workers, self._hash_processes
+                )
         objs = []
-        for file_ in Path(location).glob(glob):
-            objs.append(self._register_file(file_, fileinfo, dataset_id, partition_key))
+        for file_, digest in zip(paths, digests):
+            objs.append(
+                self._register_file(file_, fileinfo, dataset_id, partition_key, digest)
+            )
         return objs
 
     def __setitem__(self, id_, msg):
@@ -843,13 +2204,31 @@ class BaseObjectStore(BaseBook):
         if not isinstance(msg, CronusObject):
             raise TypeError
 
+        self._add(id_, msg)
+
+    def _add(self, id_, msg):
+        """
+        Add a validated object to the store
+        """
         self._set(id_, msg)
+        if self._journal is not None:
+            if msg.parent_uuid == self._uuid:
+                self._journal.record_object(msg, "objects")
+            else:
+                self._journal.record_object(
+                    msg, _DATASET_FIELDS[msg.WhichOneof("info")], msg.parent_uuid
+                )
 
     def _put_message(self, id_, msg):
         # proto message to persist
         self.__logger.debug("Putting message to datastore %s", self[id_].address)
+        data = _to_bytes(self._encode(self[id_], msg.SerializeToString()))
+        if self._locate(id_)[2] is not None:
+            # Packed objects are appended again to a segment
+            self._repack_object(self[id_], data)
+            return
         try:
-            self._dstore.put(self[id_].name, msg.SerializeToString())
+            self._dstore.put(self[id_].name, data)
         except IOError:
             self.__logger.error("IO error %s", self[id_].address)
             raise
@@ -859,47 +2238,296 @@ class BaseObjectStore(BaseBook):
 
     def _get_message(self, id_, msg):
         # get object will read object into memory buffer
+        key, _, span, codec = self._locate(id_)
         try:
-            buf = self._dstore.get(self[id_].name)
-            msg.ParseFromString(buf)
+            msg.ParseFromString(self._read_message(key, span, codec))
         except KeyError:
             self.__logger.error("Message not found in store %s", self[id_].address)
             raise
 
+    def _local_path(self, key):
+        """
+        Path of a key for a store on the local filesystem, otherwise None
+        """
+        if isinstance(self._dstore, FilesystemStore):
+            return self._dstore._build_filename(key)
+        return None
+
+    def _url_for(self, name, kind, filetype=None):
+        """
+        Address of a new object, recording the codec of its type
+        Arrow IPC files are compressed by the Arrow writer
+        """
+        address = self._dstore.url_for(name)
+        codec = self._codecs.get(kind, None)
+        if codec is None or (kind == "file" and filetype in IPC_TYPES):
+            return address
+        return with_codec(address, codec)
+
+    def _encode(self, obj, buf):
+        """
+        Compressed content of an object, with the codec of its address
+        Arrow IPC files are rewritten with compressed record batches
+        to a temporary file, returned as a NativeFile
+        """
+        codec = address_codec(obj.address)
+        if codec is None and obj.WhichOneof("info") == "file":
+            if obj.file.type in IPC_TYPES and "file" in self._codecs:
+                sink = tempfile.TemporaryFile()
+                try:
+                    recompress_ipc(
+                        buf, self._codecs["file"], stream=obj.file.type == 6, sink=sink
+                    )
+                    sink.seek(0)
+                except BaseException:
+                    sink.close()
+                    raise
+                return pa.PythonFile(sink, mode="r")
+        if codec is None:
+            return buf
+        if isinstance(buf, pa.NativeFile):
+            buf = buf.read_buffer()
+        return compress(buf, codec)
+
     def _put_object(self, id_, buf):
         # bytestream to persist
-        self.__logger.debug("Putting buf to datastore %s", self[id_].address)
+        obj = self[id_]
+        data = self._encode(obj, buf)
         try:
-            self._dstore.put(self[id_].name, buf.to_pybytes())
+            if self._dedup is True:
+                self._put_blob(id_, data)
+            elif self._relinks(obj):
+                # Object of a deduplicated store gets its own copy
+                self._write_object(obj.name, self._dstore.url_for(obj.name), data)
+                self._link(obj, obj.name)
+            else:
+                self._write_object(obj.name, obj.address, data)
+        finally:
+            if data is not buf and isinstance(data, pa.NativeFile):
+                data.close()
+
+    def _relinks(self, obj):
+        """
+        Writing the buffer of an object changes its address
+        """
+        return self._dedup is True or _blob_key(obj.address) is not None
+
+    def _blob_for(self, digest):
+        return f"{digest}.{self._algorithm}{_BLOB_SUFFIX}"
+
+    def _put_blob(self, id_, buf):
+        """
+        Write a buffer as a content-addressed blob,
+        the write is skipped when the blob already exists
+        """
+        if isinstance(buf, pa.NativeFile):
+            # No copy for memory maps and buffer readers
+            buf = buf.read_buffer()
+        with timer(self._metrics, "hash", nbytes(buf)):
+            digest = hash_buffer(buf, self._algorithm)
+        key = self._blob_for(digest)
+        path = self._local_path(key)
+        if path is not None:
+            if not os.path.exists(path):
+                # Written then renamed, concurrent writers never expose a partial blob
+                self._write_object(key, self._dstore.url_for(key), buf)
+        elif key not in self._dstore:
+            self._write_object(key, self._dstore.url_for(key), buf)
+        self._link(self[id_], key)
+
+    def _link(self, obj, key, journal=True):
+        """
+        Point an object to a kv store key, e.g. a blob
+        """
+        if journal is True:
+            self._track(obj)
+        self._ref_blob(obj, -1)
+        obj.address = with_codec(self._dstore.url_for(key), address_codec(obj.address))
+        self._ref_blob(obj, 1)
+        if journal is True and self._journal is not None:
+            self._journal.record_update(obj)
+
+    def _write_object(self, key, address, buf):
+        """
+        Backend write of a buffer, does not access the metadata
+        """
+        self.__logger.debug("Putting buf to datastore %s", address)
+        if not isinstance(buf, pa.NativeFile):
+            view = memoryview(buf)
+            if not view.contiguous:
+                # Strided arrays are copied to a contiguous buffer
+                view = memoryview(view.tobytes())
+            buf = view.cast("B")
+        try:
+            path = self._local_path(key)
+            if path is not None:
+                # Write the buffer memory directly to a temporary file,
+                # moved to the key once complete
+                dirname = os.path.dirname(path)
+                os.makedirs(dirname, exist_ok=True)
+                tmp = os.path.join(dirname, f".tmp-{uuid.uuid4().hex}")
+                try:
+                    with open(tmp, "wb") as f:
+                        if isinstance(buf, pa.NativeFile):
+                            while True:
+                                chunk = buf.read_buffer(_CHUNK_SIZE)
+                                if chunk.size == 0:
+                                    break
+                                f.write(memoryview(chunk))
+                        else:
+                            f.write(buf)
+                    os.replace(tmp, path)
+                except BaseException:
+                    if os.path.exists(tmp):
+                        os.unlink(tmp)
+                    raise
+            elif isinstance(buf, pa.NativeFile):
+                self._dstore.put_file(key, buf)
+            else:
+                # kv store streams the buffer in chunks
+                self._dstore.put_file(key, pa.BufferReader(buf))
         except IOError:
-            self.__logger.error("IO error %s", self[id_].address)
+            self.__logger.error("IO error %s", address)
             raise
         except Exception:
-            self.__logger.error("Unknown error put %s", self[id_].address)
+            self.__logger.error("Unknown error put %s", address)
             raise
 
     def _get_object(self, id_):
         # get object will read object into memory buffer
-        self.__logger.debug(self[id_])
+        return self._read_object(*self._locate(id_))
+
+    def _locate(self, id_):
+        """
+        kv store key, local path, byte range and codec of an object,
+        the range is None for objects that are not packed
+        """
+        obj = self[id_]
+        path, span = parse_address(obj.address)
+        codec = address_codec(obj.address)
+        if span is None:
+            if path.endswith(_BLOB_SUFFIX):
+                return os.path.basename(path), path, None, codec
+            return obj.name, path, None, codec
+        return os.path.basename(path), path, span, codec
+
+    def _read_object(self, key, path, span=None, codec=None):
+        """
+        Backend read of an object, does not access the metadata
+
+        Parameters
+        ----------
+        key : name of the object in the kv store
+        path : local path of the object address
+        span : offset and length of a packed object
+        codec : codec of a compressed object, None to read the stored bytes
+        """
+        return decompress(self._read_raw(key, path, span), codec)
+
+    def _read_message(self, key, span=None, codec=None):
+        """
+        Serialized message of an object, does not access the metadata
+        """
+        if span is None:
+            buf = self._dstore.get(key)
+        else:
+            buf = self._read_range(key, *span)
+        if codec is not None:
+            buf = decompress(buf, codec).to_pybytes()
+        return buf
+
+    def _read_raw(self, key, path, span=None):
+        if span is not None:
+            return self._read_range(key, *span)
+        if self._memory_map is True:
+            if os.path.isfile(path):
+                # Buffer references the mapped pages, no copy
+                return self._map(path).read_buffer()
         try:
-            buf = self._dstore.get(self[id_].name)
+            buf = self._dstore.get(key)
         except KeyError:
-            self.__logger.warning("Key not in store, try local %s", self[id_])
+            self.__logger.warning("Key not in store, try local %s", key)
             # File resides outside of kv store
             # Used for registering files already existing in persistent storage
-            buf = pa.input_stream(self._parse_url(id_)).read()
+            buf = pa.input_stream(path).read()
         except Exception:
-            self.__logger.error("Key not in store, try local %s", self[id_])
+            self.__logger.error("Key not in store, try local %s", key)
         return buf
 
+    def _read_range(self, key, offset, length):
+        """
+        Byte range of a pack segment
+        """
+        if self._packer is not None:
+            pending = self._packer.pending(key)
+            if pending is not None:
+                return bytes(pending[offset : offset + length])
+        path = self._local_path(key)
+        if path is not None:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+        get_range = getattr(self._dstore, "get_range", None)
+        if get_range is not None:
+            return get_range(key, offset, length)
+        return self._dstore.get(key)[offset : offset + length]
+
+    def _add_message(self, obj, msg):
+        """
+        Register a new small object and persist its message,
+        appended to a pack segment of its dataset in pack mode
+        """
+        if self._packer is not None:
+            data = _to_bytes(self._encode(obj, msg.SerializeToString()))
+            obj.address = with_codec(
+                self._packer.append(obj.parent_uuid, data), address_codec(obj.address)
+            )
+        self[obj.uuid] = obj
+        if self._packer is None:
+            self._put_message(obj.uuid, msg)
+
+    def _repack_object(self, obj, data, packer=None):
+        if packer is None:
+            if self._packer is None:
+                self._packer = PackWriter(self._dstore, self._pack_segment_size)
+            packer = self._packer
+        self._track(obj)
+        obj.address = with_codec(
+            packer.append(obj.parent_uuid, data), address_codec(obj.address)
+        )
+        if self._journal is not None:
+            self._journal.record_update(obj)
+
     def _parse_url(self, id_):
         url_data = urllib.parse.urlparse(self[id_].address)
         return urllib.parse.unquote(url_data.path)
 
+    def _map(self, path):
+        try:
+            return pa.memory_map(path)
+        except IOError:
+            self.__logger.error("Unable to map %s", path)
+            raise
+
+    def _is_local(self, id_):
+        return urllib.parse.urlparse(self[id_].address).scheme in ("file", "")
+
+    def _source(self, id_, path):
+        """
+        Path or memory map of a file for the ipc readers,
+        objects of remote backends and packed objects are read in memory
+        """
+        key, _, span, codec = self._locate(id_)
+        if span is not None or codec is not None or not self._is_local(id_):
+            return pa.BufferReader(self._read_object(key, path, span, codec))
+        if self._memory_map is True:
+            return self._map(path)
+        return path
+
     def _open_ipc_file(self, id_):
         path = self._parse_url(id_)
         try:
-            stream = pa.ipc.open_file(path)
+            stream = pa.ipc.open_file(self._source(id_, path))
         except IOError:
             self.__logger.error("Unable to open ipc message %s", path)
             raise
@@ -911,7 +2539,7 @@ class BaseObjectStore(BaseBook):
     def _open_ipc_stream(self, id_):
         path = self._parse_url(id_)
         try:
-            stream = pa.ipc.open_stream(path)
+            stream = pa.ipc.open_stream(self._source(id_, path))
         except IOError:
             self.__logger.error("Unable to open ipc message %s", path)
             raise
@@ -923,7 +2551,15 @@ class BaseObjectStore(BaseBook):
     def _open_stream(self, id_):
         path = self._parse_url(id_)
         try:
-            stream = pa.input_stream(path)
+            _, _, span, codec = self._locate(id_)
+            if self._is_local(id_) and span is None:
+                if codec is None:
+                    stream = pa.input_stream(path)
+                else:
+                    # Decompressed while reading
+                    stream = pa.input_stream(path, compression=codec)
+            else:
+                stream = self._source(id_, path)
         except IOError:
             self.__logger.error("Unable to open stream %s", path)
             raise
@@ -940,7 +2576,18 @@ class JobBuilder:
     """
 
     def __init__(
-        self, root, store_name, store_id, menu_id, config_id, dataset_id, job_id
+        self,
+        root,
+        store_name,
+        store_id,
+        menu_id,
+        config_id,
+        dataset_id,
+        job_id,
+        storetype="hfs",
+        store_options=None,
+        lazy=False,
+        read_only=False,
     ):
 
         self.dataset_id = dataset_id
@@ -948,7 +2595,15 @@ class JobBuilder:
 
         # Connect to the metastore
         # Setup a datastore
-        self.store = BaseObjectStore(str(root), store_name, store_uuid=store_id)
+        self.store = BaseObjectStore(
+            str(root),
+            store_name,
+            store_uuid=store_id,
+            storetype=storetype,
+            store_options=store_options,
+            lazy=lazy,
+            read_only=read_only,
+        )
 
         self.parts = self.store.list_partitions(dataset_id)
         self.menu = Menu_pb()
@@ -958,6 +2613,8 @@ class JobBuilder:
         self.store.get(config_id, self.config)
 
         self.buf = None
+        self.bytes_written = 0
+        self.register_time = 0.0
 
     def execute(self):
         """
@@ -965,8 +2622,8 @@ class JobBuilder:
         creating associating metaobject
         storing data and metadata
 
-        returns a serialized dataset object for updating
-        a final store
+        returns a serialized dataset delta with the objects of the job
+        for updating a final store
         """
         self.__logger.info("Running job %s", self.job_id)
         data = [
@@ -978,14 +2635,6 @@ class JobBuilder:
             pa.array(np.random.rand(100000,)),
         ]
         batch = pa.RecordBatch.from_arrays(data, ["f0", "f1", "f2", "f3", "f4", "f5"])
-        sink = pa.BufferOutputStream()
-        writer = pa.RecordBatchFileWriter(sink, batch.schema)
-
-        for i in range(10):
-            writer.write_batch(batch)
-
-        writer.close()
-        buf = sink.getvalue()
 
         fileinfo = FileObjectInfo()
         fileinfo.type = 5
@@ -993,15 +2642,25 @@ class JobBuilder:
 
         ids_ = []
         for key in self.parts:
+            start = time.perf_counter()
             ids_.append(
                 self.store.register_content(
-                    buf,
+                    None,
                     fileinfo,
                     dataset_id=self.dataset_id,
                     job_id=self.job_id,
                     partition_key=key,
                 ).uuid
             )
-            self.store.put(ids_[-1], buf)
-        buf_ds = self.store[self.dataset_id].dataset.SerializeToString()
-        self.buf = buf_ds
+            self.register_time += time.perf_counter() - start
+            # Batches are streamed to the store, the file is not held in memory
+            with self.store.open_writer(ids_[-1], batch.schema) as writer:
+                for i in range(10):
+                    writer.write_batch(batch)
+                self.bytes_written += writer.close()
+        delta = DatasetObjectInfo()
+        delta.partitions.extend(self.parts)
+        for id_ in ids_:
+            delta.files.add().CopyFrom(self.store[id_])
+        self.buf = delta.SerializeToString()
+        return self.buf
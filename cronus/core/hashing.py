@@ -0,0 +1,253 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Content hashing of streams and on-disk files.
+
+Streams are hashed in fixed size chunks so memory use is bounded
+regardless of the content size. Algorithms are either provided by hashlib,
+e.g. sha1 or blake2b, or are non-cryptographic xxhash ids, e.g. xxh64 or
+xxh3_128, when the xxhash package is installed.
+
+A HashCache avoids rehashing unchanged files on repeated registrations.
+"""
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import pyarrow as pa
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Files modified within this window before hashing are not cached,
+# a later modification may not change the recorded mtime
+RACY_WINDOW_NS = 2 * 10**9
+
+
+def new_hash(algorithm):
+    """
+    Returns a new hash object for an algorithm name
+    """
+    if algorithm.startswith("xxh"):
+        try:
+            import xxhash
+        except ImportError:
+            raise ValueError(f"Algorithm {algorithm} requires the xxhash package")
+        try:
+            return getattr(xxhash, algorithm)()
+        except AttributeError:
+            raise ValueError(f"Unknown algorithm {algorithm}")
+    return hashlib.new(algorithm)
+
+
+def hash_stream(stream, algorithm="sha1", chunk_size=CHUNK_SIZE):
+    """
+    Hex digest of a stream read in chunks of chunk_size bytes
+    """
+    hashobj = new_hash(algorithm)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        hashobj.update(chunk)
+    return hashobj.hexdigest()
+
+
+def hash_buffer(buf, algorithm="sha1"):
+    """
+    Hex digest of an in-memory buffer, hashed without a copy
+    unless the buffer is not contiguous
+    """
+    hashobj = new_hash(algorithm)
+    view = memoryview(buf)
+    if not view.contiguous:
+        view = memoryview(view.tobytes())
+    hashobj.update(view.cast("B"))
+    return hashobj.hexdigest()
+
+
+def hash_file(path, algorithm="sha1", chunk_size=CHUNK_SIZE):
+    """
+    Hex digest of an on-disk file
+    """
+    with pa.input_stream(str(path)) as stream:
+        return hash_stream(stream, algorithm, chunk_size)
+
+
+def hash_files(paths, algorithm="sha1", workers=1, processes=False):
+    """
+    Hex digests of on-disk files, hashed concurrently
+
+    Digests are returned in the order of the paths.
+    hashlib releases the GIL while hashing large chunks, threads are usually
+    sufficient. A process pool is used for algorithms that hold the GIL.
+
+    Parameters
+    ----------
+    paths : list of file paths
+    algorithm : hash algorithm name
+    workers : number of concurrent workers
+    processes : hash in a process pool rather than a thread pool
+    """
+    paths = [str(path) for path in paths]
+    if workers <= 1 or len(paths) <= 1:
+        return [hash_file(path, algorithm) for path in paths]
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=workers) as pool:
+        return list(pool.map(hash_file, paths, [algorithm] * len(paths)))
+
+
+class HashCache:
+    """
+    Persistent cache of the content hash of on-disk files
+
+    Entries are keyed by path and algorithm and are valid as long as the
+    file size, modification time and inode are unchanged. Recently modified
+    files are not cached since the filesystem timestamp granularity could
+    hide a subsequent modification.
+    The cache is persisted as an Arrow RecordBatchFile in a kv store.
+
+    Parameters
+    ----------
+    dstore : simplekv store holding the cache, None for an in-memory cache
+    key : key of the cache in the kv store
+
+    Attributes
+    ----------
+    hits : number of digests served from the cache
+    misses : number of files hashed
+    bytes_saved : size of the files not rehashed
+    """
+
+    def __init__(self, dstore=None, key=None):
+        self._dstore = dstore
+        self._key = key
+        self._entries = None
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def _load(self):
+        self._entries = dict()
+        if self._dstore is None:
+            return
+        try:
+            buf = self._dstore.get(self._key)
+        except KeyError:
+            return
+        table = pa.ipc.open_file(pa.py_buffer(buf)).read_all()
+        for path, algorithm, size, mtime, inode, digest in zip(
+            *[table.column(i).to_pylist() for i in range(table.num_columns)]
+        ):
+            self._entries[(path, algorithm)] = (size, mtime, inode, digest)
+
+    def save(self):
+        """
+        Persist the cache if it changed
+        """
+        if self._dstore is None or not self._dirty:
+            return
+        keys = list(self._entries)
+        values = list(self._entries.values())
+        batch = pa.RecordBatch.from_arrays(
+            [
+                pa.array([k[0] for k in keys], pa.string()),
+                pa.array([k[1] for k in keys], pa.string()),
+                pa.array([v[0] for v in values], pa.int64()),
+                pa.array([v[1] for v in values], pa.int64()),
+                pa.array([v[2] for v in values], pa.int64()),
+                pa.array([v[3] for v in values], pa.string()),
+            ],
+            ["path", "algorithm", "size", "mtime", "inode", "digest"],
+        )
+        sink = pa.BufferOutputStream()
+        writer = pa.RecordBatchFileWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        writer.close()
+        self._dstore.put(self._key, sink.getvalue().to_pybytes())
+        self._dirty = False
+
+    @staticmethod
+    def _stat(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def lookup(self, path, algorithm):
+        """
+        Cached digest of a file, None if the file changed or is not cached
+
+        Returns
+        -------
+        digest, stat of the file
+        """
+        if self._entries is None:
+            self._load()
+        path = os.path.abspath(str(path))
+        stat = self._stat(path)
+        entry = self._entries.get((path, algorithm), None)
+        if entry is not None and entry[:3] == stat:
+            self.hits += 1
+            self.bytes_saved += stat[0]
+            return entry[3], stat
+        self.misses += 1
+        return None, stat
+
+    def update(self, path, algorithm, stat, digest):
+        """
+        Cache the digest of a file for the stat taken before hashing
+        """
+        if self._entries is None:
+            self._load()
+        if time.time_ns() - stat[1] < RACY_WINDOW_NS:
+            return
+        self._entries[(os.path.abspath(str(path)), algorithm)] = (*stat, digest)
+        self._dirty = True
+
+    def hash_file(self, path, algorithm="sha1"):
+        digest, stat = self.lookup(path, algorithm)
+        if digest is None:
+            digest = hash_file(path, algorithm)
+            self.update(path, algorithm, stat, digest)
+        return digest
+
+    def hash_files(self, paths, algorithm="sha1", workers=1, processes=False):
+        """
+        Hex digests of on-disk files, only changed files are hashed
+        """
+        digests = []
+        stale = []
+        for i, path in enumerate(paths):
+            digest, stat = self.lookup(path, algorithm)
+            digests.append(digest)
+            if digest is None:
+                stale.append((i, path, stat))
+        new = hash_files([s[1] for s in stale], algorithm, workers, processes)
+        for (i, path, stat), digest in zip(stale, new):
+            digests[i] = digest
+            self.update(path, algorithm, stat, digest)
+        return digests
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_saved": self.bytes_saved,
+        }
@@ -0,0 +1,368 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Side index of a persisted metastore.
+
+The index maps every object uuid to the byte span of its top-level object
+in the serialized CronusObjectStore, or to the dataset holding it.
+A store opened lazily only parses the objects that are accessed.
+"""
+import bisect
+import collections
+import re
+import zlib
+
+import pyarrow as pa
+
+from artemis_base.utils.logger import Logger
+
+# Protobuf wire types
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH = 2
+_FIXED32 = 5
+
+_JOB_RE = re.compile(r"\.job_(\d+)\.")
+
+
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _skip(buf, pos, wire_type):
+    if wire_type == _VARINT:
+        _, pos = _read_varint(buf, pos)
+    elif wire_type == _FIXED64:
+        pos += 8
+    elif wire_type == _LENGTH:
+        length, pos = _read_varint(buf, pos)
+        pos += length
+    elif wire_type == _FIXED32:
+        pos += 4
+    else:
+        raise ValueError(f"Unsupported wire type {wire_type}")
+    return pos
+
+
+def scan_store(buf, info_field, objects_field):
+    """
+    Scan the top level of a serialized CronusObjectStore
+
+    Only the framing of the store and of its info message is decoded,
+    the objects are not parsed.
+
+    Parameters
+    ----------
+    buf : serialized CronusObjectStore
+    info_field : field number of the store info
+    objects_field : field number of the objects in the store info
+
+    Returns
+    -------
+    header : serialized store without the objects
+    spans : list of (start, end) byte spans of each encoded object
+    """
+    header = bytearray()
+    info = bytearray()
+    spans = []
+    pos = 0
+    size = len(buf)
+    while pos < size:
+        start = pos
+        tag, pos = _read_varint(buf, pos)
+        if tag >> 3 != info_field:
+            pos = _skip(buf, pos, tag & 7)
+            header += buf[start:pos]
+            continue
+        length, pos = _read_varint(buf, pos)
+        end = pos + length
+        while pos < end:
+            field_start = pos
+            tag, pos = _read_varint(buf, pos)
+            pos = _skip(buf, pos, tag & 7)
+            if tag >> 3 == objects_field:
+                spans.append((field_start, pos))
+            else:
+                info += buf[field_start:pos]
+    if info:
+        header += _write_varint(info_field << 3 | _LENGTH)
+        header += _write_varint(len(info))
+        header += info
+    return bytes(header), spans
+
+
+def object_value(buf, start):
+    """
+    Serialized object of an encoded object span
+    """
+    _, pos = _read_varint(buf, start)
+    length, pos = _read_varint(buf, pos)
+    return buf[pos : pos + length]
+
+
+def encode_objects(info_field, entries):
+    """
+    Encode a list of encoded objects as a store info message
+
+    The result can be appended to a serialized store,
+    protobuf merges repeated occurrences of the info field.
+    """
+    payload = b"".join(entries)
+    return (
+        _write_varint(info_field << 3 | _LENGTH) + _write_varint(len(payload)) + payload
+    )
+
+
+@Logger.logged
+class StoreIndex:
+    """
+    Persisted side index of a metastore snapshot
+
+    Stored as an Arrow RecordBatchFile with one row per object.
+    Top-level objects carry the byte span of their encoded object,
+    dataset children the uuid of their dataset.
+    The snapshot size and checksum are kept in the schema metadata
+    to detect a stale index.
+
+    Parameters
+    ----------
+    uuids : list of object uuids
+    datasets : list of dataset uuids, empty for top-level objects
+    starts : list of start offsets, -1 for dataset children
+    ends : list of end offsets, -1 for dataset children
+    """
+
+    def __init__(self, uuids, datasets, starts, ends):
+        self.uuids = uuids
+        self.datasets = datasets
+        self.starts = starts
+        self.ends = ends
+
+    def spans(self):
+        """
+        Byte spans of the top-level objects, keyed by uuid
+        """
+        return {
+            u: (s, e)
+            for u, d, s, e in zip(self.uuids, self.datasets, self.starts, self.ends)
+            if not d
+        }
+
+    def parents(self):
+        """
+        Dataset of each dataset child, keyed by uuid
+        """
+        return {u: d for u, d in zip(self.uuids, self.datasets) if d}
+
+    @staticmethod
+    def _checksum(snapshot):
+        return str(zlib.crc32(snapshot))
+
+    def write(self, dstore, key, snapshot):
+        batch = pa.RecordBatch.from_arrays(
+            [
+                pa.array(self.uuids, pa.string()),
+                pa.array(self.datasets, pa.string()).dictionary_encode(),
+                pa.array(self.starts, pa.int64()),
+                pa.array(self.ends, pa.int64()),
+            ],
+            ["uuid", "dataset", "start", "end"],
+        )
+        batch = batch.replace_schema_metadata(
+            {"size": str(len(snapshot)), "checksum": self._checksum(snapshot)}
+        )
+        sink = pa.BufferOutputStream()
+        writer = pa.RecordBatchFileWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        writer.close()
+        dstore.put(key, sink.getvalue().to_pybytes())
+
+    @classmethod
+    def load(cls, dstore, key, snapshot):
+        """
+        Load the index of a snapshot
+
+        Returns
+        -------
+        StoreIndex or None if the index is missing or stale
+        """
+        try:
+            buf = dstore.get(key)
+        except KeyError:
+            cls.__logger.warning("No index %s", key)
+            return None
+        reader = pa.ipc.open_file(pa.py_buffer(buf))
+        metadata = reader.schema.metadata or {}
+        if (
+            metadata.get(b"size") != str(len(snapshot)).encode()
+            or metadata.get(b"checksum") != cls._checksum(snapshot).encode()
+        ):
+            cls.__logger.warning("Index %s does not match the snapshot", key)
+            return None
+        table = reader.read_all()
+        return cls(
+            table.column("uuid").to_pylist(),
+            table.column("dataset").to_pylist(),
+            table.column("start").to_pylist(),
+            table.column("end").to_pylist(),
+        )
+
+
+class ObjectIndex:
+    """
+    Secondary indexes of the objects of a store
+
+    Sorted indexes of the object names, and of the reversed names,
+    answer prefix and suffix queries. Objects are also indexed by parent,
+    by parent and partition, and by parent and job. The partition and job
+    are parsed from the object names generated by the store, e.g.
+    ``{dataset}.job_{job}.part_{partition}.{uuid}.{type}``.
+
+    Sorted indexes are updated lazily, on the first query after a change.
+    """
+
+    def __init__(self):
+        self._names = dict()  # name -> {uuid: None}
+        self._sorted = []
+        self._rsorted = []
+        self._removed = set()
+        self._dirty = False
+        self._children = collections.defaultdict(dict)
+
+    @staticmethod
+    def _keys(id_, obj):
+        """
+        Parent, partition and job index keys of an object
+        """
+        parent = obj.parent_uuid
+        name = obj.name
+        keys = [(parent,)]
+        partition = None
+        job = None
+        pos = name.find(".part_")
+        if pos >= 0:
+            base = id_.rsplit("_", 1)[0]
+            end = name.find("." + base, pos)
+            if end > pos:
+                partition = name[pos + 6 : end]
+                keys.append((parent, "part", partition))
+        match = _JOB_RE.search(name)
+        if match is not None:
+            job = int(match.group(1))
+            keys.append((parent, "job", job))
+        if partition is not None and job is not None:
+            keys.append((parent, "part_job", partition, job))
+        return keys
+
+    def add(self, id_, obj):
+        uuids = self._names.get(obj.name, None)
+        if uuids is None:
+            self._names[obj.name] = {id_: None}
+            if obj.name in self._removed:
+                self._removed.discard(obj.name)
+            else:
+                self._sorted.append(obj.name)
+                self._rsorted.append(obj.name[::-1])
+                self._dirty = True
+        else:
+            uuids[id_] = None
+        for key in self._keys(id_, obj):
+            self._children[key][id_] = None
+
+    def remove(self, id_, obj):
+        uuids = self._names.get(obj.name, None)
+        if uuids is not None:
+            uuids.pop(id_, None)
+            if not uuids:
+                del self._names[obj.name]
+                self._removed.add(obj.name)
+                self._dirty = True
+        for key in self._keys(id_, obj):
+            children = self._children.get(key, None)
+            if children is not None:
+                children.pop(id_, None)
+                if not children:
+                    del self._children[key]
+
+    def _sort(self):
+        if self._removed:
+            self._sorted = [n for n in self._sorted if n not in self._removed]
+            self._rsorted = [n for n in self._rsorted if n[::-1] not in self._removed]
+            self._removed = set()
+        self._sorted.sort()
+        self._rsorted.sort()
+        self._dirty = False
+
+    @staticmethod
+    def _range(keys, prefix):
+        for i in range(bisect.bisect_left(keys, prefix), len(keys)):
+            key = keys[i]
+            if not key.startswith(prefix):
+                break
+            yield key
+
+    def find(self, prefix="", suffix=""):
+        """
+        uuids of the objects with names matching a prefix and a suffix
+        in name order
+        """
+        if self._dirty:
+            self._sort()
+        if prefix or not suffix:
+            names = (n for n in self._range(self._sorted, prefix) if n.endswith(suffix))
+        else:
+            names = sorted(n[::-1] for n in self._range(self._rsorted, suffix[::-1]))
+        for name in names:
+            yield from self._names[name]
+
+    def children(self, parent, partition=None, job=None):
+        """
+        uuids of the children of a parent,
+        optionally restricted to a partition and/or a job
+        """
+        if partition is not None and job is not None:
+            key = (parent, "part_job", partition, job)
+        elif partition is not None:
+            key = (parent, "part", partition)
+        elif job is not None:
+            key = (parent, "job", job)
+        else:
+            key = (parent,)
+        return list(self._children.get(key, ()))
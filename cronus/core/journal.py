@@ -0,0 +1,245 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Append-only journal of metastore deltas.
+
+A journaled store records every registration as a compact delta record.
+Records are flushed to the kv store on save and replayed on top of the
+persisted CronusObjectStore snapshot when the store is loaded.
+"""
+import os
+import struct
+
+from simplekv.fs import FilesystemStore
+
+from artemis_base.utils.logger import Logger
+
+# Record types
+OP_OBJECT = 1  # CronusObject added to the store or to a dataset
+OP_PARTITION = 2  # Partition key added to a dataset
+OP_JOB_IDX = 3  # Job counter of a dataset incremented
+OP_UPDATE = 4  # Metadata of an existing object replaced
+OP_REMOVE = 5  # Object removed from the store or from a dataset
+
+# op, len(parent), len(field), len(payload)
+_HEADER = struct.Struct("<BHHI")
+_JOB_IDX = struct.Struct("<q")
+
+
+@Logger.logged
+class MetaJournal:
+    """
+    Write-ahead journal of metastore deltas persisted in a kv store
+
+    Records are framed as a fixed header followed by the parent uuid,
+    the field name and the payload. Pending records are kept in memory
+    until flushed.
+
+    Parameters
+    ----------
+    dstore : simplekv store holding the journal
+    key : key of the journal in the kv store
+    """
+
+    def __init__(self, dstore, key):
+        self._dstore = dstore
+        self._key = key
+        self._pending = []
+        self._num_records = 0
+        self._size = 0
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def num_pending(self):
+        """
+        Records not yet flushed to the kv store
+        """
+        return len(self._pending)
+
+    @property
+    def num_records(self):
+        """
+        Records persisted in the kv store
+        """
+        return self._num_records
+
+    @property
+    def size(self):
+        """
+        Bytes of complete records read from or flushed to the kv store
+        """
+        return self._size
+
+    def record_object(self, obj, field, parent_uuid=""):
+        """
+        Record a new object
+
+        Parameters
+        ----------
+        obj : CronusObject
+        field : name of the repeated field holding the object
+        parent_uuid : uuid of the parent dataset, empty for top-level objects
+        """
+        self._append(OP_OBJECT, parent_uuid, field, obj.SerializeToString())
+
+    def record_update(self, obj):
+        """
+        Record the new metadata of an existing object
+        """
+        self._append(OP_UPDATE, "", "", obj.SerializeToString())
+
+    def record_remove(self, id_, field, parent_uuid=""):
+        """
+        Record the removal of an object
+
+        Parameters
+        ----------
+        id_ : uuid of the object
+        field : name of the repeated field holding the object
+        parent_uuid : uuid of the parent dataset, empty for top-level objects
+        """
+        self._append(OP_REMOVE, parent_uuid, field, id_.encode())
+
+    def record_partition(self, dataset_id, partition_key):
+        self._append(OP_PARTITION, dataset_id, partition_key, b"")
+
+    def record_job_idx(self, dataset_id, job_idx):
+        self._append(OP_JOB_IDX, dataset_id, "", _JOB_IDX.pack(job_idx))
+
+    def _append(self, op, parent, field, payload):
+        parent = parent.encode()
+        field = field.encode()
+        self._pending.append(
+            _HEADER.pack(op, len(parent), len(field), len(payload))
+            + parent
+            + field
+            + payload
+        )
+
+    def flush(self):
+        """
+        Append pending records to the journal in the kv store
+
+        Returns
+        -------
+        Number of bytes written
+        """
+        if not self._pending:
+            return 0
+        data = b"".join(self._pending)
+        size = self._size + len(data)
+        # Records are appended after the last complete record, a truncated
+        # record of an interrupted flush is overwritten
+        if isinstance(self._dstore, FilesystemStore):
+            # Append in place, only the new records are written
+            path = self._dstore._build_filename(self._key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "ab") as f:
+                if f.tell() > self._size:
+                    self.__logger.warning("Truncate journal %s", self._key)
+                    f.truncate(self._size)
+                f.write(data)
+        else:
+            # kv stores without append semantics rewrite the journal,
+            # size is bounded by compaction of the store
+            try:
+                data = self._dstore.get(self._key)[: self._size] + data
+            except KeyError:
+                pass
+            self._dstore.put(self._key, data)
+        self._size = size
+        self._num_records += len(self._pending)
+        self._pending = []
+        return len(data)
+
+    def records(self, start=0):
+        """
+        Iterate over the persisted records
+
+        A truncated trailing record, e.g. from an interrupted flush, is dropped
+
+        Parameters
+        ----------
+        start : byte offset of the first record, e.g. the size of
+            the journal already read
+
+        Yields
+        ------
+        tuple of op, parent uuid, field, payload
+        """
+        try:
+            buf = self._dstore.get(self._key)
+        except KeyError:
+            return
+        if start == 0:
+            self._num_records = 0
+        self._size = start
+        for record, end in self._parse(buf, start):
+            self._num_records += 1
+            self._size = end
+            yield record
+
+    def pending(self):
+        """
+        Iterate over the records not yet flushed
+
+        Yields
+        ------
+        tuple of op, parent uuid, field, payload
+        """
+        for record, _ in self._parse(b"".join(self._pending)):
+            yield record
+
+    def _parse(self, buf, pos=0):
+        size = len(buf)
+        while pos < size:
+            if pos + _HEADER.size > size:
+                self.__logger.warning("Truncated journal record %s", self._key)
+                break
+            op, len_parent, len_field, len_payload = _HEADER.unpack_from(buf, pos)
+            pos += _HEADER.size
+            end = pos + len_parent + len_field + len_payload
+            if end > size:
+                self.__logger.warning("Truncated journal record %s", self._key)
+                break
+            parent = buf[pos : pos + len_parent].decode()
+            pos += len_parent
+            field = buf[pos : pos + len_field].decode()
+            pos += len_field
+            payload = buf[pos:end]
+            pos = end
+            yield (op, parent, field, payload), end
+
+    def reset(self):
+        """
+        Drop all records, called once the records are folded in a snapshot
+        """
+        self._pending = []
+        self._num_records = 0
+        self._size = 0
+        if self._key in self._dstore:
+            self._dstore.delete(self._key)
+
+    @staticmethod
+    def job_idx(payload):
+        return _JOB_IDX.unpack(payload)[0]
@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Cross-process coordination of the writers of a metastore.
+
+Writers serialize their commits with an advisory lock file beside the store.
+The head of the store records a generation, incremented by every commit,
+and an epoch, incremented when the journal is compacted into the snapshot.
+A writer whose generation is behind the head rebases its pending records
+before committing.
+"""
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# generation, epoch
+_HEAD = struct.Struct("<qq")
+
+
+class StoreConflictError(Exception):
+    """
+    Pending changes of a writer conflict with a commit of another writer
+    """
+
+
+def read_head(dstore, key):
+    """
+    Generation and epoch of a store, (0, 0) for a store never committed
+    """
+    try:
+        return _HEAD.unpack(dstore.get(key))
+    except KeyError:
+        return 0, 0
+
+
+def write_head(dstore, key, generation, epoch):
+    dstore.put(key, _HEAD.pack(generation, epoch))
+
+
+class StoreLock:
+    """
+    Advisory exclusive lock of a store shared by processes on one node
+
+    The lock is an flock on a lock file, reentrant within a process.
+
+    Parameters
+    ----------
+    path : lock file
+    timeout : seconds to wait for the lock, None to wait indefinitely
+    """
+
+    def __init__(self, path, timeout=None):
+        if fcntl is None:
+            raise ValueError("File locking is not supported on this platform")
+        self._path = path
+        self._timeout = timeout
+        self._rlock = threading.RLock()
+        self._count = 0
+        self._fd = None
+
+    @property
+    def path(self):
+        return self._path
+
+    def acquire(self):
+        self._rlock.acquire()
+        if self._count == 0:
+            try:
+                self._lock_file()
+            except BaseException:
+                self._rlock.release()
+                raise
+        self._count += 1
+
+    def _lock_file(self):
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        start = time.monotonic()
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if (
+                    self._timeout is not None
+                    and time.monotonic() - start >= self._timeout
+                ):
+                    os.close(fd)
+                    raise TimeoutError(f"Timeout waiting for lock {self._path}")
+                time.sleep(0.005)
+        self._fd = fd
+
+    def release(self):
+        self._count -= 1
+        if self._count == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._rlock.release()
+
+    def __del__(self):
+        # A lock left held, e.g. by a store failing to load, is released
+        # when the file is closed
+        if self._fd is not None:
+            os.close(self._fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
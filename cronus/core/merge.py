@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Merge of the dataset deltas produced by concurrent jobs.
+
+Jobs, or the threads collecting their results, submit serialized
+DatasetObjectInfo deltas concurrently. Deltas are parsed by the submitting
+thread and applied to the store in batched passes, one writer at a time.
+"""
+import threading
+
+from artemis_base.utils.logger import Logger
+from artemis_format.pymodels.cronus_pb2 import DatasetObjectInfo
+
+
+@Logger.logged
+class DatasetMerger:
+    """
+    Collects job dataset deltas and merges them into a store
+
+    submit is thread safe, merge applies every delta submitted so far in
+    a single pass of BaseObjectStore.merge_datasets. Duplicate objects,
+    e.g. from a retried job, are skipped.
+
+    Parameters
+    ----------
+    store : BaseObjectStore receiving the deltas
+    batch_size : merge automatically once this many deltas are pending,
+        None to merge only on request
+    """
+
+    def __init__(self, store, batch_size=None):
+        self._store = store
+        self._batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self.stats = {"deltas": 0, "added": 0, "duplicates": 0}
+
+    @property
+    def num_pending(self):
+        return len(self._pending)
+
+    def submit(self, dataset_id, buf):
+        """
+        Submit the delta of a job
+
+        Parameters
+        ----------
+        dataset_id : uuid of the dataset
+        buf : serialized DatasetObjectInfo, or a parsed message
+        """
+        if isinstance(buf, DatasetObjectInfo):
+            delta = buf
+        else:
+            delta = DatasetObjectInfo()
+            delta.ParseFromString(buf)
+        with self._lock:
+            self._pending.append((dataset_id, delta))
+            full = self._batch_size is not None and (
+                len(self._pending) >= self._batch_size
+            )
+        if full:
+            self.merge()
+
+    def merge(self):
+        """
+        Apply the pending deltas to the store
+
+        Returns
+        -------
+        dict of number of objects added and of duplicates skipped
+        """
+        with self._merge_lock:
+            with self._lock:
+                deltas, self._pending = self._pending, []
+            if not deltas:
+                return {"added": 0, "duplicates": 0}
+            stats = self._store.merge_datasets(deltas)
+            self.stats["deltas"] += len(deltas)
+            self.stats["added"] += stats["added"]
+            self.stats["duplicates"] += stats["duplicates"]
+            self.__logger.info("Merged %s deltas %s", len(deltas), stats)
+            return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.merge()
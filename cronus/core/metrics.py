@@ -0,0 +1,250 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per-operation metrics of a metastore.
+
+A StoreMetrics registry records the number of calls, errors, bytes and
+latency of each store operation. Latencies are histogrammed in an
+ArtemisBook with log-spaced bins. Methods are instrumented with the timed
+decorator and code blocks with timer; both cost a single attribute check
+when the store has no registry.
+
+Metrics are exported as a snapshot dict or in the Prometheus text format,
+e.g. for the textfile collector of the node exporter.
+"""
+import collections
+import contextlib
+import functools
+import os
+import threading
+import time
+
+import numpy as np
+import pyarrow as pa
+
+from cronus.core.book import ArtemisBook
+
+# 100 ns to 100 s, 3 bins per decade
+LATENCY_BINS = np.logspace(-7, 2, 28)
+
+_ALGNAME = "latency"
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def nbytes(obj):
+    """
+    Size in bytes of a buffer or a protobuf message, 0 otherwise
+    """
+    if obj is None:
+        return 0
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, pa.Buffer):
+        return obj.size
+    if isinstance(obj, (memoryview, np.ndarray)):
+        return obj.nbytes
+    if hasattr(obj, "ByteSize"):
+        return obj.ByteSize()
+    return 0
+
+
+class StoreMetrics:
+    """
+    Registry of the counters and latency histograms of store operations
+
+    A registry can be shared by several stores, recording is thread safe.
+
+    Parameters
+    ----------
+    bins : latency bin edges in seconds
+    """
+
+    def __init__(self, bins=LATENCY_BINS):
+        self._bins = bins
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+        self._errors = collections.Counter()
+        self._bytes = collections.Counter()
+        self._seconds = collections.defaultdict(float)
+        self._book = ArtemisBook()
+
+    @property
+    def histograms(self):
+        """
+        ArtemisBook of the latency histograms, named latency.{operation}
+        """
+        return self._book
+
+    def record(self, op, seconds, size=0, error=False):
+        """
+        Record a call of an operation
+        """
+        with self._lock:
+            name = f"{_ALGNAME}.{op}"
+            if name not in self._book:
+                self._book.book(_ALGNAME, op, self._bins)
+            self._book.fill(_ALGNAME, op, seconds)
+            self._counts[op] += 1
+            self._seconds[op] += seconds
+            self._bytes[op] += size
+            if error:
+                self._errors[op] += 1
+
+    @contextlib.contextmanager
+    def timer(self, op, size=0):
+        """
+        Context manager recording a call of an operation
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(op, time.perf_counter() - start, size, error=True)
+            raise
+        self.record(op, time.perf_counter() - start, size)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._errors.clear()
+            self._bytes.clear()
+            self._seconds.clear()
+            self._book = ArtemisBook()
+
+    def snapshot(self):
+        """
+        Counters and latency histograms of each operation
+
+        Returns
+        -------
+        dict of operation to dict of count, errors, bytes, seconds and
+        latency bin edges, frequencies, underflow and overflow
+        """
+        with self._lock:
+            result = {}
+            for op in sorted(self._counts):
+                hist = self._book[f"{_ALGNAME}.{op}"]
+                result[op] = {
+                    "count": self._counts[op],
+                    "errors": self._errors[op],
+                    "bytes": self._bytes[op],
+                    "seconds": self._seconds[op],
+                    "latency": {
+                        "bins": hist.numpy_bins.tolist(),
+                        "frequencies": hist.frequencies.tolist(),
+                        "underflow": int(hist.underflow),
+                        "overflow": int(hist.overflow),
+                    },
+                }
+            return result
+
+    def to_prometheus(self, prefix="cronus", labels=None):
+        """
+        Metrics in the Prometheus text exposition format
+
+        Parameters
+        ----------
+        prefix : prefix of the metric names
+        labels : dict of labels added to every sample, e.g. the store name
+        """
+        extra = "".join(f',{k}="{v}"' for k, v in (labels or {}).items())
+        snapshot = self.snapshot()
+        lines = []
+        for name, key, kind, doc in (
+            ("operations_total", "count", "counter", "Calls of the operation"),
+            ("errors_total", "errors", "counter", "Calls raising an exception"),
+            ("bytes_total", "bytes", "counter", "Bytes put or read"),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {doc}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for op, values in snapshot.items():
+                lines.append(f'{prefix}_{name}{{op="{op}"{extra}}} {values[key]}')
+
+        name = f"{prefix}_operation_seconds"
+        lines.append(f"# HELP {name} Latency of the operation")
+        lines.append(f"# TYPE {name} histogram")
+        for op, values in snapshot.items():
+            latency = values["latency"]
+            count = latency["underflow"]
+            buckets = [(latency["bins"][0], count)]
+            for edge, frequency in zip(latency["bins"][1:], latency["frequencies"]):
+                count += frequency
+                buckets.append((edge, count))
+            for edge, count in buckets:
+                lines.append(f'{name}_bucket{{op="{op}"{extra},le="{edge:g}"}} {count}')
+            lines.append(
+                f'{name}_bucket{{op="{op}"{extra},le="+Inf"}} {values["count"]}'
+            )
+            lines.append(f'{name}_sum{{op="{op}"{extra}}} {values["seconds"]}')
+            lines.append(f'{name}_count{{op="{op}"{extra}}} {values["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, **kwargs):
+        """
+        Write the metrics to a Prometheus text file,
+        the file is replaced atomically
+        """
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_prometheus(**kwargs))
+        os.replace(tmp, path)
+
+
+def timer(metrics, op, size=0):
+    """
+    Context manager recording an operation, a no-op when metrics is None
+    """
+    if metrics is None:
+        return _NULL_TIMER
+    return metrics.timer(op, size)
+
+
+def timed(op, size=None):
+    """
+    Decorator recording the calls of a method in the _metrics registry
+    of its instance
+
+    Parameters
+    ----------
+    op : name of the operation
+    size : callable of the result and the call arguments returning
+        the number of bytes of the operation
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            metrics = self._metrics
+            if metrics is None:
+                return func(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = func(self, *args, **kwargs)
+            except BaseException:
+                metrics.record(op, time.perf_counter() - start, error=True)
+                raise
+            elapsed = time.perf_counter() - start
+            nbytes_ = 0 if size is None else size(result, *args, **kwargs)
+            metrics.record(op, elapsed, nbytes_)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,186 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Pack segments of small objects.
+
+Small protobufs, e.g. histograms, tdigests and job summaries, are appended
+to per-dataset segment files rather than written one file per object.
+The address of a packed object is the url of its segment with the byte
+range as fragment, ``{segment url}#{offset},{length}``.
+
+Segments are named ``{dataset}.{id}.pack``, a unique id per segment lets
+concurrent jobs pack objects of the same dataset.
+
+Consolidate the segments of a persisted store with
+
+    python -m cronus.core.pack ROOT NAME STORE_UUID [--dataset UUID]
+"""
+import argparse
+import os
+import urllib.parse
+import uuid
+
+from simplekv.fs import FilesystemStore
+
+from artemis_base.utils.logger import Logger
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+def parse_address(address):
+    """
+    Segment path and byte range of a packed object address
+
+    Returns
+    -------
+    path, (offset, length) or None for an object not in a pack
+    """
+    url = urllib.parse.urlparse(address)
+    path = urllib.parse.unquote(url.path)
+    if not url.fragment:
+        return path, None
+    offset, length = url.fragment.split(",")
+    return path, (int(offset), int(length))
+
+
+def format_address(url, offset, length):
+    return f"{url}#{offset},{length}"
+
+
+def segment_key(address):
+    """
+    kv store key of the segment of a packed object
+    """
+    return os.path.basename(parse_address(address)[0])
+
+
+@Logger.logged
+class PackWriter:
+    """
+    Appends small objects to the open segment of their dataset
+
+    A segment is closed once it exceeds the segment size. Local filesystem
+    segments are appended in place, segments of other kv stores are
+    buffered and written when closed or flushed.
+
+    Parameters
+    ----------
+    dstore : simplekv store holding the segments
+    segment_size : size in bytes above which a new segment is started
+    """
+
+    def __init__(self, dstore, segment_size=SEGMENT_SIZE):
+        self._dstore = dstore
+        self._segment_size = segment_size
+        self._open = dict()  # dataset -> [key, size]
+        self._buffers = dict()  # key -> bytearray of unflushed segments
+
+    def append(self, dataset_id, data):
+        """
+        Append an object to the segment of a dataset
+
+        Returns
+        -------
+        address of the packed object
+        """
+        segment = self._open.get(dataset_id, None)
+        if segment is None or segment[1] >= self._segment_size:
+            if segment is not None:
+                self._close(segment[0])
+            segment = [f"{dataset_id}.{uuid.uuid4().hex}.pack", 0]
+            self._open[dataset_id] = segment
+        key, offset = segment
+        if isinstance(self._dstore, FilesystemStore):
+            path = self._dstore._build_filename(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "ab") as f:
+                f.write(data)
+        else:
+            self._buffers.setdefault(key, bytearray()).extend(data)
+        segment[1] += len(data)
+        return format_address(self._dstore.url_for(key), offset, len(data))
+
+    def roll(self, dataset_id):
+        """
+        Close the open segment of a dataset,
+        the next object of the dataset starts a new segment
+        """
+        segment = self._open.pop(dataset_id, None)
+        if segment is not None:
+            self._close(segment[0])
+
+    def pending(self, key):
+        """
+        Unflushed content of a segment, None if the segment is flushed
+        """
+        return self._buffers.get(key, None)
+
+    def _close(self, key):
+        buf = self._buffers.pop(key, None)
+        if buf is not None:
+            self._dstore.put(key, bytes(buf))
+
+    def flush(self):
+        """
+        Write the buffered segments, the open segments are kept open
+        """
+        for key, buf in self._buffers.items():
+            self._dstore.put(key, bytes(buf))
+
+    def close(self):
+        for key in list(self._buffers):
+            self._close(key)
+        self._open = dict()
+
+
+def main():
+    from cronus.core.cronus import BaseObjectStore
+
+    parser = argparse.ArgumentParser(
+        description="Consolidate the pack segments of a store"
+    )
+    parser.add_argument("root")
+    parser.add_argument("name", help="store name, e.g. {uuid}.{name}.cronus.pb")
+    parser.add_argument("store_uuid")
+    parser.add_argument("--dataset", action="append", help="dataset uuid")
+    parser.add_argument("--storetype", default="hfs")
+    parser.add_argument("--segment-size", type=int, default=SEGMENT_SIZE)
+    parser.add_argument(
+        "--keep", action="store_true", help="do not delete the old segments"
+    )
+    args = parser.parse_args()
+
+    store = BaseObjectStore(
+        args.root,
+        args.name,
+        store_uuid=args.store_uuid,
+        storetype=args.storetype,
+    )
+    # Deleting the old segments saves the store first
+    stats = store.repack(
+        args.dataset, delete=not args.keep, segment_size=args.segment_size
+    )
+    if args.keep:
+        store.save_store()
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
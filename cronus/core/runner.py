@@ -0,0 +1,231 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Multiprocess execution of the jobs of a dataset.
+
+Each worker process reopens the persisted store read-only, runs a job
+with a JobBuilder and returns the serialized dataset delta of the job.
+The driver streams the deltas into the master store as jobs complete.
+
+    python -m cronus.core.runner root store_name store_uuid dataset_uuid \\
+        menu_uuid config_uuid --jobs 64 --workers 8
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from artemis_base.utils.logger import Logger
+from cronus.core.cronus import BaseObjectStore, JobBuilder
+from cronus.core.merge import DatasetMerger
+
+
+@dataclass
+class JobMetrics:
+    """
+    Metrics of a job run by a JobRunner, times in seconds
+    """
+
+    job_id: int
+    worker: int
+    wall_time: float
+    register_time: float
+    bytes_written: int
+    num_objects: int
+    merge_latency: float = 0.0
+
+
+def _run_job(builder, kwargs, job_id):
+    """
+    Run a job in a worker process
+
+    Returns
+    -------
+    serialized dataset delta, JobMetrics, time the job completed
+    """
+    start = time.perf_counter()
+    job = builder(job_id=job_id, **kwargs)
+    job.execute()
+    wall_time = time.perf_counter() - start
+    metrics = JobMetrics(
+        job_id,
+        os.getpid(),
+        wall_time,
+        job.register_time,
+        job.bytes_written,
+        len(job.store.list_children(job.dataset_id, job_id=job_id)),
+    )
+    return job.buf, metrics, time.time()
+
+
+@Logger.logged
+class JobRunner:
+    """
+    Runs the jobs of a dataset in a process pool
+
+    The master store is saved before the jobs start so the workers
+    load the dataset and its partitions. Job ids are allocated by the
+    master store, deltas are applied with a DatasetMerger as the jobs
+    complete. The master store is not saved by the runner.
+
+    Parameters
+    ----------
+    store : master BaseObjectStore
+    root : location of the store, reopened by the workers
+    dataset_id : uuid of the dataset
+    menu_id : uuid of the menu of the jobs
+    config_id : uuid of the configuration of the jobs
+    workers : number of worker processes, defaults to the number of cores
+    storetype : kv store backend shared with the workers, the memory
+        backend is not shared across processes
+    store_options : dict of backend specific options
+    builder : JobBuilder class run by the workers
+    """
+
+    def __init__(
+        self,
+        store,
+        root,
+        dataset_id,
+        menu_id,
+        config_id,
+        workers=None,
+        storetype="hfs",
+        store_options=None,
+        builder=JobBuilder,
+    ):
+        self._store = store
+        self._root = str(root)
+        self._dataset_id = dataset_id
+        self._menu_id = menu_id
+        self._config_id = config_id
+        self._workers = workers or os.cpu_count()
+        self._storetype = storetype
+        self._store_options = store_options
+        self._builder = builder
+
+    def run(self, num_jobs):
+        """
+        Run jobs and merge their outputs in the master store
+
+        Returns
+        -------
+        list of JobMetrics in order of completion
+        """
+        self._store.save_store()
+        job_ids = [self._store.new_job(self._dataset_id) for _ in range(num_jobs)]
+        # Jobs only return a delta of the dataset, the metastore is not persisted
+        kwargs = dict(
+            root=self._root,
+            store_name=self._store.store_name,
+            store_id=self._store.store_uuid,
+            menu_id=self._menu_id,
+            config_id=self._config_id,
+            dataset_id=self._dataset_id,
+            storetype=self._storetype,
+            store_options=self._store_options,
+            lazy=True,
+            read_only=True,
+        )
+        results = []
+        ctx = multiprocessing.get_context("spawn")
+        merger = DatasetMerger(self._store)
+        with ProcessPoolExecutor(max_workers=self._workers, mp_context=ctx) as pool:
+            futures = [
+                pool.submit(_run_job, self._builder, kwargs, job_id)
+                for job_id in job_ids
+            ]
+            for future in as_completed(futures):
+                buf, metrics, completed = future.result()
+                merger.submit(self._dataset_id, buf)
+                merger.merge()
+                metrics.merge_latency = time.time() - completed
+                self.__logger.info("Job %s completed %s", metrics.job_id, metrics)
+                results.append(metrics)
+        return results
+
+    @staticmethod
+    def summary(metrics, elapsed):
+        """
+        Aggregate metrics of a run
+
+        Parameters
+        ----------
+        metrics : list of JobMetrics
+        elapsed : wall time of the run in seconds
+        """
+        bytes_written = sum(m.bytes_written for m in metrics)
+        latencies = sorted(m.merge_latency for m in metrics)
+        return {
+            "jobs": len(metrics),
+            "workers": len(set(m.worker for m in metrics)),
+            "elapsed": elapsed,
+            "jobs_per_second": len(metrics) / elapsed,
+            "bytes_written": bytes_written,
+            "throughput": bytes_written / elapsed,
+            "mean_wall_time": statistics.mean(m.wall_time for m in metrics),
+            "mean_register_time": statistics.mean(m.register_time for m in metrics),
+            "median_merge_latency": statistics.median(latencies),
+            "max_merge_latency": latencies[-1],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("root")
+    parser.add_argument("store_name")
+    parser.add_argument("store_uuid")
+    parser.add_argument("dataset_uuid")
+    parser.add_argument("menu_uuid")
+    parser.add_argument("config_uuid")
+    parser.add_argument("--jobs", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--storetype", default="hfs")
+    args = parser.parse_args()
+
+    store = BaseObjectStore(
+        args.root, args.store_name, store_uuid=args.store_uuid, storetype=args.storetype
+    )
+    runner = JobRunner(
+        store,
+        args.root,
+        args.dataset_uuid,
+        args.menu_uuid,
+        args.config_uuid,
+        workers=args.workers,
+        storetype=args.storetype,
+    )
+    start = time.perf_counter()
+    metrics = runner.run(args.jobs)
+    summary = runner.summary(metrics, time.perf_counter() - start)
+    store.save_store()
+    for key, value in summary.items():
+        print(
+            f"{key:<24}{value:>16.4f}"
+            if isinstance(value, float)
+            else f"{key:<24}{value:>16}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Streaming writer of Arrow RecordBatches into a store object.
+
+Batches are written to a temporary file as they arrive, the output is
+never held in memory. On close the file is moved to the object location
+and the metadata of the object is finalized.
+"""
+import os
+
+import pyarrow as pa
+
+from artemis_base.utils.logger import Logger
+
+# Arrow ipc format to FileType
+FORMATS = {"file": 5, "stream": 6}
+
+
+@Logger.logged
+class ObjectWriter:
+    """
+    RecordBatch writer streaming into a registered file object
+
+    Use as a context manager, the object is finalized on a clean exit
+    and the partial output is removed on error. Content already written
+    to the object is only replaced on close.
+
+    Parameters
+    ----------
+    store : BaseObjectStore holding the object
+    id_ : uuid of the file object
+    schema : pyarrow schema of the batches
+    format : "file" for a RecordBatchFile, "stream" for a RecordBatchStream
+    path : temporary output file
+    commit : callable moving the output file to the object location
+    codec : compression codec of the record batch buffers, lz4 or zstd
+    """
+
+    def __init__(self, store, id_, schema, format, path, commit, codec=None):
+        self._store = store
+        self._id = id_
+        self._path = path
+        self._commit = commit
+        self._schema = schema
+        self._sink = pa.OSFile(path, "wb")
+        options = pa.ipc.IpcWriteOptions(compression=codec)
+        if format == "file":
+            self._writer = pa.RecordBatchFileWriter(self._sink, schema, options=options)
+        else:
+            self._writer = pa.RecordBatchStreamWriter(
+                self._sink, schema, options=options
+            )
+        self._closed = False
+        self.num_rows = 0
+        self.num_batches = 0
+
+    @property
+    def schema(self):
+        return self._schema
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def write_batch(self, batch):
+        self._writer.write_batch(batch)
+        self.num_rows += batch.num_rows
+        self.num_batches += 1
+
+    def write_table(self, table, max_chunksize=None):
+        for batch in table.to_batches(max_chunksize):
+            self.write_batch(batch)
+
+    def write(self, data):
+        if isinstance(data, pa.RecordBatch):
+            self.write_batch(data)
+        else:
+            self.write_table(data)
+
+    def close(self):
+        """
+        Close the writer and finalize the object metadata
+
+        Returns
+        -------
+        Size of the object in bytes
+        """
+        if self._closed:
+            return
+        self._writer.close()
+        self._sink.close()
+        self._closed = True
+        size = os.path.getsize(self._path)
+        self._commit()
+        self._store._finalize_file(
+            self._id,
+            schema=self.schema,
+            num_columns=len(self.schema),
+            num_rows=self.num_rows,
+            num_batches=self.num_batches,
+            size_bytes=size,
+        )
+        return size
+
+    def abort(self):
+        """
+        Discard the partial output
+        """
+        if self._closed:
+            return
+        self.__logger.warning("Discard partial output of %s", self._id)
+        self._closed = True
+        try:
+            self._writer.close()
+        except Exception:
+            pass
+        self._sink.close()
+        if os.path.exists(self._path):
+            os.remove(self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
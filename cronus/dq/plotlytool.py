@@ -98,13 +98,13 @@ Russell Gill (russell.gill@canada.ca)
 # ---------- IMPORT NECESSARY PACKAGES ---------- #
 
 # Standard Import(s)
+import collections.abc
 import logging
 import os
 import time
 import urllib.parse
 
 # External Import(s)
-import google
 import numpy
 from scipy import interpolate
 
@@ -122,6 +122,10 @@ from cronus.core.cronus import BaseObjectStore
 
 # ---------- GLOBAL PARAMETERS ---------- #
 
+# containers of Cronus objects, e.g. the protobuf repeated container of a dataset
+# or the list returned by the store listing of an aggregated dataset
+OBJECT_CONTAINERS = (tuple, collections.abc.MutableSequence)
+
 # for each trace name provided, create a subplot containing only
 # the traces with names that contain the provided trace name
 REQ_HIST_TRACE_NAMES = ["all"]
@@ -468,6 +472,7 @@ class ProcessHist:
     Parameters
     --------------------
     `histograms`: `google.protobuf.pyext._message.RepeatedCompositeContainer`
+        or `list` of `cronus_pb2.CronusObject`
         A Cronus protobuf object containing histogram data to be plotted.
     """
 
@@ -601,6 +606,7 @@ class ProcessHist:
         Parameters
         --------------------
         `histograms`: `google.protobuf.pyext._message.RepeatedCompositeContainer`
+            or `list` of `cronus_pb2.CronusObject`
             A Cronus object containing several histogram datasets.
 
         Returns
@@ -611,13 +617,12 @@ class ProcessHist:
 
         # check the type of container that was provided;
         # if invalid, provide no histograms
-        if not isinstance(
-            histograms, google.protobuf.pyext._message.RepeatedCompositeContainer
-        ):
+        if not isinstance(histograms, OBJECT_CONTAINERS):
             logging.error("Invalid Histogram Container Type: '%s'.", type(histograms))
             logging.info(
                 "The container holding histogram data was expected to be a "
-                "`google.protobuf.pyext._message.repeatedCompositeContainer. "
+                "`google.protobuf.pyext._message.repeatedCompositeContainer` "
+                "or a list. "
                 "Therefore, there is no histogram data available to plot."
             )
             histograms = []
@@ -819,6 +824,7 @@ class ProcessTDigest:
     Parameters
     --------------------
     `tdigests`: `google.protobuf.pyext._message.RepeatedCompositeContainer`
+        or `list` of `cronus_pb2.CronusObject`
         A protobuf container object containing TDigests to be analyzed.
     """
 
@@ -1048,6 +1054,7 @@ class ProcessTDigest:
         Parameters
         --------------------
         `tdigests`: `google.protobuf.pyext._message.RepeatedCompositeContainer`
+            or `list` of `cronus_pb2.CronusObject`
             A protobuf container object containing TDigests to be analyzed.
 
         Returns
@@ -1060,13 +1067,12 @@ class ProcessTDigest:
         valid_tdigests = []
 
         # verify the `tdigests` parameter is not an invalid type or empty
-        if not isinstance(
-            tdigests, google.protobuf.pyext._message.RepeatedCompositeContainer
-        ):
+        if not isinstance(tdigests, OBJECT_CONTAINERS):
             logging.error("Invalid TDigest Container Type: '%s'.", type(tdigests))
             logging.info(
                 "The container holding TDigest data was expected to be a "
-                "`google.protobuf.pyext._message.repeatedCompositeContainer. "
+                "`google.protobuf.pyext._message.repeatedCompositeContainer` "
+                "or a list. "
                 "Therefore, there is no TDigest data available to plot."
             )
             tdigests = []
@@ -1947,8 +1953,9 @@ class PlotlyTool:
             histograms = None
             tdigests = None
         else:
-            histograms = store.list_histograms(uuid)
-            tdigests = store.list_tdigests(uuid)
+            # an up to date dataset aggregate replaces the objects of the jobs
+            histograms = store.list_histograms(uuid, aggregated=True)
+            tdigests = store.list_tdigests(uuid, aggregated=True)
 
         # return the histogram and TDigest datasets
         output = histograms, tdigests
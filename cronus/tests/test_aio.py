@@ -0,0 +1,174 @@
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the asyncio store facade
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+import uuid
+
+import numpy as np
+import pyarrow as pa
+
+from cronus.core.cronus import BaseObjectStore
+from cronus.core.aio import AsyncObjectStore
+from artemis_format.pymodels.cronus_pb2 import FileObjectInfo, MenuObjectInfo
+from artemis_format.pymodels.menu_pb2 import Menu as Menu_pb
+
+
+class AsyncStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        print("================================================")
+        print("Beginning new TestCase %s" % self._testMethodName)
+        print("================================================")
+
+    def tearDown(self):
+        pass
+
+    def test_buffers(self):
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+        contents = [os.urandom(1000) for _ in range(50)]
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            store = BaseObjectStore(dirpath + "/test", "test")
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key")
+            ids_ = [
+                store.register_content(
+                    None,
+                    fileinfo,
+                    dataset_id=dataset.uuid,
+                    job_id=0,
+                    partition_key="key",
+                ).uuid
+                for _ in contents
+            ]
+
+            async def run():
+                async with AsyncObjectStore(store, concurrency=4) as astore:
+                    await astore.put_many(zip(ids_, contents))
+                    ordered = [buf async for _, buf in astore.get_many(ids_)]
+                    completed = dict(
+                        [x async for x in astore.get_many(ids_, ordered=False)]
+                    )
+                    return ordered, completed
+
+            ordered, completed = asyncio.run(run())
+            self.assertEqual(ordered, contents)
+            self.assertEqual([completed[id_] for id_ in ids_], contents)
+            self.assertEqual(store.get(ids_[7]), contents[7])
+
+    def test_encoded(self):
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+        batch = pa.RecordBatch.from_arrays([pa.array(np.arange(1000))], ["f0"])
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_file(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        buf = sink.getvalue()
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            store = BaseObjectStore(dirpath + "/test", "test", codecs={"file": "zstd"})
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key")
+            ids_ = [
+                store.register_content(
+                    None,
+                    fileinfo,
+                    dataset_id=dataset.uuid,
+                    job_id=0,
+                    partition_key="key",
+                ).uuid
+                for _ in range(4)
+            ]
+            encoded = []
+            encode = store._encode
+
+            def _encode(obj, buf):
+                data = encode(obj, buf)
+                encoded.append(data)
+                return data
+
+            store._encode = _encode
+
+            async def run():
+                async with AsyncObjectStore(store, concurrency=4) as astore:
+                    await astore.put_many((id_, buf) for id_ in ids_)
+
+            asyncio.run(run())
+            self.assertEqual(len(encoded), 4)
+            self.assertTrue(all(data.closed for data in encoded))
+            self.assertTrue(store.open(ids_[2]).get_batch(0).equals(batch))
+
+    def test_dedup(self):
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+        contents = [os.urandom(1000) for _ in range(3)] * 4
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            store = BaseObjectStore(dirpath + "/test", "test", dedup=True)
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key")
+            ids_ = [
+                store.register_content(
+                    None,
+                    fileinfo,
+                    dataset_id=dataset.uuid,
+                    job_id=0,
+                    partition_key="key",
+                ).uuid
+                for _ in contents
+            ]
+
+            async def run():
+                async with AsyncObjectStore(store, concurrency=4) as astore:
+                    await astore.put_many(zip(ids_, contents))
+                    return [buf async for _, buf in astore.get_many(ids_)]
+
+            self.assertEqual(asyncio.run(run()), contents)
+            self.assertEqual(sorted(store.blob_refs.values()), [4, 4, 4])
+
+    def test_messages(self):
+        menuinfo = MenuObjectInfo()
+        menus = []
+        for _ in range(20):
+            menu = Menu_pb()
+            menu.uuid = str(uuid.uuid4())
+            menu.name = f"{menu.uuid}.menu.dat"
+            menus.append(menu)
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            store = BaseObjectStore(dirpath + "/test", "test")
+            ids_ = [store.register_content(m, menuinfo).uuid for m in menus]
+
+            async def run():
+                async with AsyncObjectStore(store, concurrency=4) as astore:
+                    await astore.put_many(zip(ids_, menus))
+                    amenu = await astore.get(ids_[0], Menu_pb())
+                    self.assertEqual(amenu.uuid, menus[0].uuid)
+                    return [
+                        m async for _, m in astore.get_many(ids_, Menu_pb, workers=2)
+                    ]
+
+            self.assertEqual(
+                [m.uuid for m in asyncio.run(run())], [m.uuid for m in menus]
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
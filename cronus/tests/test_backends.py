@@ -0,0 +1,170 @@
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the kv store backends
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+import uuid
+
+import numpy as np
+import pyarrow as pa
+
+from cronus.core.cronus import BaseObjectStore
+from cronus.core.backends import open_backend, list_backends, SQLiteStore, _freeze
+from artemis_format.pymodels.cronus_pb2 import FileObjectInfo, MenuObjectInfo
+from artemis_format.pymodels.menu_pb2 import Menu as Menu_pb
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+
+class BackendsTestCase(unittest.TestCase):
+    def setUp(self):
+        print("================================================")
+        print("Beginning new TestCase %s" % self._testMethodName)
+        print("================================================")
+
+    def tearDown(self):
+        pass
+
+    def _roundtrip(self, root, storetype, store_options=None):
+        data = [pa.array(np.arange(100)), pa.array(np.random.rand(100))]
+        batch = pa.RecordBatch.from_arrays(data, ["f0", "f1"])
+        sink = pa.BufferOutputStream()
+        writer = pa.RecordBatchFileWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        writer.close()
+        buf = sink.getvalue()
+
+        menu = Menu_pb()
+        menu.uuid = str(uuid.uuid4())
+        menu.name = f"{menu.uuid}.menu.dat"
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+
+        store = BaseObjectStore(
+            root, "test", storetype=storetype, store_options=store_options
+        )
+        menu_id = store.register_content(menu, MenuObjectInfo()).uuid
+        store.put(menu_id, menu)
+        dataset = store.register_dataset(menu_id)
+        store.new_partition(dataset.uuid, "key")
+        file_id = store.register_content(
+            buf, fileinfo, dataset_id=dataset.uuid, job_id=0, partition_key="key"
+        ).uuid
+        store.put(file_id, buf)
+        self.assertTrue(store.open(file_id).get_batch(0).equals(batch))
+        store.save_store()
+
+        newstore = BaseObjectStore(
+            root,
+            store.store_name,
+            store_uuid=store.store_uuid,
+            storetype=storetype,
+            store_options=store_options,
+        )
+        amenu = Menu_pb()
+        newstore.get(menu_id, amenu)
+        self.assertEqual(amenu.uuid, menu.uuid)
+        self.assertEqual(newstore.get(file_id), buf.to_pybytes())
+        self.assertTrue(newstore.open(file_id).get_batch(0).equals(batch))
+        return newstore
+
+    def test_registry(self):
+        self.assertEqual(list_backends(), ["hfs", "memory", "s3", "sqlite"])
+        with self.assertRaises(ValueError):
+            open_backend("unknown", "root")
+
+    def test_memory(self):
+        store = self._roundtrip("test_memory", "memory")
+        self.assertTrue(store.store_name in store._dstore)
+
+    def test_sqlite(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            store = self._roundtrip(dirpath, "sqlite")
+            kv = store._dstore
+            self.assertIsInstance(kv, SQLiteStore)
+            keys = kv.keys()
+            for obj in store.list(suffix=".dat"):
+                self.assertIn(obj.name, keys)
+            self.assertEqual(
+                list(kv.keys(store.store_name)),
+                [store.store_name, f"{store.store_name}.index"],
+            )
+            kv.close()
+
+    def test_sqlite_files(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            path = os.path.join(dirpath, "data.bin")
+            data = os.urandom(3 * (1 << 20) + 17)
+            with open(path, "wb") as f:
+                f.write(data)
+            with SQLiteStore(os.path.join(dirpath, "test.sqlite")) as kv:
+                with open(path, "rb") as f:
+                    f.seek(17)
+                    kv.put_file("file", f)
+                self.assertEqual(kv.get("file"), data[17:])
+                kv.put_file("file", path)
+                self.assertEqual(kv.get("file"), data)
+                self.assertEqual(kv.get_range("file", 5, 10), data[5:15])
+                conn = kv._conn
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+
+            # Databases created without rowid read the file into memory
+            legacy = os.path.join(dirpath, "legacy.sqlite")
+            with sqlite3.connect(legacy) as conn:
+                conn.execute(
+                    "CREATE TABLE objects "
+                    "(key TEXT PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID"
+                )
+            conn.close()
+            with SQLiteStore(legacy) as kv:
+                self.assertFalse(kv._blob_io)
+                kv.put_file("file", path)
+                self.assertEqual(kv.get("file"), data)
+
+    def test_close(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            with BaseObjectStore(dirpath, "test", storetype="sqlite") as store:
+                store.save_store()
+                conn = store._dstore._conn
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+
+    def test_client_options(self):
+        options = {"config": {"retries": {"max_attempts": 3}}, "regions": ["a"]}
+        key = _freeze(options)
+        hash(key)
+        self.assertEqual(key, _freeze(dict(reversed(list(options.items())))))
+        self.assertNotEqual(key, _freeze({"config": {}, "regions": ["a"]}))
+
+    @unittest.skipIf(mock_aws is None, "requires boto3 and moto")
+    def test_s3(self):
+        with mock_aws():
+            boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="test")
+            self._roundtrip(
+                "s3://test/cronus", "s3", store_options={"region_name": "us-east-1"}
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test compression of stored objects
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+import uuid
+
+import numpy as np
+import pyarrow as pa
+
+from cronus.core.cronus import BaseObjectStore
+from cronus.core.aio import AsyncObjectStore
+from cronus.core.codecs import make_policy, address_codec, with_codec
+from artemis_format.pymodels.cronus_pb2 import (
+    FileObjectInfo,
+    HistsObjectInfo,
+    MenuObjectInfo,
+)
+from artemis_format.pymodels.menu_pb2 import Menu as Menu_pb
+
+
+class CodecsTestCase(unittest.TestCase):
+    def setUp(self):
+        print("================================================")
+        print("Beginning new TestCase %s" % self._testMethodName)
+        print("================================================")
+
+    def tearDown(self):
+        pass
+
+    def test_policy(self):
+        policy = make_policy({"logs": "lz4", "hists": "zstd", "file": None})
+        self.assertEqual(policy, {"log": "lz4", "hists": "zstd"})
+        with self.assertRaises(ValueError):
+            make_policy({"hists": "gzip2"})
+        with self.assertRaises(ValueError):
+            make_policy({"unknown": "zstd"})
+
+        address = with_codec("file:///data/a.pack#10,20", "zstd")
+        self.assertEqual(address, "file:///data/a.pack?codec=zstd#10,20")
+        self.assertEqual(address_codec(address), "zstd")
+        self.assertEqual(address_codec("file:///data/a.pack#10,20"), None)
+
+    def _menu(self):
+        menu = Menu_pb()
+        menu.uuid = str(uuid.uuid4())
+        menu.name = f"{menu.uuid}.menu.dat"
+        return menu
+
+    def test_messages(self):
+        codecs = {"menu": "zstd", "hists": "lz4"}
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test", codecs=codecs)
+            menu = self._menu()
+            menu_id = store.register_content(menu, MenuObjectInfo()).uuid
+            self.assertEqual(address_codec(store[menu_id].address), "zstd")
+            with open(os.path.join(_path, menu.name), "rb") as f:
+                self.assertEqual(f.read(4), b"\x28\xb5\x2f\xfd")
+
+            dataset = store.register_dataset()
+            hists = dict()
+            for job in range(5):
+                msg = self._menu()
+                id_ = store.register_content(
+                    msg, HistsObjectInfo(), dataset_id=dataset.uuid, job_id=job
+                ).uuid
+                hists[id_] = msg
+            store.save_store()
+
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            amenu = Menu_pb()
+            newstore.get(menu_id, amenu)
+            self.assertEqual(amenu, menu)
+            self.assertEqual(newstore.get(menu_id), menu.SerializeToString())
+            for id_, msg in newstore.get_many(list(hists), Menu_pb, workers=2):
+                self.assertEqual(msg, hists[id_])
+
+    def test_pack(self):
+        store = BaseObjectStore(
+            "test_codecs_pack",
+            "test",
+            storetype="memory",
+            pack=True,
+            codecs={"hists": "zstd"},
+        )
+        dataset = store.register_dataset()
+        msg = self._menu()
+        id_ = store.register_content(
+            msg, HistsObjectInfo(), dataset_id=dataset.uuid, job_id=0
+        ).uuid
+        self.assertEqual(address_codec(store[id_].address), "zstd")
+        amsg = Menu_pb()
+        store.get(id_, amsg)
+        self.assertEqual(amsg, msg)
+        store.repack()
+        self.assertEqual(address_codec(store[id_].address), "zstd")
+        store.get(id_, amsg)
+        self.assertEqual(amsg, msg)
+
+    def test_files(self):
+        data = [pa.array(np.zeros(10000)), pa.array(np.arange(10000))]
+        batch = pa.RecordBatch.from_arrays(data, ["f0", "f1"])
+        sink = pa.BufferOutputStream()
+        writer = pa.RecordBatchFileWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        writer.close()
+        buf = sink.getvalue()
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+        text = b"log line\n" * 10000
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(
+                str(_path), "test", codecs={"file": "zstd", "logs": "lz4"}
+            )
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key")
+            ids_ = [
+                store.register_content(
+                    None,
+                    fileinfo,
+                    dataset_id=dataset.uuid,
+                    job_id=0,
+                    partition_key="key",
+                ).uuid
+                for _ in range(3)
+            ]
+            # Arrow files keep their layout, record batches are compressed
+            self.assertEqual(address_codec(store[ids_[0]].address), None)
+            store.put(ids_[0], buf)
+            # Batches are streamed from a file source
+            src = os.path.join(dirpath, "batch.arrow")
+            with open(src, "wb") as f:
+                f.write(buf)
+            with pa.memory_map(src) as source:
+                store.put(ids_[2], source)
+            with store.open_writer(ids_[1], batch.schema) as writer:
+                writer.write_batch(batch)
+            for id_ in ids_:
+                path = os.path.join(_path, store[id_].name)
+                self.assertLess(os.path.getsize(path), buf.size / 10)
+                self.assertTrue(store.open(id_).get_batch(0).equals(batch))
+
+            log_id = store.register_log(dataset.uuid, 0).uuid
+            self.assertEqual(address_codec(store[log_id].address), "lz4")
+            store.put(log_id, text)
+            self.assertEqual(store.get(log_id).to_pybytes(), text)
+            self.assertEqual(store.open(log_id).read(), text)
+
+            async def run():
+                async with AsyncObjectStore(store) as astore:
+                    await astore.put(log_id, text[:90])
+                    return await astore.get(log_id)
+
+            self.assertEqual(asyncio.run(run()).to_pybytes(), text[:90])
+
+        # Arrow streams of a deduplicated kv store
+        sink = pa.BufferOutputStream()
+        writer = pa.ipc.new_stream(sink, batch.schema)
+        for _ in range(3):
+            writer.write_batch(batch)
+        writer.close()
+        fileinfo.type = 6
+        store = BaseObjectStore(
+            "test_codecs_stream",
+            "test",
+            storetype="memory",
+            dedup=True,
+            codecs={"file": "lz4"},
+        )
+        dataset = store.register_dataset()
+        store.new_partition(dataset.uuid, "key")
+        id_ = store.register_content(
+            None, fileinfo, dataset_id=dataset.uuid, job_id=0, partition_key="key"
+        ).uuid
+        store.put(id_, pa.BufferReader(sink.getvalue()))
+        out = store.get(id_)
+        self.assertLess(len(out), sink.getvalue().size / 2)
+        table = pa.ipc.open_stream(out).read_all()
+        self.assertEqual(table.num_rows, 30000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test concurrent writers of a metastore
+"""
+import multiprocessing
+import tempfile
+import unittest
+import uuid
+
+from cronus.core.cronus import BaseObjectStore
+from cronus.core.lock import StoreConflictError
+from artemis_format.pymodels.cronus_pb2 import HistsObjectInfo
+from artemis_format.pymodels.menu_pb2 import Menu as Menu_pb
+
+
+def _writer(path, name, store_uuid, dataset_id, num_jobs, threshold):
+    store = BaseObjectStore(
+        path,
+        name,
+        store_uuid=store_uuid,
+        concurrent=True,
+        journal_threshold=threshold,
+    )
+    ids_ = []
+    for _ in range(num_jobs):
+        job_id = store.new_job(dataset_id)
+        msg = Menu_pb()
+        msg.uuid = str(uuid.uuid4())
+        ids_.append(
+            store.register_content(
+                msg, HistsObjectInfo(), dataset_id=dataset_id, job_id=job_id
+            ).uuid
+        )
+        store.save_store()
+    return ids_
+
+
+class ConcurrentTestCase(unittest.TestCase):
+    def setUp(self):
+        print("================================================")
+        print("Beginning new TestCase %s" % self._testMethodName)
+        print("================================================")
+
+    def tearDown(self):
+        pass
+
+    def _check_writers(self, threshold):
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test", concurrent=True)
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key1")
+            store.save_store()
+
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(4) as pool:
+                results = pool.starmap(
+                    _writer,
+                    [
+                        (_path, store.store_name, store.store_uuid, dataset.uuid, 5, t)
+                        for t in [threshold] * 4
+                    ],
+                )
+            ids_ = [id_ for result in results for id_ in result]
+            self.assertEqual(len(set(ids_)), 20)
+
+            # A writer behind the head rebases on save
+            store.new_partition(dataset.uuid, "key2")
+            store.save_store()
+            self.assertEqual(len(store[dataset.uuid].dataset.hists), 20)
+
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            ds = newstore[dataset.uuid].dataset
+            self.assertEqual(ds.job_idx, 20)
+            self.assertEqual(list(ds.partitions), ["key1", "key2"])
+            self.assertEqual(sorted(h.uuid for h in ds.hists), sorted(ids_))
+            # Job indices are unique across the writers
+            jobs = [newstore.list_children(dataset.uuid, job_id=j) for j in range(20)]
+            self.assertTrue(all(len(j) == 1 for j in jobs))
+
+    def test_writers(self):
+        self._check_writers(100000)
+
+    def test_writers_compaction(self):
+        self._check_writers(3)
+
+    def test_conflict(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test", concurrent=True, dedup=True)
+            dataset = store.register_dataset()
+            store.save_store()
+            other = BaseObjectStore(
+                str(_path),
+                store.store_name,
+                store_uuid=store.store_uuid,
+                concurrent=True,
+                dedup=True,
+            )
+
+            # Disjoint registrations are rebased
+            menu = Menu_pb()
+            menu.uuid = str(uuid.uuid4())
+            id_ = store.register_content(
+                menu, HistsObjectInfo(), dataset_id=dataset.uuid, job_id=0
+            ).uuid
+            store.save_store()
+            menu.uuid = str(uuid.uuid4())
+            other_id = other.register_content(
+                menu, HistsObjectInfo(), dataset_id=dataset.uuid, job_id=0
+            ).uuid
+            other.save_store()
+            self.assertIn(id_, other)
+            store.save_store()
+            self.assertIn(other_id, store)
+
+            # Both writers link the same object to a different blob
+            store.put(id_, b"store")
+            store.save_store()
+            other.put(id_, b"other")
+            with self.assertRaises(StoreConflictError):
+                other.save_store()
+
+            # Pending changes are compared with the snapshot of a compaction
+            other = BaseObjectStore(
+                str(_path),
+                store.store_name,
+                store_uuid=store.store_uuid,
+                concurrent=True,
+                dedup=True,
+            )
+            other.put(id_, b"other")
+            store.put(other_id, b"store")
+            store.compact_store()
+            other.save_store()
+            self.assertEqual(other.get(other_id), b"store")
+            self.assertEqual(other.get(id_), b"other")
+
+            other.put(other_id, b"other")
+            store.save_store()
+            store.put(other_id, b"compacted")
+            store.compact_store()
+            with self.assertRaises(StoreConflictError):
+                other.save_store()
+
+
+if __name__ == "__main__":
+    unittest.main()
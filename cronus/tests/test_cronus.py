@@ -24,9 +24,12 @@ Test Class for Artemis MetaStore
 import unittest
 import logging
 import tempfile
+import time
 import os, shutil
+import hashlib
 from pathlib import Path
 import pyarrow as pa
+import numpy as np
 
 from cronus.core.cronus import BaseObjectStore, JobBuilder
 from artemis_format.pymodels.cronus_pb2 import (
@@ -40,6 +43,7 @@ from artemis_format.pymodels.cronus_pb2 import (
     MenuObjectInfo,
     ConfigObjectInfo,
     DatasetObjectInfo,
+    TableObjectInfo,
 )
 from artemis_format.pymodels.menu_pb2 import Menu as Menu_pb
 from artemis_format.pymodels.configuration_pb2 import Configuration
@@ -642,6 +646,654 @@ class CronusTestCase(unittest.TestCase):
             print(newconfig)
             print("Simulation Test Done ===========================")
 
+    def test_journal(self):
+        data = [
+            pa.array([1, 2, 3, 4]),
+            pa.array(["foo", "bar", "baz", None]),
+            pa.array([True, None, False, True]),
+        ]
+        batch = pa.RecordBatch.from_arrays(data, ["f0", "f1", "f2"])
+        sink = pa.BufferOutputStream()
+        writer = pa.RecordBatchFileWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        writer.close()
+        buf = sink.getvalue()
+
+        mymenu = Menu_pb()
+        mymenu.uuid = str(uuid.uuid4())
+        mymenu.name = f"{mymenu.uuid}.menu.dat"
+        menuinfo = MenuObjectInfo()
+        menuinfo.created.GetCurrentTime()
+
+        myconfig = Configuration()
+        myconfig.uuid = str(uuid.uuid4())
+        myconfig.name = f"{myconfig.uuid}.config.dat"
+        configinfo = ConfigObjectInfo()
+        configinfo.created.GetCurrentTime()
+
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test", journal=True)
+            menu_uuid = store.register_content(mymenu, menuinfo).uuid
+            config_uuid = store.register_content(myconfig, configinfo).uuid
+            dataset = store.register_dataset(menu_uuid, config_uuid)
+            store.new_partition(dataset.uuid, "key1")
+
+            # First save writes the snapshot
+            store.save_store()
+            journal_path = Path(_path) / f"{store.store_name}.journal"
+            self.assertFalse(journal_path.exists())
+
+            store.new_partition(dataset.uuid, "key2")
+            ids_ = []
+            for _ in range(3):
+                job_id = store.new_job(dataset.uuid)
+                for key in store.list_partitions(dataset.uuid):
+                    ids_.append(
+                        store.register_content(
+                            buf,
+                            fileinfo,
+                            dataset_id=dataset.uuid,
+                            job_id=job_id,
+                            partition_key=key,
+                        ).uuid
+                    )
+                    store.put(ids_[-1], buf)
+
+            # Only the deltas are appended to the journal
+            snapshot = (Path(_path) / store.store_name).read_bytes()
+            store.save_store()
+            self.assertTrue(journal_path.exists())
+            self.assertEqual((Path(_path) / store.store_name).read_bytes(), snapshot)
+
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            self.assertEqual(len(newstore), len(store))
+            self.assertEqual(newstore[dataset.uuid].dataset.job_idx, 3)
+            self.assertEqual(
+                list(newstore.list_partitions(dataset.uuid)), ["key1", "key2"]
+            )
+            for id_ in ids_:
+                reader = pa.ipc.open_file(pa.py_buffer(newstore.get(id_)))
+                self.assertEqual(reader.num_record_batches, 1)
+
+            # A torn record of an interrupted flush is overwritten
+            with open(journal_path, "ab") as f:
+                f.write(b"\x01\x10")
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            newstore.new_partition(dataset.uuid, "key3")
+            newstore.save_store()
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            self.assertEqual(
+                list(newstore.list_partitions(dataset.uuid)), ["key1", "key2", "key3"]
+            )
+
+            # Compaction folds the journal into the snapshot
+            newstore.compact_store()
+            self.assertFalse(journal_path.exists())
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            self.assertEqual(len(newstore), len(store))
+            self.assertEqual(newstore[dataset.uuid].dataset.job_idx, 3)
+
+    def test_lazy(self):
+        data = [
+            pa.array([1, 2, 3, 4]),
+            pa.array(["foo", "bar", "baz", None]),
+            pa.array([True, None, False, True]),
+        ]
+        batch = pa.RecordBatch.from_arrays(data, ["f0", "f1", "f2"])
+        sink = pa.BufferOutputStream()
+        writer = pa.RecordBatchFileWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        writer.close()
+        buf = sink.getvalue()
+
+        mymenu = Menu_pb()
+        mymenu.uuid = str(uuid.uuid4())
+        mymenu.name = f"{mymenu.uuid}.menu.dat"
+        menuinfo = MenuObjectInfo()
+        menuinfo.created.GetCurrentTime()
+
+        myconfig = Configuration()
+        myconfig.uuid = str(uuid.uuid4())
+        myconfig.name = f"{myconfig.uuid}.config.dat"
+        configinfo = ConfigObjectInfo()
+        configinfo.created.GetCurrentTime()
+
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test")
+            menu_uuid = store.register_content(mymenu, menuinfo).uuid
+            config_uuid = store.register_content(myconfig, configinfo).uuid
+            datasets = []
+            ids_ = {}
+            for _ in range(3):
+                dataset = store.register_dataset(menu_uuid, config_uuid)
+                datasets.append(dataset.uuid)
+                store.new_partition(dataset.uuid, "key")
+                job_id = store.new_job(dataset.uuid)
+                ids_[dataset.uuid] = store.register_content(
+                    buf,
+                    fileinfo,
+                    dataset_id=dataset.uuid,
+                    job_id=job_id,
+                    partition_key="key",
+                ).uuid
+                store.put(ids_[dataset.uuid], buf)
+            store.save_store()
+
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid, lazy=True
+            )
+            self.assertEqual(len(newstore), len(store))
+            self.assertEqual(len(newstore._content), 0)
+
+            # Accessing a file only parses its dataset
+            id_ = ids_[datasets[0]]
+            reader = pa.ipc.open_file(pa.py_buffer(newstore.get(id_)))
+            self.assertEqual(reader.num_record_batches, 1)
+            self.assertIn(datasets[0], newstore._content)
+            self.assertNotIn(datasets[1], newstore._content)
+
+            job_id = newstore.new_job(datasets[0])
+            new_id = newstore.register_content(
+                buf,
+                fileinfo,
+                dataset_id=datasets[0],
+                job_id=job_id,
+                partition_key="key",
+            ).uuid
+            newstore.save_store()
+
+            for lazy in (False, True):
+                reloaded = BaseObjectStore(
+                    str(_path),
+                    store.store_name,
+                    store_uuid=store.store_uuid,
+                    lazy=lazy,
+                )
+                self.assertEqual(len(reloaded), len(store) + 1)
+                self.assertIn(new_id, reloaded)
+                for dataset_id in datasets:
+                    self.assertIn(ids_[dataset_id], reloaded)
+                self.assertEqual(reloaded[datasets[0]].dataset.job_idx, 2)
+                self.assertEqual(len(reloaded.list(suffix="dataset")), 3)
+
+    def test_list(self):
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+        buf = pa.py_buffer(b"data")
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test")
+            dataset = store.register_dataset()
+            other = store.register_dataset()
+            for key in ("key1", "key2"):
+                store.new_partition(dataset.uuid, key)
+                store.new_partition(other.uuid, key)
+            ids_ = {}
+            for _ in range(3):
+                job_id = store.new_job(dataset.uuid)
+                store.new_job(other.uuid)
+                for key in ("key1", "key2"):
+                    ids_[(key, job_id)] = store.register_content(
+                        buf,
+                        fileinfo,
+                        dataset_id=dataset.uuid,
+                        job_id=job_id,
+                        partition_key=key,
+                    ).uuid
+                    store.register_content(
+                        buf,
+                        fileinfo,
+                        dataset_id=other.uuid,
+                        job_id=job_id,
+                        partition_key=key,
+                    )
+
+            datasets = store.list(suffix="dataset")
+            self.assertEqual(
+                [d.uuid for d in datasets], sorted([dataset.uuid, other.uuid])
+            )
+            files = store.list(prefix=dataset.uuid + ".job_")
+            self.assertEqual(len(files), 6)
+            names = [f.name for f in store.list(prefix=dataset.uuid + ".job_1")]
+            self.assertEqual(names, sorted(names))
+            self.assertEqual(len(names), 2)
+
+            objs = store.list_children(dataset.uuid, partition_key="key2", job_id=1)
+            self.assertEqual([o.uuid for o in objs], [ids_[("key2", 1)]])
+            objs = store.list_children(dataset.uuid, partition_key="key1")
+            self.assertEqual(
+                sorted(o.uuid for o in objs),
+                sorted(ids_[("key1", job)] for job in range(3)),
+            )
+            self.assertEqual(len(store.list_children(other.uuid, job_id=2)), 2)
+            self.assertEqual(len(store.list_children(other.uuid)), 6)
+
+    def test_register_many(self):
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+        buf = pa.py_buffer(b"data")
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test", journal=True)
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key1")
+            store.new_partition(dataset.uuid, "key2")
+            store.save_store()
+            job_id = store.new_job(dataset.uuid)
+
+            batch = store.register_many(
+                [buf] * 10, fileinfo, dataset.uuid, job_id, ["key1", "key2"] * 5
+            )
+            self.assertEqual(batch.num_rows, 10)
+            self.assertEqual(
+                batch.schema.names, ["name", "uuid", "parent_uuid", "address"]
+            )
+            for id_ in batch.column(1).to_pylist():
+                store.put(id_, buf)
+            self.assertEqual(len(store[dataset.uuid].dataset.files), 10)
+            self.assertEqual(
+                len(store.list_children(dataset.uuid, partition_key="key2")), 5
+            )
+
+            batch = store.register_many(
+                [buf] * 3, fileinfo, dataset.uuid, job_id, "key1"
+            )
+            self.assertEqual(batch.num_rows, 3)
+            with self.assertRaises(ValueError):
+                store.register_many([buf], fileinfo, dataset.uuid, job_id, "key3")
+
+            # Duplicated tables fail before any object is added
+            table = Menu_pb()
+            table.uuid = str(uuid.uuid4())
+            table.name = f"{table.uuid}.table.pb"
+            with self.assertRaises(ValueError):
+                store.register_many(
+                    [table, table], TableObjectInfo(), dataset.uuid, job_id, "key1"
+                )
+            self.assertNotIn(table.uuid, store)
+            self.assertEqual(len(store[dataset.uuid].dataset.tables), 0)
+
+            store.save_store()
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            self.assertEqual(len(newstore[dataset.uuid].dataset.files), 13)
+            for id_ in batch.column(1).to_pylist():
+                self.assertIn(id_, newstore)
+
+    def test_dir_parallel_hash(self):
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = Path(dirpath) / "test"
+            _path.mkdir()
+            contents = {}
+            for i in range(8):
+                path = _path / f"dummy{i}.arrow"
+                contents[path.name] = os.urandom(1000 + i)
+                path.write_bytes(contents[path.name])
+
+            store = BaseObjectStore(
+                str(_path), "test", algorithm="blake2b", hash_workers=4
+            )
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key")
+            objs_ = store.register_content(
+                str(_path),
+                fileinfo,
+                glob="*arrow",
+                dataset_id=dataset.uuid,
+                partition_key="key",
+            )
+            names = [obj_.name.split(".", 3)[-1] for obj_ in objs_]
+            self.assertEqual(names, sorted(contents))
+            for obj_, name in zip(objs_, names):
+                self.assertEqual(obj_.uuid, hashlib.blake2b(contents[name]).hexdigest())
+                self.assertEqual(store.get(obj_.uuid), contents[name])
+
+    def test_hash_cache(self):
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = Path(dirpath) / "test"
+            _path.mkdir()
+            mtime = time.time() - 60
+            for i in range(4):
+                (_path / f"dummy{i}.arrow").write_bytes(os.urandom(1000))
+                os.utime(_path / f"dummy{i}.arrow", (mtime, mtime))
+
+            store = BaseObjectStore(str(_path), "test", hash_cache=True)
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key")
+            objs_ = store.register_content(
+                str(_path),
+                fileinfo,
+                glob="*arrow",
+                dataset_id=dataset.uuid,
+                partition_key="key",
+            )
+            self.assertEqual(store.hash_cache.misses, 4)
+            store.save_store()
+
+            (_path / "dummy0.arrow").write_bytes(os.urandom(1000))
+            os.utime(_path / "dummy0.arrow", (mtime + 1, mtime + 1))
+            newstore = BaseObjectStore(
+                str(_path),
+                store.store_name,
+                store_uuid=store.store_uuid,
+                hash_cache=True,
+            )
+            newobjs_ = newstore.register_content(
+                str(_path),
+                fileinfo,
+                glob="*arrow",
+                dataset_id=dataset.uuid,
+                partition_key="key",
+            )
+            self.assertEqual(newstore.hash_cache.hits, 3)
+            self.assertEqual(newstore.hash_cache.misses, 1)
+            self.assertNotEqual(objs_[0].uuid, newobjs_[0].uuid)
+            for old, new in zip(objs_[1:], newobjs_[1:]):
+                self.assertTrue(new.uuid.startswith(old.uuid))
+
+    def test_put_buffers(self):
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+        data = os.urandom(10000)
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test")
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key")
+            contents = [
+                pa.py_buffer(data),
+                data,
+                memoryview(data),
+                np.frombuffer(data, dtype="u1"),
+                # Strided view, not contiguous
+                np.repeat(np.frombuffer(data, dtype="u1"), 2)[::2],
+                pa.BufferReader(data),
+            ]
+            for content in contents:
+                id_ = store.register_content(
+                    content,
+                    fileinfo,
+                    dataset_id=dataset.uuid,
+                    job_id=0,
+                    partition_key="key",
+                ).uuid
+                store.put(id_, content)
+                self.assertEqual(store.get(id_), data)
+            # Objects are written to temporary files then renamed
+            self.assertFalse([f for f in os.listdir(_path) if f.startswith(".tmp")])
+
+    def test_memory_map(self):
+        data = [pa.array(np.arange(1000)), pa.array(np.random.rand(1000))]
+        batch = pa.RecordBatch.from_arrays(data, ["f0", "f1"])
+        sink = pa.BufferOutputStream()
+        writer = pa.RecordBatchFileWriter(sink, batch.schema)
+        for _ in range(5):
+            writer.write_batch(batch)
+        writer.close()
+        buf = sink.getvalue()
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test", memory_map=True)
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key")
+            id_ = store.register_content(
+                buf, fileinfo, dataset_id=dataset.uuid, job_id=0, partition_key="key"
+            ).uuid
+            store.put(id_, buf)
+
+            allocated = pa.total_allocated_bytes()
+            mapped = store.get(id_)
+            self.assertIsInstance(mapped, pa.Buffer)
+            self.assertTrue(mapped.equals(buf))
+            self.assertEqual(pa.total_allocated_bytes(), allocated)
+
+            reader = store.open(id_)
+            self.assertEqual(reader.num_record_batches, 5)
+            self.assertTrue(reader.get_batch(3).equals(batch))
+
+    def test_open_writer(self):
+        data = [pa.array(np.arange(1000)), pa.array(np.random.rand(1000))]
+        batch = pa.RecordBatch.from_arrays(data, ["f0", "f1"])
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test", journal=True)
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key")
+            ids_ = []
+            for ftype, format in ((5, "file"), (6, "stream")):
+                fileinfo = FileObjectInfo()
+                fileinfo.type = ftype
+                id_ = store.register_content(
+                    None,
+                    fileinfo,
+                    dataset_id=dataset.uuid,
+                    job_id=0,
+                    partition_key="key",
+                ).uuid
+                with store.open_writer(id_, batch.schema, format) as writer:
+                    for _ in range(4):
+                        writer.write_batch(batch)
+                self.assertEqual(store[id_].file.aux.num_columns, 2)
+                self.assertTrue(store.file_schema(id_).equals(batch.schema))
+                ids_.append(id_)
+
+            reader = store.open(ids_[0])
+            self.assertEqual(reader.num_record_batches, 4)
+            self.assertTrue(reader.get_batch(2).equals(batch))
+            self.assertEqual(store.open(ids_[1]).read_all().num_rows, 4000)
+
+            with self.assertRaises(ValueError):
+                store.open_writer(ids_[0], batch.schema, "stream")
+
+            # Partial output is discarded on error, the content is unchanged
+            with self.assertRaises(RuntimeError):
+                with store.open_writer(ids_[0], batch.schema) as writer:
+                    writer.write_batch(batch)
+                    raise RuntimeError
+            self.assertEqual(store.open(ids_[0]).num_record_batches, 4)
+            self.assertEqual(store[ids_[0]].file.aux.num_batches, 4)
+            self.assertFalse([f for f in os.listdir(_path) if f.startswith(".tmp")])
+            with self.assertRaises(ValueError):
+                store._finalize_file(ids_[0], num_pages=1)
+
+            # Finalized metadata is journaled
+            store.save_store()
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            self.assertEqual(newstore[ids_[1]].file.aux.num_columns, 2)
+
+    def test_get_many(self):
+        menuinfo = MenuObjectInfo()
+        menus = dict()
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test")
+            for i in range(50):
+                menu = Menu_pb()
+                menu.uuid = str(uuid.uuid4())
+                menu.name = f"{menu.uuid}.menu.dat"
+                id_ = store.register_content(menu, menuinfo).uuid
+                store.put(id_, menu)
+                menus[id_] = menu
+
+            ids_ = list(menus)
+            results = list(store.get_many(ids_, Menu_pb, workers=4, prefetch=3))
+            self.assertEqual([r[0] for r in results], ids_)
+            for id_, msg in results:
+                self.assertEqual(msg.uuid, menus[id_].uuid)
+
+            results = store.get_many(ids_, Menu_pb, workers=4, ordered=False)
+            self.assertEqual(sorted(r[0] for r in results), sorted(ids_))
+
+            # Buffers and early exit of the iterator
+            results = store.get_many(ids_, workers=4)
+            id_, buf = next(results)
+            self.assertEqual(buf, menus[id_].SerializeToString())
+            results.close()
+
+    def test_dedup(self):
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+        data = os.urandom(10000)
+        other = os.urandom(10000)
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test", dedup=True, journal=True)
+            dataset = store.register_dataset()
+            ids_ = []
+            for key in ("a", "b", "c"):
+                store.new_partition(dataset.uuid, key)
+                for job in range(2):
+                    id_ = store.register_content(
+                        None,
+                        fileinfo,
+                        dataset_id=dataset.uuid,
+                        job_id=job,
+                        partition_key=key,
+                    ).uuid
+                    store.put(id_, pa.py_buffer(data))
+                    ids_.append(id_)
+            self.assertEqual(len(store.blob_refs), 1)
+            self.assertEqual(list(store.blob_refs.values()), [6])
+            blobs = [f for f in os.listdir(_path) if f.endswith(".blob")]
+            self.assertEqual(len(blobs), 1)
+            self.assertEqual(store.get(ids_[3]), data)
+
+            # Rewriting an object moves its reference
+            store.put(ids_[0], other)
+            self.assertEqual(sorted(store.blob_refs.values()), [1, 5])
+            self.assertEqual(store.get(ids_[0]), other)
+
+            # Streamed outputs are deduplicated on close
+            batch = pa.RecordBatch.from_arrays([pa.array(np.arange(10))], ["f0"])
+            for id_ in ids_[4:]:
+                with store.open_writer(id_, batch.schema) as writer:
+                    writer.write_batch(batch)
+            self.assertEqual(sorted(store.blob_refs.values()), [1, 2, 3])
+
+            store.save_store()
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            self.assertEqual(newstore.blob_refs, store.blob_refs)
+            self.assertEqual(newstore.get(ids_[1]), data)
+            self.assertEqual(newstore.collect_garbage(), [])
+
+            # Without dedup an object gets its own copy
+            newstore.put(ids_[1], other)
+            self.assertEqual(newstore.get(ids_[1]), other)
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid, dedup=True
+            )
+            for id_ in ids_[1:4]:
+                newstore.put(id_, other)
+            garbage = newstore.collect_garbage(dry_run=True)
+            self.assertEqual(len(garbage), 1)
+            self.assertEqual(newstore.collect_garbage(), garbage)
+            self.assertEqual(
+                len([f for f in os.listdir(_path) if f.endswith(".blob")]), 2
+            )
+
+            # Blobs of another store are kept, released blobs are persisted
+            otherstore = BaseObjectStore(str(_path), "other", dedup=True)
+            other_dataset = otherstore.register_dataset()
+            otherstore.new_partition(other_dataset.uuid, "a")
+            other_id = otherstore.register_content(
+                None,
+                fileinfo,
+                dataset_id=other_dataset.uuid,
+                job_id=0,
+                partition_key="a",
+            ).uuid
+            otherstore.put(other_id, pa.py_buffer(os.urandom(100)))
+            for id_ in ids_[4:]:
+                newstore.put(id_, other)
+            newstore.save_store()
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid, dedup=True
+            )
+            self.assertEqual(len(newstore.collect_garbage()), 1)
+            self.assertEqual(newstore.collect_garbage(), [])
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid, dedup=True
+            )
+            self.assertEqual(newstore.collect_garbage(dry_run=True), [])
+            self.assertEqual(len(otherstore.get(other_id)), 100)
+            self.assertEqual(
+                len([f for f in os.listdir(_path) if f.endswith(".blob")]), 2
+            )
+            self.assertEqual(newstore.get(ids_[5]), other)
+
+    def test_dedup_shared(self):
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 5
+        data = os.urandom(10000)
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            stores = []
+            for name, journal in (("first", False), ("second", True)):
+                store = BaseObjectStore(_path, name, dedup=True, journal=journal)
+                dataset = store.register_dataset()
+                store.new_partition(dataset.uuid, "a")
+                id_ = store.register_content(
+                    None, fileinfo, dataset_id=dataset.uuid, job_id=0, partition_key="a"
+                ).uuid
+                store.put(id_, pa.py_buffer(data))
+                store.save_store()
+                stores.append((store, id_))
+            blobs = [f for f in os.listdir(_path) if f.endswith(".blob")]
+            self.assertEqual(len(blobs), 1)
+
+            # The blob released by the first store is still used by the second
+            (first, first_id), (second, second_id) = stores
+            first.put(first_id, os.urandom(100))
+            first.save_store()
+            self.assertEqual(first.collect_garbage(), [])
+            self.assertIn(blobs[0], os.listdir(_path))
+            second = BaseObjectStore(
+                _path, second.store_name, store_uuid=second.store_uuid, dedup=True
+            )
+            self.assertEqual(second.get(second_id), data)
+
+            # The last store releasing the blob deletes it
+            second.put(second_id, os.urandom(100))
+            second.save_store()
+            self.assertEqual(second.collect_garbage(), blobs)
+            self.assertNotIn(blobs[0], os.listdir(_path))
+
 
 if __name__ == "__main__":
     unittest.main()
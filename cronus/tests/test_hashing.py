@@ -0,0 +1,113 @@
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test content hashing
+"""
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import pyarrow as pa
+
+from simplekv.memory import DictStore
+
+from cronus.core.hashing import HashCache, new_hash, hash_stream, hash_files
+
+
+class HashingTestCase(unittest.TestCase):
+    def setUp(self):
+        print("================================================")
+        print("Beginning new TestCase %s" % self._testMethodName)
+        print("================================================")
+
+    def tearDown(self):
+        pass
+
+    def test_chunked(self):
+        data = os.urandom(10000)
+        digest = hash_stream(pa.BufferReader(data), "sha1", chunk_size=999)
+        self.assertEqual(digest, hashlib.sha1(data).hexdigest())
+        digest = hash_stream(pa.BufferReader(b""), "sha1")
+        self.assertEqual(digest, hashlib.sha1(b"").hexdigest())
+
+    def test_algorithms(self):
+        self.assertEqual(new_hash("blake2b").name, "blake2b")
+        with self.assertRaises(ValueError):
+            new_hash("not_an_algorithm")
+        try:
+            import xxhash
+        except ImportError:
+            return
+        data = os.urandom(1000)
+        digest = hash_stream(pa.BufferReader(data), "xxh64")
+        self.assertEqual(digest, xxhash.xxh64(data).hexdigest())
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            paths = []
+            for i in range(10):
+                paths.append(Path(dirpath) / f"file{i}")
+                paths[-1].write_bytes(os.urandom(100 + i))
+            expected = [hashlib.sha1(p.read_bytes()).hexdigest() for p in paths]
+            self.assertEqual(hash_files(paths, "sha1"), expected)
+            self.assertEqual(hash_files(paths, "sha1", workers=4), expected)
+            self.assertEqual(
+                hash_files(paths, "sha1", workers=2, processes=True), expected
+            )
+
+    def test_cache(self):
+        kvstore = DictStore()
+        with tempfile.TemporaryDirectory() as dirpath:
+            paths = []
+            mtime = time.time() - 60
+            for i in range(4):
+                paths.append(Path(dirpath) / f"file{i}")
+                paths[-1].write_bytes(os.urandom(100))
+                os.utime(paths[-1], (mtime, mtime))
+            expected = [hashlib.sha1(p.read_bytes()).hexdigest() for p in paths]
+
+            cache = HashCache(kvstore, "test.hashcache")
+            self.assertEqual(cache.hash_files(paths), expected)
+            self.assertEqual(cache.stats()["misses"], 4)
+            cache.save()
+
+            # Reloaded cache only rehashes the modified file
+            cache = HashCache(kvstore, "test.hashcache")
+            paths[0].write_bytes(os.urandom(200))
+            os.utime(paths[0], (mtime + 1, mtime + 1))
+            expected[0] = hashlib.sha1(paths[0].read_bytes()).hexdigest()
+            self.assertEqual(cache.hash_files(paths, workers=2), expected)
+            self.assertEqual(
+                cache.stats(), {"hits": 3, "misses": 1, "bytes_saved": 300}
+            )
+            self.assertEqual(cache.hash_file(paths[0]), expected[0])
+            self.assertEqual(cache.hits, 4)
+
+            # Digests are cached per algorithm
+            cache.hash_file(paths[1], "blake2b")
+            self.assertEqual(cache.misses, 2)
+
+            # Recently modified files are not cached
+            paths[1].write_bytes(os.urandom(100))
+            cache.hash_file(paths[1])
+            cache.hash_file(paths[1])
+            self.assertEqual(cache.misses, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -16,13 +16,25 @@
 
 """
 import numpy as np
+import pyarrow as pa
 import unittest
 
-from cronus.core.book import BaseBook, ArtemisBook, TDigestBook
+from cronus.core.book import BaseBook, ArtemisBook, TDigestBook, merge_all
 from artemis_externals.physt.histogram1d import Histogram1D
 from artemis_externals.physt.histogram_base import HistogramBase
 
 
+def _sums(hist):
+    """
+    Sum and sum of squares of the filled values, the statistics are a dict
+    or a physt Statistics depending on the physt version
+    """
+    stats = hist._stats
+    if isinstance(stats, dict):
+        return stats["sum"], stats["sum2"]
+    return stats.sum, stats.sum2
+
+
 class HBookCase(unittest.TestCase):
     def setUp(self):
         print("================================================")
@@ -145,7 +157,7 @@ class HBookCase(unittest.TestCase):
         b.book("book", "one", bins, timer=True)
         b.fill("book", "one", data)
         self.assertEqual(b["book.one"].frequencies.tolist(), [3, 2])
-        self.assertEqual(b._timers["book.one"], data)
+        self.assertEqual(b._timers["book.one"].values.tolist(), data)
 
     def test_rebook(self):
         np.random.seed(0)
@@ -158,6 +170,138 @@ class HBookCase(unittest.TestCase):
         b.fill("book", "one", data)
         self.assertEqual(len(b["book.one"].frequencies), 9)
 
+    def test_fill_handle(self):
+        np.random.seed(0)
+        data = np.random.normal(0, 10, 3000)
+        b = ArtemisBook()
+        one = b.book("book", "one", range(0, 10), timer=True)
+        two = b.book("book", "two", range(0, 10))
+        self.assertIs(b.book("book", "one", range(0, 10)), one)
+        for chunk in np.array_split(data, 3):
+            one.fill(chunk)
+        two(1)
+        b.fill_many({"book.two": [1, 2], one: 5})
+        self.assertEqual(len(b._timers["book.one"]), 3001)
+        np.testing.assert_array_equal(b._timers["book.one"].values[:3000], data)
+        self.assertEqual(b["book.two"].frequencies.tolist()[1:3], [2, 1])
+
+        # Handles follow the new histograms of a rebook
+        b.rebook()
+        one.fill(data)
+        self.assertEqual(len(b["book.one"].frequencies), 9)
+        self.assertGreater(b["book.one"].total, 0)
+
+    def test_compact(self):
+        np.random.seed(0)
+        data = np.random.normal(5, 10, 1000)
+        data[::100] = np.nan
+        data[1] = 9.0
+        plain = ArtemisBook()
+        compact = ArtemisBook(compact=True)
+        for b in (plain, compact):
+            b.book("book", "one", range(0, 10), timer=True)
+            b.book("book", "two", np.linspace(-20, 20, 41))
+        handle = compact.handle("book.one")
+        for name in ("one", "two"):
+            plain.fill("book", name, data[~np.isnan(data)])
+        compact.fill_many({handle: data, "book.two": data})
+        for name in ("book.one", "book.two"):
+            self.assertEqual(
+                plain[name].frequencies.tolist(), compact[name].frequencies.tolist()
+            )
+            self.assertEqual(plain[name].underflow, compact[name].underflow)
+            self.assertEqual(plain[name].overflow, compact[name].overflow)
+            for x, y in zip(_sums(plain[name]), _sums(compact[name])):
+                self.assertAlmostEqual(x, y)
+        self.assertEqual(len(compact._timers["book.one"]), 1000)
+
+        # Histograms are views of the block, also after the block grows
+        handle.fill([1, 1])
+        compact.book("book", "big", np.linspace(0, 1, 2001))
+        compact.fill("book", "big", [0.5])
+        self.assertGreater(compact._block._data.shape[1], 1024)
+        self.assertEqual(
+            compact["book.one"].frequencies[1], plain["book.one"].frequencies[1] + 2
+        )
+        self.assertEqual(compact["book.big"].frequencies.sum(), 1)
+        msg = compact._to_message()
+        self.assertEqual(
+            list(msg.histograms["book.two"].frequencies),
+            plain["book.two"].frequencies.tolist(),
+        )
+
+        compact.rebook()
+        compact.fill_many({"book.one": [1.5]})
+        self.assertEqual(compact["book.one"].frequencies.sum(), 1)
+        self.assertIn("book.one", compact._block)
+
+    def test_fill_batch(self):
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array([1.0, 2.0, None]), pa.array([3, 3, 4])], ["x", "n"]
+        )
+        for compact in (False, True):
+            b = ArtemisBook(compact=compact)
+            b.book("book", "x", range(1, 4))
+            b.book("book", "n", range(1, 6))
+            b.fill_batch(batch, {"book.x": "x", "book.n": "n"})
+            self.assertEqual(b["book.x"].frequencies.tolist(), [1, 1])
+            self.assertEqual(b["book.n"].frequencies.tolist(), [0, 0, 2, 1])
+
+    def test_merge_all(self):
+        np.random.seed(0)
+        books = []
+        for i in range(10):
+            b = ArtemisBook()
+            b.book("book", "one", range(0, 10))
+            if i % 3:
+                b.book("book", "two", range(0, 5))
+            b.fill("book", "one", np.random.normal(5, 5, 100))
+            if i % 3:
+                b.fill("book", "two", np.random.normal(2, 1, 100))
+            books.append(b)
+        expected = books[0]
+        for b in books[1:]:
+            expected = expected + b
+        for workers in (None, 2):
+            merged = merge_all(books, workers=workers)
+            self.assertIsInstance(merged, ArtemisBook)
+            self.assertEqual(list(merged.keys()), ["book.one", "book.two"])
+            for n, h in expected:
+                self.assertEqual(merged[n].frequencies.tolist(), h.frequencies.tolist())
+                self.assertEqual(merged[n].errors2.tolist(), h.errors2.tolist())
+                self.assertEqual(merged[n].underflow, h.underflow)
+                self.assertEqual(merged[n].overflow, h.overflow)
+                self.assertEqual(merged[n].total, h.total)
+                for x, y in zip(_sums(merged[n]), _sums(h)):
+                    self.assertAlmostEqual(x, y)
+
+        # Statistics of the physt of artemis_externals are dicts
+        for b in books:
+            for n, h in b:
+                h._stats = dict(zip(("sum", "sum2"), _sums(h)))
+        merged = merge_all(books)
+        for n, h in expected:
+            for x, y in zip(_sums(merged[n]), _sums(h)):
+                self.assertAlmostEqual(x, y)
+
+        other = ArtemisBook()
+        other.book("book", "one", range(0, 20))
+        with self.assertRaises(ValueError):
+            merge_all(books + [other])
+        with self.assertRaises(TypeError):
+            merge_all(books + [TDigestBook()])
+
+    def test_merge_all_tdigest(self):
+        books = []
+        for i in range(5):
+            b = TDigestBook()
+            b.book("book", "one")
+            b["book.one"].batch_update(np.arange(i * 100, (i + 1) * 100))
+            books.append(b)
+        merged = merge_all(books)
+        self.assertEqual(merged["book.one"].n, 500)
+        self.assertAlmostEqual(merged["book.one"].percentile(50), 250, delta=10)
+
     def test_fill(self):
         data = [1, 1, 1, 2, 2]
         bins = range(1, 4)
@@ -0,0 +1,93 @@
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the merge of concurrent job deltas
+"""
+import tempfile
+import threading
+import unittest
+import uuid
+
+from cronus.core.cronus import BaseObjectStore
+from cronus.core.merge import DatasetMerger
+from artemis_format.pymodels.cronus_pb2 import DatasetObjectInfo
+
+
+class MergeTestCase(unittest.TestCase):
+    def setUp(self):
+        print("================================================")
+        print("Beginning new TestCase %s" % self._testMethodName)
+        print("================================================")
+
+    def tearDown(self):
+        pass
+
+    def _delta(self, dataset_id, job):
+        delta = DatasetObjectInfo()
+        delta.partitions.extend(["key1", "key2"])
+        for field, suffix in (("jobs", "job"), ("hists", "hists"), ("files", "arrow")):
+            obj = getattr(delta, field).add()
+            obj.uuid = str(uuid.uuid4())
+            obj.name = f"{dataset_id}.job_{job}.part_key1.{obj.uuid}.{suffix}"
+            obj.parent_uuid = dataset_id
+        return delta.SerializeToString()
+
+    def test_merge(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test", journal=True)
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key1")
+            store.new_partition(dataset.uuid, "key2")
+            bufs = [self._delta(dataset.uuid, job) for job in range(40)]
+
+            with DatasetMerger(store, batch_size=16) as merger:
+                threads = [
+                    threading.Thread(
+                        target=lambda b: [merger.submit(dataset.uuid, x) for x in b],
+                        args=(bufs[i::4],),
+                    )
+                    for i in range(4)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                # A retried job is skipped
+                merger.submit(dataset.uuid, bufs[0])
+            self.assertEqual(merger.stats["deltas"], 41)
+            self.assertEqual(merger.stats["added"], 120)
+            self.assertEqual(merger.stats["duplicates"], 3)
+
+            ds = store[dataset.uuid].dataset
+            self.assertEqual(len(ds.jobs), 40)
+            self.assertEqual(len(ds.hists), 40)
+            self.assertEqual(len(ds.files), 40)
+            self.assertEqual(len(store.list_children(dataset.uuid, job_id=7)), 3)
+            for obj in ds.files:
+                self.assertEqual(store[obj.uuid].name, obj.name)
+
+            store.save_store()
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            self.assertEqual(len(newstore[dataset.uuid].dataset.files), 40)
+            self.assertEqual(
+                len(newstore.list_children(dataset.uuid, partition_key="key1")), 120
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
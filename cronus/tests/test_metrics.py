@@ -0,0 +1,112 @@
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the metrics of the store operations
+"""
+import os
+import tempfile
+import unittest
+import uuid
+
+from cronus.core.cronus import BaseObjectStore
+from cronus.core.metrics import StoreMetrics
+from artemis_format.pymodels.cronus_pb2 import FileObjectInfo, MenuObjectInfo
+from artemis_format.pymodels.menu_pb2 import Menu as Menu_pb
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        print("================================================")
+        print("Beginning new TestCase %s" % self._testMethodName)
+        print("================================================")
+
+    def tearDown(self):
+        pass
+
+    def test_metrics(self):
+        menu = Menu_pb()
+        menu.uuid = str(uuid.uuid4())
+        menu.name = f"{menu.uuid}.menu.dat"
+        fileinfo = FileObjectInfo()
+        fileinfo.type = 1
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test")
+            self.assertIsNone(store.metrics)
+            metrics = StoreMetrics()
+            store.metrics = metrics
+
+            store.register_content(menu, MenuObjectInfo())
+            dataset = store.register_dataset()
+            store.new_partition(dataset.uuid, "key1")
+            id_ = store.register_content(
+                b"x" * 1000,
+                fileinfo,
+                dataset_id=dataset.uuid,
+                job_id=0,
+                partition_key="key1",
+            ).uuid
+            store.put(id_, b"x" * 1000)
+            self.assertEqual(store.get(id_), b"x" * 1000)
+            amenu = Menu_pb()
+            store.get(menu.uuid, amenu)
+            store.open(id_).read()
+            with self.assertRaises(KeyError):
+                store.get("missing")
+            store.save_store()
+
+            # A registry shared with a reloaded store
+            BaseObjectStore(
+                str(_path),
+                store.store_name,
+                store_uuid=store.store_uuid,
+                metrics=metrics,
+            )
+
+            snapshot = metrics.snapshot()
+            self.assertEqual(snapshot["register"]["count"], 2)
+            self.assertEqual(snapshot["put"]["bytes"], 1000)
+            self.assertEqual(snapshot["get"]["count"], 3)
+            self.assertEqual(snapshot["get"]["errors"], 1)
+            self.assertEqual(snapshot["get"]["bytes"], 1000 + menu.ByteSize())
+            self.assertEqual(snapshot["open"]["count"], 1)
+            self.assertEqual(snapshot["save"]["count"], 1)
+            self.assertEqual(snapshot["load"]["count"], 1)
+            latency = snapshot["get"]["latency"]
+            self.assertEqual(
+                sum(latency["frequencies"])
+                + latency["underflow"]
+                + latency["overflow"],
+                3,
+            )
+            self.assertIn("latency.get", metrics.histograms)
+
+            path = os.path.join(dirpath, "cronus.prom")
+            metrics.write_prometheus(path, labels={"store": "test"})
+            with open(path) as f:
+                text = f.read()
+            self.assertIn('cronus_operations_total{op="put",store="test"} 1', text)
+            self.assertIn(
+                'cronus_operation_seconds_bucket{op="get",store="test",le="+Inf"} 3',
+                text,
+            )
+            self.assertIn(
+                'cronus_operation_seconds_count{op="get",store="test"} 3', text
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
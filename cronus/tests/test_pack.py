@@ -0,0 +1,154 @@
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test pack segments of small objects
+"""
+import os
+import tempfile
+import unittest
+import uuid
+
+from cronus.core.cronus import BaseObjectStore
+from artemis_format.pymodels.cronus_pb2 import HistsObjectInfo, JobObjectInfo
+from artemis_format.pymodels.menu_pb2 import Menu as Menu_pb
+
+
+class PackTestCase(unittest.TestCase):
+    def setUp(self):
+        print("================================================")
+        print("Beginning new TestCase %s" % self._testMethodName)
+        print("================================================")
+
+    def tearDown(self):
+        pass
+
+    def _fill(self, store, num_jobs):
+        """
+        Register a histogram collection and a job summary per job
+        """
+        dataset = store.register_dataset()
+        msgs = dict()
+        for job in range(num_jobs):
+            for info in (HistsObjectInfo(), JobObjectInfo()):
+                msg = Menu_pb()
+                msg.uuid = str(uuid.uuid4())
+                msg.name = f"job {job}"
+                id_ = store.register_content(
+                    msg, info, dataset_id=dataset.uuid, job_id=job
+                ).uuid
+                msgs[id_] = msg
+        return dataset.uuid, msgs
+
+    def _check(self, store, msgs):
+        for id_, msg in msgs.items():
+            amsg = Menu_pb()
+            store.get(id_, amsg)
+            self.assertEqual(amsg, msg)
+            self.assertEqual(store.get(id_), msg.SerializeToString())
+        for id_, amsg in store.get_many(list(msgs), Menu_pb, workers=4):
+            self.assertEqual(amsg, msgs[id_])
+
+    def _segments(self, path):
+        return len([f for f in os.listdir(path) if f.endswith(".pack")])
+
+    def test_pack(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test", pack=True, journal=True)
+            dataset_id, msgs = self._fill(store, 100)
+            files = os.listdir(_path)
+            self.assertEqual(len([f for f in files if f.endswith(".pack")]), 1)
+            self.assertFalse(any(f.endswith(".pb") for f in files))
+            self._check(store, msgs)
+
+            # Rewriting a packed message appends it again
+            id_ = next(iter(msgs))
+            msgs[id_].name = "updated"
+            store.put(id_, msgs[id_])
+            self._check(store, msgs)
+
+            store.save_store()
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            self._check(newstore, msgs)
+
+    def test_repack(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(
+                str(_path), "test", pack=True, pack_segment_size=100
+            )
+            dataset_id, msgs = self._fill(store, 20)
+            num_segments = len(os.listdir(_path))
+            self.assertGreater(num_segments, 1)
+
+            stats = store.repack(segment_size=1024 * 1024)
+            self.assertEqual(stats["objects"], 40)
+            self.assertEqual(stats["removed"], num_segments)
+            self.assertEqual(self._segments(_path), 1)
+            self._check(store, msgs)
+
+            # The store is saved before the old segments are deleted
+            newstore = BaseObjectStore(
+                str(_path), store.store_name, store_uuid=store.store_uuid
+            )
+            self._check(newstore, msgs)
+
+        # Files of an unpacked store are moved to segments
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test")
+            dataset_id, msgs = self._fill(store, 10)
+            self.assertEqual(len(os.listdir(_path)), 20)
+            store.repack([dataset_id])
+            self.assertEqual(self._segments(_path), 1)
+            self.assertFalse(any(f.endswith(".hist.pb") for f in os.listdir(_path)))
+            self._check(store, msgs)
+
+            store = BaseObjectStore(str(_path), "test", read_only=True)
+            with self.assertRaises(ValueError):
+                store.repack()
+
+    def test_kv_backend(self):
+        store = BaseObjectStore("test_pack", "test", storetype="memory", pack=True)
+        dataset_id, msgs = self._fill(store, 10)
+        self._check(store, msgs)
+        store.save_store()
+        newstore = BaseObjectStore(
+            "test_pack",
+            store.store_name,
+            store_uuid=store.store_uuid,
+            storetype="memory",
+        )
+        self._check(newstore, msgs)
+        newstore.repack()
+        self._check(newstore, msgs)
+
+    def test_sqlite_mmap(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            store = BaseObjectStore(dirpath, "test", storetype="sqlite", pack=True)
+            dataset_id, msgs = self._fill(store, 10)
+            store.save_store()
+            self._check(store, msgs)
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            store = BaseObjectStore(dirpath, "test", pack=True, memory_map=True)
+            dataset_id, msgs = self._fill(store, 10)
+            self._check(store, msgs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test reductions of the histograms and tdigests of a dataset
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from cronus.core.book import ArtemisBook, TDigestBook, merge_buffers
+from cronus.core.cronus import BaseObjectStore
+from artemis_format.pymodels.cronus_pb2 import HistsObjectInfo, TDigestObjectInfo
+from artemis_format.pymodels.histogram_pb2 import HistogramCollection
+
+try:
+    from cronus.dq.plotlytool import PlotlyTool, ProcessHist, ProcessTDigest
+except ImportError:
+    PlotlyTool = None
+
+
+class ReduceTestCase(unittest.TestCase):
+    def setUp(self):
+        print("================================================")
+        print("Beginning new TestCase %s" % self._testMethodName)
+        print("================================================")
+
+    def tearDown(self):
+        pass
+
+    def _fill(self, store, num_jobs, dataset=None, first=0):
+        """
+        Register a histogram collection and tdigests per job
+        """
+        np.random.seed(first)
+        if dataset is None:
+            dataset = store.register_dataset()
+        books = []
+        for job in range(first, first + num_jobs):
+            hbook = ArtemisBook()
+            hbook.book("alg", "x", range(0, 10))
+            hbook.fill("alg", "x", np.random.normal(5, 3, 100))
+            books.append(hbook)
+            store.register_content(
+                hbook._to_message(),
+                HistsObjectInfo(),
+                dataset_id=dataset.uuid,
+                job_id=job,
+            )
+            tbook = TDigestBook()
+            tbook.book("alg", "x")
+            tbook["alg.x"].batch_update(np.random.normal(5, 3, 100))
+            store.register_content(
+                tbook._to_message(),
+                TDigestObjectInfo(),
+                dataset_id=dataset.uuid,
+                job_id=job,
+            )
+        return dataset.uuid, books
+
+    def _check(self, hbook, books):
+        expected = books[0]
+        for book in books[1:]:
+            expected = expected + book
+        self.assertEqual(
+            hbook["alg.x"].frequencies.tolist(),
+            expected["alg.x"].frequencies.tolist(),
+        )
+
+    def test_reduce(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            store = BaseObjectStore(dirpath + "/test", "test")
+            dataset_id, books = self._fill(store, 12)
+            for workers in (1, 3):
+                hbook, meta = store.reduce_histograms(dataset_id, workers=workers)
+                self.assertIsNone(meta)
+                self._check(hbook, books)
+            tbook, _ = store.reduce_tdigests(dataset_id, workers=1)
+            self.assertEqual(tbook["alg.x"].n, 1200)
+
+    def test_register(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            store = BaseObjectStore(dirpath + "/test", "test", journal=True)
+            dataset_id, books = self._fill(store, 4)
+            job_ids = [obj.uuid for obj in store.list_histograms(dataset_id)]
+            hbook, meta = store.reduce_histograms(dataset_id, register=True)
+            self.assertEqual(len(store[dataset_id].dataset.hists), 5)
+            self.assertEqual(len(store.list_histograms(dataset_id)), 4)
+            self.assertEqual(store.sources(meta.uuid), job_ids)
+            with self.assertRaises(KeyError):
+                store.sources(job_ids[0])
+
+            # The registered collection is not merged again
+            store.save_store()
+            newstore = BaseObjectStore(
+                dirpath + "/test", store.store_name, store_uuid=store.store_uuid
+            )
+            again, _ = newstore.reduce_histograms(dataset_id)
+            self._check(again, books)
+            msg = HistogramCollection()
+            newstore.get(meta.uuid, msg)
+            self.assertEqual(
+                list(msg.histograms["alg.x"].frequencies),
+                hbook["alg.x"].frequencies.tolist(),
+            )
+
+    def test_aggregate(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            store = BaseObjectStore(dirpath + "/test", "test", journal=True)
+            dataset_id, first = self._fill(store, 4)
+            self._check(store.aggregate(dataset_id, workers=1), first)
+            self.assertEqual(len(store[dataset_id].dataset.hists), 5)
+
+            # The default listing only holds the job collections
+            listed = store.list_histograms(dataset_id)
+            self.assertEqual(len(listed), 4)
+            buffers = [store.get(obj.uuid) for obj in listed]
+            self._check(merge_buffers(ArtemisBook, buffers), first)
+
+            # New jobs are folded into the aggregate, which is replaced
+            dataset = store[dataset_id]
+            _, second = self._fill(store, 2, dataset, first=4)
+            self._check(store.aggregate(dataset_id, workers=1), first + second)
+            hists = store[dataset_id].dataset.hists
+            self.assertEqual(len(hists), 7)
+            self.assertEqual(len(store.sources(hists[-1].uuid)), 6)
+            self.assertEqual(len(store.list_histograms(dataset_id)), 6)
+            self.assertEqual(
+                store.list_histograms(dataset_id, aggregated=True)[0].uuid,
+                hists[-1].uuid,
+            )
+            tbook = store.aggregate(dataset_id, "tdigests", workers=1)
+            self.assertEqual(tbook["alg.x"].n, 600)
+
+            store.save_store()
+            newstore = BaseObjectStore(
+                dirpath + "/test", store.store_name, store_uuid=store.store_uuid
+            )
+            self._check(newstore.aggregate(dataset_id), first + second)
+
+            # Removing a job invalidates the aggregates
+            removed = newstore.remove_job(dataset_id, 0)
+            self.assertEqual(len(removed), 2)
+            self.assertEqual(len(newstore.list_histograms(dataset_id)), 5)
+            self.assertEqual(len(newstore.list_tdigests(dataset_id)), 5)
+            tbook = newstore.aggregate(dataset_id, "tdigests", workers=1)
+            self.assertEqual(tbook["alg.x"].n, 500)
+            newstore.save_store()
+            newstore = BaseObjectStore(
+                dirpath + "/test", store.store_name, store_uuid=store.store_uuid
+            )
+            self.assertEqual(newstore.list_children(dataset_id, job_id=0), [])
+            self._check(newstore.aggregate(dataset_id), first[1:] + second)
+
+            # A stale aggregate is not listed, the job collections are
+            _, third = self._fill(newstore, 1, newstore[dataset_id], first=6)
+            hists = newstore.list_histograms(dataset_id, aggregated=True)
+            self.assertEqual(len(hists), 6)
+            self.assertFalse(any(".reduced." in h.name for h in hists))
+            newstore.save_store()
+
+            # A read only store merges the aggregate without caching it
+            readonly = BaseObjectStore(
+                dirpath + "/test",
+                store.store_name,
+                store_uuid=store.store_uuid,
+                read_only=True,
+            )
+            self._check(readonly.aggregate(dataset_id), first[1:] + second + third)
+            self.assertEqual(len(readonly[dataset_id].dataset.hists), 7)
+
+            # A replaced aggregate is deleted once the store is saved
+            (cached,) = [
+                h for h in newstore[dataset_id].dataset.hists if ".reduced." in h.name
+            ]
+            path = os.path.join(dirpath, "test", cached.name)
+            self._check(newstore.aggregate(dataset_id), first[1:] + second + third)
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(len(readonly.sources(cached.uuid)), 5)
+            newstore.save_store()
+            self.assertFalse(os.path.exists(path))
+            self.assertFalse(os.path.exists(path + ".sources"))
+            self.assertEqual(
+                len(newstore.list_histograms(dataset_id, aggregated=True)), 1
+            )
+
+    @unittest.skipIf(PlotlyTool is None, "requires plotly and scipy")
+    def test_plotlytool(self):
+        with tempfile.TemporaryDirectory() as dirpath:
+            store = BaseObjectStore(dirpath + "/test", "test")
+            dataset_id, _ = self._fill(store, 3)
+            store, uuid = PlotlyTool._validate(store, dataset_id)
+
+            hists, tdigests = PlotlyTool._list(store, uuid)
+            self.assertEqual(len(ProcessHist._validate(hists)), 3)
+            self.assertEqual(len(ProcessTDigest._validate(tdigests)), 3)
+
+            # An aggregated dataset plots its aggregates
+            store.aggregate(dataset_id, workers=1)
+            store.aggregate(dataset_id, "tdigests", workers=1)
+            hists, tdigests = PlotlyTool._list(store, uuid)
+            (hist,) = ProcessHist._validate(hists)
+            (tdigest,) = ProcessTDigest._validate(tdigests)
+            self.assertIn(".reduced.", hist.name)
+            self.assertIn(".reduced.", tdigest.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
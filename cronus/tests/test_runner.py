@@ -0,0 +1,107 @@
+# Copyright © Her Majesty the Queen in Right of Canada, as represented
+# by the Minister of Statistics Canada, 2019.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Test the multiprocess job runner
+"""
+import tempfile
+import unittest
+import uuid
+
+import pyarrow as pa
+
+from cronus.core.cronus import BaseObjectStore, JobBuilder
+from cronus.core.runner import JobRunner
+from artemis_format.pymodels.cronus_pb2 import MenuObjectInfo, ConfigObjectInfo
+from artemis_format.pymodels.menu_pb2 import Menu as Menu_pb
+from artemis_format.pymodels.configuration_pb2 import Configuration
+
+
+class ReadOnlyBuilder(JobBuilder):
+    """
+    Job checking the options of its store passed by the runner
+    """
+
+    def execute(self):
+        if self.store._read_only is not True:
+            raise ValueError("Job store is not read only")
+        return super().execute()
+
+
+class RunnerTestCase(unittest.TestCase):
+    def setUp(self):
+        print("================================================")
+        print("Beginning new TestCase %s" % self._testMethodName)
+        print("================================================")
+
+    def tearDown(self):
+        pass
+
+    def test_runner(self):
+        mymenu = Menu_pb()
+        mymenu.uuid = str(uuid.uuid4())
+        mymenu.name = f"{mymenu.uuid}.menu.dat"
+        myconfig = Configuration()
+        myconfig.uuid = str(uuid.uuid4())
+        myconfig.name = f"{myconfig.uuid}.config.dat"
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            _path = dirpath + "/test"
+            store = BaseObjectStore(str(_path), "test")
+            menu_id = store.register_content(mymenu, MenuObjectInfo()).uuid
+            config_id = store.register_content(myconfig, ConfigObjectInfo()).uuid
+            dataset = store.register_dataset(menu_id, config_id)
+            store.new_partition(dataset.uuid, "key1")
+            store.new_partition(dataset.uuid, "key2")
+
+            runner = JobRunner(
+                store,
+                _path,
+                dataset.uuid,
+                menu_id,
+                config_id,
+                workers=2,
+                builder=ReadOnlyBuilder,
+            )
+            metrics = runner.run(3)
+            self.assertEqual(sorted(m.job_id for m in metrics), [0, 1, 2])
+            self.assertTrue(all(m.num_objects == 2 for m in metrics))
+            self.assertTrue(all(m.bytes_written > 0 for m in metrics))
+            summary = runner.summary(metrics, 1.0)
+            self.assertEqual(summary["jobs"], 3)
+
+            self.assertEqual(len(store[dataset.uuid].dataset.files), 6)
+            for job_id in range(3):
+                objs = store.list_children(dataset.uuid, job_id=job_id)
+                self.assertEqual(len(objs), 2)
+                for obj in objs:
+                    reader = pa.ipc.open_file(pa.py_buffer(store.get(obj.uuid)))
+                    self.assertEqual(reader.num_record_batches, 10)
+            store.save_store()
+
+            # Outside of a runner, a job opens a writable store
+            job = JobBuilder(
+                _path,
+                store.store_name,
+                store.store_uuid,
+                menu_id,
+                config_id,
+                dataset.uuid,
+                3,
+            )
+            self.assertFalse(job.store._read_only)
+
+
+if __name__ == "__main__":
+    unittest.main()